@@ -1,15 +1,24 @@
 # app_callbacks.py
 from dash import Input, Output, State, no_update, ctx, dcc
 from datetime import datetime
+import time
 import pandas as pd
 
 from database import (
     init_database,
     add_operation,
+    add_structure,
     update_operation,
     close_operation,
+    close_structure,
+    get_pernas,
+    rolar,
+    get_cadeia,
     get_transactions,
-    get_encerradas,
+    get_lookup_values,
+    listar_contas,
+    conta_atual,
+    resumo_consolidado,
 )
 from calculations import (
     cards_aberturas,
@@ -17,21 +26,235 @@ from calculations import (
     card_fluxo,
     card_posicao_aberta,
 )
+from historico import posicoes_em, recalcular_checkpoints
+from tarefas import callback_longo
+from cache_relatorios import memorizado
+from graficos import barras
+from escritor import escrever
+from snapshot import ler_encerradas, atualizar as atualizar_snapshot
+from esquema import registros
+from dinheiro import centavos_np, somar, fmt_centavos, premio, fluxo, reais
+from estruturas import pernas_do_modelo
+from series import buscar as buscar_serie
 from validations import (
     validate_ticker,
     validate_date,
     validate_numeric_positive,
+    extrair_info_ticker,
 )
 
 
-def _parse_ddmmyyyy(s: str | None):
-    if not s:
-        return None
-    try:
-        return datetime.strptime(s, "%d/%m/%Y")
-    except Exception:
-        return None
-
+# -------------------------------
+# Analítico: leitura/filtros e visão em grupos (linhas sob demanda)
+# -------------------------------
+PAGINA_GRUPO = 50  # linhas de um grupo por pedido
+
+_ANALITICO_COLS = {
+    "id": "ID_ENC",
+    "id_origem": "ID_ORIGEM",
+    "ticker": "TICKER",
+    "operacao": "OPERACAO",
+    "direcao": "DIRECAO",
+    "strike": "STRIKE",
+    "quantidade": "QTD_ENC",
+    "valor_opcao": "PRECO_ABERT",
+    "valor_encerr": "PRECO_ENC",
+    "valor_operacao": "CF_ABERT",
+    "valor_oper_encerr": "CF_ENC",
+    "g_p": "GP",
+    "data_op": "DATA_OP",
+    "data_encerr": "DATA_ENC",
+    "estrutura": "ESTRUTURA",
+    "rolagem": "ROLAGEM",
+    "motivo": "MOTIVO",
+    "estrutura_bundle": "BUNDLE",
+}
+
+def _analitico_df(start_iso, end_iso, tipo, estrutura, bundle) -> pd.DataFrame:
+    """Encerradas do período com os filtros do Analítico (sem as colunas derivadas)."""
+    df = ler_encerradas(inicio=start_iso, fim=end_iso).rename(columns=_ANALITICO_COLS).copy()
+    if df.empty:
+        return df
+
+    if "BUNDLE" not in df.columns:
+        df["BUNDLE"] = ""
+    df["BUNDLE"] = df["BUNDLE"].fillna("")
+    df["ESTRUTURA"] = df["ESTRUTURA"].fillna("")
+    df["TIPO"] = df["ESTRUTURA"].apply(lambda s: "Estrutura" if str(s).strip() else "Simples")
+
+    # Filtros
+    if start_iso or end_iso:
+        start_dt = datetime.fromisoformat(start_iso) if start_iso else None
+        end_dt = datetime.fromisoformat(end_iso) if end_iso else None
+        mask = pd.Series(True, index=df.index)
+        if start_dt:
+            mask &= df["DATA_ENC"] >= start_dt
+        if end_dt:
+            mask &= df["DATA_ENC"] <= end_dt
+        df = df[mask]
+
+    if (tipo or "") != "":
+        df = df[df["TIPO"] == tipo]
+    if (estrutura or "") != "":
+        df = df[df["ESTRUTURA"] == estrutura]
+    if (bundle or "") != "":
+        df = df[df["BUNDLE"] == bundle]
+    return df
+
+def _analitico_derivados(df: pd.DataFrame) -> pd.DataFrame:
+    """Derivados úteis (datas em datetime64, esquema.py), só nas linhas que vão para a tela."""
+    df = df.copy()
+    df["DIAS_POS"] = (df["DATA_ENC"] - df["DATA_OP"]).dt.days.astype("Int64")
+    cf = pd.to_numeric(df["CF_ABERT"], errors="coerce").abs()
+    gp = pd.to_numeric(df["GP"], errors="coerce")
+    df["RET_PCT"] = (gp / cf).where(cf > 0).astype(object).where(lambda s: s.notna(), None)
+    return df
+
+def _analitico_cabecalhos(df: pd.DataFrame) -> list:
+    """Uma linha por (Estrutura, Bundle) com os totais do grupo (G/P e fluxos somados em centavos)."""
+    agg = pd.DataFrame({
+        "ESTRUTURA": df["ESTRUTURA"].astype(str).values,
+        "BUNDLE": df["BUNDLE"].astype(str).values,
+        "QTD": pd.to_numeric(df["QTD_ENC"], errors="coerce").fillna(0).astype("int64").values,
+        "CF_ABERT": centavos_np(df["CF_ABERT"]),
+        "CF_ENC": centavos_np(df["CF_ENC"]),
+        "GP": centavos_np(df["GP"]),
+    }).groupby(["ESTRUTURA", "BUNDLE"], sort=True).agg(
+        N=("GP", "size"), QTD=("QTD", "sum"), CF_ABERT=("CF_ABERT", "sum"),
+        CF_ENC=("CF_ENC", "sum"), GP=("GP", "sum"),
+    ).reset_index()
+    rows = []
+    for k, (estr, bund, n, qtd, cf_ab, cf_enc, gp) in enumerate(agg.itertuples(index=False, name=None)):
+        rows.append({
+            "id": f"g{k}", "ID_ENC": f"▸ {n}", "ID_ORIGEM": "",
+            "TICKER": "", "OPERACAO": "", "DIRECAO": "",
+            "ESTRUTURA": estr, "BUNDLE": bund,
+            "PERNA": "", "ROLAGEM": "",
+            "QTD_ENC": int(qtd), "PRECO_ABERT": "", "PRECO_ENC": "",
+            "CF_ABERT": reais(int(cf_ab)), "CF_ENC": reais(int(cf_enc)),
+            "GP": reais(int(gp)), "RET_PCT": "", "DATA_OP": "", "DATA_ENC": "",
+            "DIAS_POS": "", "MOTIVO": "",
+            "__GROUP__": 1, "__N__": int(n), "__ABERTO__": 0,
+        })
+    return rows
+
+def _analitico_pagina(start_iso, end_iso, tipo, cabecalho: dict, offset: int) -> list:
+    """Linhas [offset, offset + PAGINA_GRUPO) do grupo do cabeçalho e, se sobrar, a linha 'mais ...'."""
+    df = _analitico_df(start_iso, end_iso, tipo, None, None)
+    if not df.empty:
+        df = df[(df["ESTRUTURA"] == cabecalho["ESTRUTURA"]) & (df["BUNDLE"] == cabecalho["BUNDLE"])]
+    total = int(df.shape[0])
+    pagina = df.iloc[offset:offset + PAGINA_GRUPO]
+    linhas = registros(_analitico_derivados(pagina)) if not pagina.empty else []
+    pai = cabecalho["id"]
+    for rec in linhas:
+        rec.update({"id": f"{pai}:{rec['ID_ENC']}", "__GROUP__": 0, "__PAI__": pai})
+    fim = offset + len(linhas)
+    if fim < total:
+        linhas.append({"id": f"{pai}:+{fim}", "ID_ENC": "", "TICKER": f"mais {total - fim}...",
+                       "__GROUP__": 2, "__PAI__": pai, "__OFFSET__": fim})
+    return linhas
+
+def _rel_sintetico(start_iso, end_iso, tipo, estrutura, bundle, ticker) -> tuple:
+    """Outputs do Sintético: KPIs, figuras G/P por mês e Simples vs Estrutura, tabelas."""
+    df_raw = ler_encerradas(busca=ticker, inicio=start_iso, fim=end_iso)
+    if df_raw is None or df_raw.empty:
+        # figuras vazias
+        return ("0,00", "0", "0,00", "0.0%", "Melhor: - | Pior: -",
+                barras("G/P por Mês"), barras("Simples vs Estrutura"), [], [])
+
+    # Normalização para padrão do UI
+    dfn = df_raw.rename(columns={
+        "id": "ID_ENC",
+        "id_origem": "ID_ORIGEM",
+        "ticker": "TICKER",
+        "operacao": "OPERACAO",
+        "direcao": "DIRECAO",
+        "strike": "STRIKE",
+        "quantidade": "QTD_ENC",
+        "valor_opcao": "PRECO_ABERT",
+        "valor_encerr": "PRECO_ENC",
+        "valor_operacao": "CF_ABERT",
+        "valor_oper_encerr": "CF_ENC",
+        "g_p": "GP",
+        "data_op": "DATA_OP",
+        "data_encerr": "DATA_ENC",
+        "estrutura": "ESTRUTURA",
+        "rolagem": "ROLAGEM",
+        "motivo": "MOTIVO",
+        "estrutura_bundle": "BUNDLE",
+    }).copy()
+
+    # Derivados mínimos
+    if "BUNDLE" not in dfn.columns:
+        dfn["BUNDLE"] = ""
+    dfn["BUNDLE"] = dfn["BUNDLE"].fillna("")
+    dfn["ESTRUTURA"] = dfn["ESTRUTURA"].fillna("")
+    dfn["TIPO"] = dfn["ESTRUTURA"].apply(lambda s: "Estrutura" if str(s).strip() else "Simples")
+
+    # Filtro por período (DATA_ENC)
+    if start_iso or end_iso:
+        start_dt = datetime.fromisoformat(start_iso) if start_iso else None
+        end_dt = datetime.fromisoformat(end_iso) if end_iso else None
+        dcol = dfn["DATA_ENC"]  # datetime64 (esquema.py)
+        mask = pd.Series(True, index=dfn.index)
+        if start_dt:
+            mask &= dcol >= start_dt
+        if end_dt:
+            mask &= dcol <= end_dt
+        dfn = dfn[mask]
+
+    # Filtros adicionais
+    if (tipo or "") != "":
+        dfn = dfn[dfn["TIPO"] == tipo]
+    if (estrutura or "") != "":
+        dfn = dfn[dfn["ESTRUTURA"] == estrutura]
+    if (bundle or "") != "":
+        dfn = dfn[dfn["BUNDLE"] == bundle]
+
+    # KPIs
+    if dfn.empty:
+        return ("0,00", "0", "0,00", "0.0%", "Melhor: - | Pior: -",
+                barras("G/P por Mês"), barras("Simples vs Estrutura"), [], [])
+
+    # somas em centavos int64 (dinheiro.py)
+    dfn["_CENT"] = centavos_np(dfn["GP"])
+    gp_cent = int(dfn["_CENT"].sum())
+    n_enc = int(dfn.shape[0])
+    ticket = round(gp_cent / n_enc) if n_enc else 0
+    hit = (100.0 * (dfn["GP"] > 0).mean()) if n_enc else 0.0
+    top = dfn.nlargest(1, "GP")[["ID_ENC", "GP"]].values.tolist() if n_enc else []
+    bot = dfn.nsmallest(1, "GP")[["ID_ENC", "GP"]].values.tolist() if n_enc else []
+    top_str = f"Melhor: {top[0][0]} ({top[0][1]:.2f})" if top else "Melhor: -"
+    bot_str = f"Pior: {bot[0][0]} ({bot[0][1]:.2f})" if bot else "Pior: -"
+
+    # Gráfico G/P por mês
+    dfn["_MES"] = dfn["DATA_ENC"].dt.strftime("%Y-%m")
+    g_mes = dfn.groupby("_MES", dropna=True)["_CENT"].sum()
+    fig_mes = barras("G/P por Mês", g_mes.index.to_numpy(), g_mes.to_numpy() / 100, "G/P (R$)")
+
+    # Simples vs Estrutura (observed=True: colunas category, esquema.py)
+    g_tipo = dfn.groupby("TIPO", observed=True)["_CENT"].sum()
+    fig_tipo = barras("Simples vs Estrutura", g_tipo.index.to_numpy(), g_tipo.to_numpy() / 100, "G/P (R$)")
+
+    # Tabela por Estrutura/Bundle
+    tbl = dfn.groupby(["ESTRUTURA", "BUNDLE"], dropna=False, observed=True).agg(GP=("_CENT", "sum"), N_ENC=("ID_ENC", "count")).reset_index()
+    tbl["GP"] = tbl["GP"] / 100
+
+    # Top10
+    top10 = dfn.sort_values("GP", ascending=False).head(10)[["ID_ENC", "TICKER", "ESTRUTURA", "GP"]]
+
+    return (
+        fmt_centavos(gp_cent, moeda=False),
+        f"{n_enc}",
+        fmt_centavos(ticket, moeda=False),
+        f"{hit:.1f}%",
+        f"{top_str} | {bot_str}",
+        fig_mes,
+        fig_tipo,
+        tbl.to_dict("records"),
+        top10.to_dict("records")
+    )
 
 def register_callbacks(app):
     # Inicialização defensiva do banco
@@ -44,10 +267,19 @@ def register_callbacks(app):
         Input("periodo-date-range", "start_date"),
         Input("periodo-date-range", "end_date"),
         Input("busca-ticker", "value"),
+        Input("posicao-data-ref", "date"),
         prevent_initial_call=False,
     )
-    def load_table(seq, start_iso, end_iso, busca):
-        df = get_transactions()
+    def load_table(seq, start_iso, end_iso, busca, data_ref):
+        if data_ref:
+            # Carteira reconstruída na data (checkpoint + replay do log)
+            df = posicoes_em(data_ref)
+            b = (busca or "").strip().upper()
+            if b and not df.empty:
+                df = df[df["TICKER"].astype(str).str.contains(b, regex=False, na=False)]
+        else:
+            # Busca por ticker resolvida no SQLite (índice de prefixo / FTS trigram)
+            df = get_transactions(busca=busca)
         if df is None or df.empty:
             return []
 
@@ -55,7 +287,7 @@ def register_callbacks(app):
         if start_iso or end_iso:
             start_dt = datetime.fromisoformat(start_iso) if start_iso else None
             end_dt = datetime.fromisoformat(end_iso) if end_iso else None
-            dcol = df["DATA OP"].apply(_parse_ddmmyyyy)
+            dcol = df["DATA OP"]  # datetime64 (esquema.py)
             mask = pd.Series(True, index=df.index)
             if start_dt:
                 mask &= dcol >= start_dt
@@ -63,13 +295,7 @@ def register_callbacks(app):
                 mask &= dcol <= end_dt
             df = df[mask]
 
-        # Filtro por busca (ticker)
-        if busca and isinstance(busca, str):
-            b = busca.strip().upper()
-            if b:
-                df = df[df["TICKER"].astype(str).str.upper().str.contains(b, na=False)]
-
-        return df.to_dict("records")
+        return registros(df)
 
     # Cards: Aberturas (Compra/Venda x Call/Put)
     @app.callback(
@@ -178,6 +404,23 @@ def register_callbacks(app):
         today = datetime.now().strftime("%d/%m/%Y")
         return ("", None, None, None, today, "", "", None)
 
+    # Nova: série do cadastro (series.py) preenche OPERAÇÃO, DATA EXERC e STRIKE numa chamada;
+    # fora do cadastro vale o que o client-side deduziu do ticker
+    @app.callback(
+        Output("nova-operacao", "value", allow_duplicate=True),
+        Output("nova-data-exerc", "value", allow_duplicate=True),
+        Output("nova-strike", "value", allow_duplicate=True),
+        Output("nova-ticker-val", "children"),
+        Input("nova-ticker", "value"),
+        State("modal-nova-operacao", "is_open"),
+        prevent_initial_call=True,
+    )
+    def preencher_serie(ticker, is_open):
+        serie = buscar_serie(ticker) if is_open and len(str(ticker or "").strip()) >= 6 else None
+        if serie is None:
+            return no_update, no_update, no_update, ""
+        return serie["operacao"], serie["vencimento"] or no_update, serie["strike"], serie["ativo"]
+
     # Nova: confirmar inclusão
     @app.callback(
         Output("modal-nova-mensagem", "children"),
@@ -223,7 +466,8 @@ def register_callbacks(app):
             val_opc = abs(float(val_opcao))
             strike_val = float(strike) if strike not in (None, "") else None
 
-            add_operation(
+            escrever(
+                add_operation,
                 ticker=ticker,
                 operacao=operacao,
                 direcao=direcao,
@@ -240,6 +484,138 @@ def register_callbacks(app):
         except Exception as e:
             return (f"Erro ao incluir: {e}", True, no_update)
 
+    # Nova estrutura: abrir/fechar
+    @app.callback(
+        Output("modal-nova-estrutura", "is_open", allow_duplicate=True),
+        Input("nova-estrutura-btn", "n_clicks"),
+        Input("cancelar-estr-btn", "n_clicks"),
+        State("modal-nova-estrutura", "is_open"),
+        prevent_initial_call=True,
+    )
+    def toggle_modal_estrutura(n_open, n_cancel, is_open):
+        trig = ctx.triggered_id
+        if trig == "nova-estrutura-btn":
+            return True
+        if trig == "cancelar-estr-btn":
+            return False
+        return is_open
+
+    # Nova estrutura: resetar campos ao abrir
+    @app.callback(
+        Output("estr-modelo", "value"),
+        Output("estr-strike", "value"),
+        Output("estr-passo", "value"),
+        Output("estr-quantidade", "value"),
+        Output("estr-nome", "value"),
+        Output("estr-data-op", "value"),
+        Output("modal-estr-mensagem", "children", allow_duplicate=True),
+        Input("modal-nova-estrutura", "is_open"),
+        prevent_initial_call=True,
+    )
+    def reset_estrutura_fields(is_open):
+        if not is_open:
+            return (no_update,) * 7
+        today = datetime.now().strftime("%d/%m/%Y")
+        return (None, None, None, None, "", today, "")
+
+    # Nova estrutura: pernas a partir do modelo (ticker/prêmio digitados são mantidos)
+    @app.callback(
+        Output("estr-pernas", "data"),
+        Output("estr-nome", "value", allow_duplicate=True),
+        Input("estr-modelo", "value"),
+        Input("estr-strike", "value"),
+        Input("estr-passo", "value"),
+        Input("estr-quantidade", "value"),
+        Input("estr-add-perna-btn", "n_clicks"),
+        State("estr-pernas", "data"),
+        State("estr-nome", "value"),
+        prevent_initial_call=True,
+    )
+    def montar_pernas(modelo, strike, passo, qtd, n_add, rows, nome):
+        rows = list(rows or [])
+        if ctx.triggered_id == "estr-add-perna-btn":
+            rows.append({"TICKER": "", "OPERAÇÃO": "", "DIREÇÃO": None, "STRIKE": None,
+                         "QUANTIDADE": qtd, "VALOR OPÇÃO": None})
+            return rows, no_update
+        if not modelo:
+            return ([] if ctx.triggered_id == "estr-modelo" else no_update), no_update
+        try:
+            qtd_base = abs(int(float(qtd))) if qtd not in (None, "") else 0
+            k = float(strike) if strike not in (None, "") else None
+            p = float(passo) if passo not in (None, "") else None
+            pernas = pernas_do_modelo(modelo, qtd_base, k, p)
+        except (TypeError, ValueError):
+            return no_update, no_update
+        mesmas = len(rows) == len(pernas) and ctx.triggered_id != "estr-modelo"
+        novas = []
+        for i, perna in enumerate(pernas):
+            anterior = rows[i] if mesmas else {}
+            novas.append({
+                "TICKER": anterior.get("TICKER", ""),
+                "OPERAÇÃO": perna["operacao"],
+                "DIREÇÃO": perna["direcao"],
+                "STRIKE": perna["strike"],
+                "QUANTIDADE": perna["quantidade"] or None,
+                "VALOR OPÇÃO": anterior.get("VALOR OPÇÃO"),
+            })
+        return novas, (no_update if nome else modelo)
+
+    # Nova estrutura: confirmar (todas as pernas ou nenhuma)
+    @app.callback(
+        Output("modal-estr-mensagem", "children"),
+        Output("modal-nova-estrutura", "is_open", allow_duplicate=True),
+        Output("table-refresh-seq", "data", allow_duplicate=True),
+        Input("confirmar-estr-btn", "n_clicks"),
+        State("estr-pernas", "data"),
+        State("estr-nome", "value"),
+        State("estr-data-op", "value"),
+        State("table-refresh-seq", "data"),
+        prevent_initial_call=True,
+    )
+    def confirmar_estrutura(n_clicks, rows, nome, data_op, seq):
+        if not n_clicks:
+            return no_update, no_update, no_update
+        rows = rows or []
+        if len(rows) < 2:
+            return ("A estrutura precisa de ao menos duas pernas.", True, no_update)
+        if not (nome or "").strip():
+            return ("Informe o nome da ESTRUTURA.", True, no_update)
+        pernas = []
+        for i, row in enumerate(rows, start=1):
+            info = extrair_info_ticker(row.get("TICKER"))
+            if not info:
+                return (f"Perna {i}: ticker inválido.", True, no_update)
+            operacao, data_exerc = info
+            if row.get("OPERAÇÃO") and row["OPERAÇÃO"] != operacao:
+                return (f"Perna {i}: o ticker é {operacao}, o modelo pede {row['OPERAÇÃO']}.", True, no_update)
+            if row.get("DIREÇÃO") not in ("Compra", "Venda"):
+                return (f"Perna {i}: selecione a DIREÇÃO.", True, no_update)
+            qtd, val = row.get("QUANTIDADE"), row.get("VALOR OPÇÃO")
+            if qtd in (None, "") or not validate_numeric_positive(qtd, "quantidade"):
+                return (f"Perna {i}: quantidade inválida.", True, no_update)
+            if val in (None, "") or not validate_numeric_positive(val, "valor_opcao"):
+                return (f"Perna {i}: valor da opção inválido.", True, no_update)
+            strike = row.get("STRIKE")
+            pernas.append({
+                "ticker": str(row["TICKER"]).strip().upper(),
+                "operacao": operacao,
+                "direcao": row["DIREÇÃO"],
+                "strike": float(strike) if strike not in (None, "") else None,
+                "quantidade": abs(int(float(qtd))),
+                "valor_opcao": abs(float(val)),
+                "data_exerc": data_exerc,
+            })
+        try:
+            escrever(
+                add_structure,
+                estrutura=nome.strip(),
+                pernas=pernas,
+                data_op=data_op if validate_date(data_op) else None,
+            )
+        except Exception as e:
+            return (f"Erro ao incluir estrutura: {e}", True, no_update)
+        return ("", False, int(seq or 0) + 1)
+
     # Alterar: abrir/fechar
     @app.callback(
         Output("modal-alterar-operacao", "is_open", allow_duplicate=True),
@@ -320,7 +696,8 @@ def register_callbacks(app):
                     return ("Quantidade inválida.", no_update, no_update)
                 qtd_norm = abs(int(float(qtd)))
 
-            update_operation(
+            escrever(
+                update_operation,
                 operacao_id=int(row_id),
                 quantidade=qtd_norm,
                 estrutura=estrutura,
@@ -415,7 +792,8 @@ def register_callbacks(app):
             if not validate_date(data_encerr):
                 return ("Data de encerramento inválida.", no_update, no_update)
 
-            close_operation(
+            escrever(
+                close_operation,
                 row_id=int(row_id),
                 qtd_encerrada=abs(int(float(qtd_encerr))),
                 valor_encerr_unit=abs(float(valor_encerr)),
@@ -423,11 +801,234 @@ def register_callbacks(app):
                 rolagem_texto=rolagem_texto,
                 motivo_encerr=motivo_encerr
             )
+            atualizar_snapshot()  # delta no snapshot dos relatórios
             new_seq = int(seq or 0) + 1
             return ("Encerramento registrado com sucesso.", False, new_seq)
         except Exception as e:
             return (f"Erro ao encerrar: {e}", no_update, no_update)
 
+    # Encerrar estrutura: abrir/fechar (precisa de linha selecionada com bundle ou estrutura)
+    @app.callback(
+        Output("modal-encerrar-estrutura", "is_open", allow_duplicate=True),
+        Output("encestr-chave", "data"),
+        Input("encerrar-estrutura-btn", "n_clicks"),
+        Input("cancelar-encestr-btn", "n_clicks"),
+        State("modal-encerrar-estrutura", "is_open"),
+        State("selected-row-id", "data"),
+        State("tabela-operacoes", "data"),
+        prevent_initial_call=True,
+    )
+    def toggle_modal_encerrar_estrutura(n_open, n_cancel, is_open, row_id, rows):
+        trig = ctx.triggered_id
+        if trig == "cancelar-encestr-btn":
+            return False, no_update
+        if trig != "encerrar-estrutura-btn" or not row_id:
+            return is_open, no_update
+        row = next((r for r in (rows or []) if str(r.get("id")) == str(row_id)), None)
+        if not row or not (row.get("BUNDLE") or row.get("ESTRUTURA")):
+            return False, no_update
+        if row.get("BUNDLE"):
+            return True, {"bundle": row["BUNDLE"]}
+        return True, {"estrutura": row["ESTRUTURA"]}
+
+    # Encerrar estrutura: carrega todas as pernas abertas de uma vez
+    @app.callback(
+        Output("encestr-alvo", "children"),
+        Output("encestr-pernas", "data"),
+        Output("encestr-percentual", "value"),
+        Output("encestr-data", "value"),
+        Output("modal-encestr-mensagem", "children", allow_duplicate=True),
+        Input("modal-encerrar-estrutura", "is_open"),
+        State("encestr-chave", "data"),
+        prevent_initial_call=True,
+    )
+    def preload_encerrar_estrutura(is_open, chave):
+        if not is_open or not chave:
+            return (no_update,) * 5
+        df = get_pernas(**chave)
+        linhas = [{
+            "id": int(r.id), "TICKER": r.ticker, "OPERAÇÃO": r.operacao, "DIREÇÃO": r.direcao,
+            "QUANTIDADE": abs(int(r.quantidade)), "VALOR OPÇÃO": r.valor_opcao,
+            "VALOR ENCERR": None, "G/P": None,
+        } for r in df.itertuples(index=False)]
+        alvo = chave.get("bundle") or chave.get("estrutura")
+        today = datetime.now().strftime("%d/%m/%Y")
+        return f"{alvo} — {len(linhas)} perna(s)", linhas, 100, today, ""
+
+    # Encerrar estrutura: G/P previsto por perna e total
+    @app.callback(
+        Output("encestr-pernas", "data", allow_duplicate=True),
+        Output("encestr-gp-total", "children"),
+        Input("encestr-pernas", "data_timestamp"),
+        Input("encestr-percentual", "value"),
+        State("encestr-pernas", "data"),
+        prevent_initial_call=True,
+    )
+    def prever_gp_estrutura(_ts, percentual, rows):
+        if not rows:
+            return no_update, ""
+        fracao = min(max(float(percentual or 100), 0.0), 100.0) / 100
+        total = 0  # centavos, mesmas contas de close_operation
+        for row in rows:
+            try:
+                qtd = abs(int(row["QUANTIDADE"]))
+                if fracao < 1:
+                    qtd = min(max(int(round(qtd * fracao)), 1), qtd)
+                sinal = 1 if row["DIREÇÃO"] == "Compra" else -1
+                gp = fluxo(premio(abs(float(row["VALOR ENCERR"]))), qtd, sinal) + fluxo(premio(row["VALOR OPÇÃO"]), qtd, -sinal)
+                row["G/P"] = reais(gp)
+                total += gp
+            except (TypeError, ValueError, KeyError, ArithmeticError):
+                row["G/P"] = None
+        completas = all(r.get("G/P") is not None for r in rows)
+        return rows, (f"G/P da estrutura: {fmt_centavos(total)}" if completas else "")
+
+    # Encerrar estrutura: confirmar (todas as pernas ou nenhuma)
+    @app.callback(
+        Output("modal-encestr-mensagem", "children"),
+        Output("modal-encerrar-estrutura", "is_open", allow_duplicate=True),
+        Output("table-refresh-seq", "data", allow_duplicate=True),
+        Input("confirmar-encestr-btn", "n_clicks"),
+        State("encestr-chave", "data"),
+        State("encestr-pernas", "data"),
+        State("encestr-percentual", "value"),
+        State("encestr-data", "value"),
+        State("encestr-motivo", "value"),
+        State("table-refresh-seq", "data"),
+        prevent_initial_call=True,
+    )
+    def confirmar_encerrar_estrutura(n_clicks, chave, rows, percentual, data_encerr, motivo, seq):
+        if not n_clicks:
+            return no_update, no_update, no_update
+        if not chave or not rows:
+            return ("Nenhuma perna aberta para encerrar.", no_update, no_update)
+        precos = {}
+        for row in rows:
+            val = row.get("VALOR ENCERR")
+            if val in (None, "") or not validate_numeric_positive(val, "valor encerramento"):
+                return (f"Valor de encerramento inválido para {row.get('TICKER')}.", no_update, no_update)
+            precos[int(row["id"])] = abs(float(val))
+        if percentual in (None, "") or not 0 < float(percentual) <= 100:
+            return ("Percentual de encerramento inválido.", no_update, no_update)
+        if not validate_date(data_encerr):
+            return ("Data de encerramento inválida.", no_update, no_update)
+        try:
+            escrever(close_structure, precos, data_encerr, fracao=float(percentual) / 100,
+                     motivo_encerr=motivo, **chave)
+        except Exception as e:
+            return (f"Erro ao encerrar estrutura: {e}", no_update, no_update)
+        atualizar_snapshot()  # delta no snapshot dos relatórios
+        return ("", False, int(seq or 0) + 1)
+
+    # Rolar: abrir/fechar
+    @app.callback(
+        Output("modal-rolar", "is_open", allow_duplicate=True),
+        Input("rolar-btn", "n_clicks"),
+        Input("cancelar-rolar-btn", "n_clicks"),
+        State("modal-rolar", "is_open"),
+        State("selected-row-id", "data"),
+        prevent_initial_call=True,
+    )
+    def toggle_modal_rolar(n_open, n_cancel, is_open, row_id):
+        trig = ctx.triggered_id
+        if trig == "rolar-btn":
+            return bool(row_id)
+        if trig == "cancelar-rolar-btn":
+            return False
+        return is_open
+
+    # Rolar: preload (perna selecionada e G/P da cadeia até aqui)
+    @app.callback(
+        Output("rolar-origem", "children"),
+        Output("rolar-qtd-encerr", "value"),
+        Output("rolar-quantidade", "value"),
+        Output("rolar-valor-encerr", "value"),
+        Output("rolar-ticker", "value"),
+        Output("rolar-strike", "value"),
+        Output("rolar-valor-opcao", "value"),
+        Output("rolar-data", "value"),
+        Output("rolar-cadeia", "children"),
+        Output("modal-rolar-mensagem", "children", allow_duplicate=True),
+        Input("modal-rolar", "is_open"),
+        State("selected-row-id", "data"),
+        State("tabela-operacoes", "data"),
+        prevent_initial_call=True,
+    )
+    def preload_modal_rolar(is_open, row_id, rows):
+        if not is_open or not row_id:
+            return (no_update,) * 10
+        row = next((r for r in (rows or []) if str(r.get("id")) == str(row_id)), None)
+        if not row:
+            return (no_update,) * 10
+        try:
+            qtd = abs(int(float(row.get("QUANTIDADE"))))
+        except (TypeError, ValueError):
+            qtd = None
+        cadeia = get_cadeia(int(row_id))
+        resumo = ""
+        if len(cadeia) > 1:
+            resumo = f"Cadeia com {len(cadeia)} pernas — G/P realizado: {fmt_centavos(somar(cadeia['g_p']))}"
+        today = datetime.now().strftime("%d/%m/%Y")
+        origem = f"{row.get('TICKER')} — {row.get('DIREÇÃO')} {qtd or ''} ({row.get('DATA EXERC')})"
+        return origem, qtd, qtd, None, "", None, None, today, resumo, ""
+
+    # Rolar: confirmar (encerramento + abertura numa transação)
+    @app.callback(
+        Output("modal-rolar-mensagem", "children"),
+        Output("modal-rolar", "is_open", allow_duplicate=True),
+        Output("table-refresh-seq", "data", allow_duplicate=True),
+        Input("confirmar-rolar-btn", "n_clicks"),
+        State("selected-row-id", "data"),
+        State("tabela-operacoes", "data"),
+        State("rolar-qtd-encerr", "value"),
+        State("rolar-valor-encerr", "value"),
+        State("rolar-data", "value"),
+        State("rolar-ticker", "value"),
+        State("rolar-strike", "value"),
+        State("rolar-quantidade", "value"),
+        State("rolar-valor-opcao", "value"),
+        State("table-refresh-seq", "data"),
+        prevent_initial_call=True,
+    )
+    def confirmar_rolar(n_clicks, row_id, rows, qtd_encerr, valor_encerr, data_rol, ticker,
+                        strike, qtd_nova, valor_opcao, seq):
+        if not n_clicks:
+            return no_update, no_update, no_update
+        row = next((r for r in (rows or []) if str(r.get("id")) == str(row_id)), None)
+        if not row:
+            return ("Nenhuma linha selecionada.", no_update, no_update)
+        for valor, nome in ((qtd_encerr, "Quantidade encerrada"), (valor_encerr, "Valor de encerramento"),
+                            (qtd_nova, "Nova quantidade"), (valor_opcao, "Novo valor da opção")):
+            if valor in (None, "") or not validate_numeric_positive(valor, nome):
+                return (f"{nome} inválido(a).", no_update, no_update)
+        if not validate_date(data_rol):
+            return ("Data da rolagem inválida.", no_update, no_update)
+        info = extrair_info_ticker(ticker)
+        if not info:
+            return ("Novo ticker inválido.", no_update, no_update)
+        operacao, data_exerc = info
+        try:
+            escrever(
+                rolar,
+                row_id=int(row_id),
+                qtd_encerrada=abs(int(float(qtd_encerr))),
+                valor_encerr_unit=abs(float(valor_encerr)),
+                data_rolagem=data_rol,
+                novas=[{
+                    "ticker": str(ticker).strip().upper(),
+                    "operacao": operacao,
+                    "direcao": row.get("DIREÇÃO"),
+                    "strike": float(strike) if strike not in (None, "") else None,
+                    "quantidade": abs(int(float(qtd_nova))),
+                    "valor_opcao": abs(float(valor_opcao)),
+                    "data_exerc": data_exerc,
+                }],
+            )
+        except Exception as e:
+            return (f"Erro ao rolar: {e}", no_update, no_update)
+        atualizar_snapshot()  # delta no snapshot dos relatórios
+        return ("", False, int(seq or 0) + 1)
+
  # -------------------------------
     # Relatórios: opções dinâmicas (Estrutura/Bundle) a partir de Encerradas
     # -------------------------------
@@ -440,19 +1041,10 @@ def register_callbacks(app):
         prevent_initial_call=False,
     )
     def rel_populate_options(_tab):
-        df = get_encerradas()
-        if df is None or df.empty:
-            estr = [{"label": "Todas", "value": ""}]
-            bund = [{"label": "Todos", "value": ""}]
-            return estr, estr, bund, bund
-
-        # Estrutura vem minúscula do DB
-        estr_vals = [e for e in df["estrutura"].dropna().unique() if str(e).strip()]
-        estr_opts = sorted(estr_vals)
-        estr = [{"label": "Todas", "value": ""}] + [{"label": v, "value": v} for v in estr_opts]
-
-        # Bundle ainda não está persistido em 'encerradas' (fase futura)
-        bund = [{"label": "Todos", "value": ""}]
+        # Valores distintos via índice, em cache até a próxima escrita
+        vals = get_lookup_values()
+        estr = [{"label": "Todas", "value": ""}] + [{"label": v, "value": v} for v in vals["estrutura"]]
+        bund = [{"label": "Todos", "value": ""}] + [{"label": v, "value": v} for v in vals["bundle"]]
         return estr, estr, bund, bund
 
     # -------------------------------
@@ -477,115 +1069,9 @@ def register_callbacks(app):
         prevent_initial_call=False,
     )
     def rel_sintetico(start_iso, end_iso, tipo, estrutura, bundle, ticker):
-        import plotly.express as px
-
-        df_raw = get_encerradas()
-        if df_raw is None or df_raw.empty:
-            # figuras vazias
-            fig_empty1 = px.bar(title="G/P por Mês")
-            fig_empty2 = px.bar(title="Simples vs Estrutura")
-            return ("0,00", "0", "0,00", "0.0%", "Melhor: - | Pior: -",
-                    fig_empty1, fig_empty2, [], [])
-
-        # Normalização para padrão do UI
-        dfn = df_raw.rename(columns={
-            "id": "ID_ENC",
-            "id_origem": "ID_ORIGEM",
-            "ticker": "TICKER",
-            "operacao": "OPERACAO",
-            "direcao": "DIRECAO",
-            "strike": "STRIKE",
-            "quantidade": "QTD_ENC",
-            "valor_opcao": "PRECO_ABERT",
-            "valor_encerr": "PRECO_ENC",
-            "valor_operacao": "CF_ABERT",
-            "valor_oper_encerr": "CF_ENC",
-            "g_p": "GP",
-            "data_op": "DATA_OP",
-            "data_encerr": "DATA_ENC",
-            "estrutura": "ESTRUTURA",
-            "rolagem": "ROLAGEM",
-            "motivo": "MOTIVO",
-        }).copy()
-
-        # Derivados mínimos
-        if "BUNDLE" not in dfn.columns:
-            dfn["BUNDLE"] = ""  # placeholder até persistirmos em 'encerradas'
-        dfn["ESTRUTURA"] = dfn["ESTRUTURA"].fillna("")
-        dfn["TIPO"] = dfn["ESTRUTURA"].apply(lambda s: "Estrutura" if str(s).strip() else "Simples")
-
-        # Filtro por período (DATA_ENC)
-        if start_iso or end_iso:
-            start_dt = datetime.fromisoformat(start_iso) if start_iso else None
-            end_dt = datetime.fromisoformat(end_iso) if end_iso else None
-            dcol = dfn["DATA_ENC"].apply(_parse_ddmmyyyy)
-            mask = pd.Series(True, index=dfn.index)
-            if start_dt:
-                mask &= dcol >= start_dt
-            if end_dt:
-                mask &= dcol <= end_dt
-            dfn = dfn[mask]
-
-        # Filtros adicionais
-        if (tipo or "") != "":
-            dfn = dfn[dfn["TIPO"] == tipo]
-        if (estrutura or "") != "":
-            dfn = dfn[dfn["ESTRUTURA"] == estrutura]
-        if (bundle or "") != "":
-            dfn = dfn[dfn["BUNDLE"] == bundle]
-        if ticker and str(ticker).strip():
-            b = str(ticker).strip().upper()
-            dfn = dfn[dfn["TICKER"].astype(str).str.upper().str.contains(b, na=False)]
-
-        # KPIs
-        if dfn.empty:
-            fig_empty1 = px.bar(title="G/P por Mês")
-            fig_empty2 = px.bar(title="Simples vs Estrutura")
-            return ("0,00", "0", "0,00", "0.0%", "Melhor: - | Pior: -",
-                    fig_empty1, fig_empty2, [], [])
-
-        gp_total = float(dfn["GP"].sum())
-        n_enc = int(dfn.shape[0])
-        ticket = (gp_total / n_enc) if n_enc else 0.0
-        hit = (100.0 * (dfn["GP"] > 0).mean()) if n_enc else 0.0
-        top = dfn.nlargest(1, "GP")[["ID_ENC", "GP"]].values.tolist() if n_enc else []
-        bot = dfn.nsmallest(1, "GP")[["ID_ENC", "GP"]].values.tolist() if n_enc else []
-        top_str = f"Melhor: {top[0][0]} ({top[0][1]:.2f})" if top else "Melhor: -"
-        bot_str = f"Pior: {bot[0][0]} ({bot[0][1]:.2f})" if bot else "Pior: -"
-
-        # Gráfico G/P por mês
-        def _to_month(s):
-            try:
-                dtv = datetime.strptime(s, "%d/%m/%Y")
-                return dtv.strftime("%Y-%m")
-            except Exception:
-                return None
-
-        dfn["_MES"] = dfn["DATA_ENC"].apply(_to_month)
-        g_mes = dfn.groupby("_MES", dropna=True)["GP"].sum().reset_index()
-        fig_mes = px.bar(g_mes, x="_MES", y="GP", title="G/P por Mês")
-
-        # Simples vs Estrutura
-        g_tipo = dfn.groupby("TIPO")["GP"].sum().reset_index()
-        fig_tipo = px.bar(g_tipo, x="TIPO", y="GP", title="Simples vs Estrutura")
-
-        # Tabela por Estrutura/Bundle
-        tbl = dfn.groupby(["ESTRUTURA", "BUNDLE"], dropna=False).agg(GP=("GP", "sum"), N_ENC=("ID_ENC", "count")).reset_index()
-
-        # Top10
-        top10 = dfn.sort_values("GP", ascending=False).head(10)[["ID_ENC", "TICKER", "ESTRUTURA", "GP"]]
-
-        return (
-            f"{gp_total:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-            f"{n_enc}",
-            f"{ticket:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-            f"{hit:.1f}%",
-            f"{top_str} | {bot_str}",
-            fig_mes,
-            fig_tipo,
-            tbl.to_dict("records"),
-            top10.to_dict("records")
-        )
+        # Mesma combinação de filtros na mesma versão do banco: resultado pronto (cache_relatorios.py)
+        filtros = (start_iso, end_iso, tipo, estrutura, bundle, ticker)
+        return memorizado("rel_sintetico", filtros, lambda: _rel_sintetico(*filtros))
 
     # Drill-down: clicar na linha do Sintético aplica filtro no Analítico
     @app.callback(
@@ -604,7 +1090,8 @@ def register_callbacks(app):
     # -------------------------------
     # Relatório Analítico: Linhas vs Grupos
     # -------------------------------
-    @app.callback(
+    @callback_longo(
+        app,
         Output("analitico-table", "data"),
         Output("analitico-table", "style_data_conditional"),
         Input("a-date-range", "start_date"),
@@ -616,129 +1103,63 @@ def register_callbacks(app):
         prevent_initial_call=False,
     )
     def rel_analitico(start_iso, end_iso, tipo, estrutura, bundle, view_mode):
-        df_raw = get_encerradas()
-
-        # Normalização
-        df = df_raw.rename(columns={
-            "id": "ID_ENC",
-            "id_origem": "ID_ORIGEM",
-            "ticker": "TICKER",
-            "operacao": "OPERACAO",
-            "direcao": "DIRECAO",
-            "strike": "STRIKE",
-            "quantidade": "QTD_ENC",
-            "valor_opcao": "PRECO_ABERT",
-            "valor_encerr": "PRECO_ENC",
-            "valor_operacao": "CF_ABERT",
-            "valor_oper_encerr": "CF_ENC",
-            "g_p": "GP",
-            "data_op": "DATA_OP",
-            "data_encerr": "DATA_ENC",
-            "estrutura": "ESTRUTURA",
-            "rolagem": "ROLAGEM",
-            "motivo": "MOTIVO",
-        }).copy()
-
-        if df.empty:
-            sdc = []
-            return [], sdc
-
-        if "BUNDLE" not in df.columns:
-            df["BUNDLE"] = ""  # placeholder até persistirmos em 'encerradas'
-        df["ESTRUTURA"] = df["ESTRUTURA"].fillna("")
-        df["TIPO"] = df["ESTRUTURA"].apply(lambda s: "Estrutura" if str(s).strip() else "Simples")
-
-        # Derivados úteis (opcional)
-        def _dt(s):
-            try:
-                return datetime.strptime(s, "%d/%m/%Y")
-            except Exception:
-                return None
-        df["__DT_OP"] = df["DATA_OP"].apply(_dt)
-        df["__DT_ENC"] = df["DATA_ENC"].apply(_dt)
-        def _dias(row):
-            try:
-                if row["__DT_OP"] and row["__DT_ENC"]:
-                    return (row["__DT_ENC"] - row["__DT_OP"]).days
-            except Exception:
-                pass
-            return None
-        df["DIAS_POS"] = df.apply(_dias, axis=1)
-        def _ret(row):
-            try:
-                cf = float(row["CF_ABERT"])
-                gp = float(row["GP"])
-                denom = abs(cf)
-                return (gp / denom) if denom else None
-            except Exception:
-                return None
-        df["RET_PCT"] = df.apply(_ret, axis=1)
-
-        # Filtros
-        if start_iso or end_iso:
-            start_dt = datetime.fromisoformat(start_iso) if start_iso else None
-            end_dt = datetime.fromisoformat(end_iso) if end_iso else None
-            mask = pd.Series(True, index=df.index)
-            if start_dt:
-                mask &= df["__DT_ENC"] >= start_dt
-            if end_dt:
-                mask &= df["__DT_ENC"] <= end_dt
-            df = df[mask]
-
-        if (tipo or "") != "":
-            df = df[df["TIPO"] == tipo]
-        if (estrutura or "") != "":
-            df = df[df["ESTRUTURA"] == estrutura]
-        if (bundle or "") != "":
-            df = df[df["BUNDLE"] == bundle]
-
-        # Limpa colunas auxiliares
-        if "__DT_OP" in df.columns: df.drop(columns=["__DT_OP"], inplace=True)
-        if "__DT_ENC" in df.columns: df.drop(columns=["__DT_ENC"], inplace=True)
+        df = _analitico_df(start_iso, end_iso, tipo, estrutura, bundle)
 
         if view_mode == "linhas":
             sdc = []
-            return df.to_dict("records"), sdc
-
-        # visão "grupos": agrega por Estrutura/Bundle e intercala linhas header
-        rows = []
-        sdc = [{
-            "if": {"filter_query": "{__GROUP__} = 1"},
-            "backgroundColor": "#333",
-            "color": "white",
-            "fontWeight": "bold",
-        }]
+            return (registros(_analitico_derivados(df)) if not df.empty else []), sdc
+
+        # visão "grupos": só os cabeçalhos agregados por Estrutura/Bundle;
+        # as linhas de cada grupo vêm sob demanda (analitico_grupo)
+        sdc = [
+            {"if": {"filter_query": "{__GROUP__} = 1"},
+             "backgroundColor": "#333", "color": "white", "fontWeight": "bold", "cursor": "pointer"},
+            {"if": {"filter_query": "{__GROUP__} = 2"},
+             "fontStyle": "italic", "cursor": "pointer"},
+        ]
         if df.empty:
             return [], sdc
+        return _analitico_cabecalhos(df), sdc
 
-        g = df.groupby(["ESTRUTURA", "BUNDLE"], dropna=False)
-        for (estr, bund), dfg in g:
-            gp_sum = float(dfg["GP"].sum())
-            n_enc = int(dfg.shape[0])
-            header = {
-                "ID_ENC": "", "ID_ORIGEM": "",
-                "TICKER": "", "OPERACAO": "", "DIRECAO": "",
-                "ESTRUTURA": estr or "", "BUNDLE": bund or "",
-                "PERNA": "", "ROLAGEM": "",
-                "QTD_ENC": "", "PRECO_ABERT": "", "PRECO_ENC": "",
-                "CF_ABERT": "", "CF_ENC": "",
-                "GP": gp_sum, "RET_PCT": "", "DATA_OP": "", "DATA_ENC": "",
-                "DIAS_POS": "", "MOTIVO": "",
-                "__GROUP__": 1
-            }
-            rows.append(header)
-            for _, r in dfg.iterrows():
-                rec = r.to_dict()
-                rec["__GROUP__"] = 0
-                rows.append(rec)
-
-        return rows, sdc
+    # Grupos: clique no cabeçalho abre/fecha o grupo; em "mais ..." traz a próxima página
+    @app.callback(
+        Output("analitico-table", "data", allow_duplicate=True),
+        Output("analitico-table", "active_cell"),
+        Input("analitico-table", "active_cell"),
+        State("analitico-table", "data"),
+        State("a-date-range", "start_date"),
+        State("a-date-range", "end_date"),
+        State("a-tipo", "value"),
+        State("a-view-mode", "value"),
+        prevent_initial_call=True,
+    )
+    def analitico_grupo(active_cell, data, start_iso, end_iso, tipo, view_mode):
+        if view_mode != "grupos" or not active_cell or not data:
+            return no_update, no_update
+        rid = active_cell.get("row_id")
+        i = next((k for k, r in enumerate(data) if r.get("id") == rid), None)
+        if i is None or not data[i].get("__GROUP__"):
+            return no_update, no_update
+        data, row = list(data), data[i]
+        if row["__GROUP__"] == 2:  # "mais ...": próxima página no lugar da linha
+            pai = next(r for r in data if r.get("id") == row["__PAI__"])
+            linhas = _analitico_pagina(start_iso, end_iso, tipo, pai, row["__OFFSET__"])
+            return data[:i] + linhas + data[i + 1:], None
+        if row.get("__ABERTO__"):
+            data = [r for r in data if r.get("__PAI__") != rid]
+            data[i] = {**row, "__ABERTO__": 0, "ID_ENC": f"▸ {row['__N__']}"}
+            return data, None
+        linhas = _analitico_pagina(start_iso, end_iso, tipo, row, 0)
+        data[i] = {**row, "__ABERTO__": 1, "ID_ENC": f"▾ {row['__N__']}"}
+        return data[:i + 1] + linhas + data[i + 1:], None
 
     # Exportar Sintético
-    @app.callback(
+    @callback_longo(
+        app,
         Output("download-sint", "data"),
         Input("export-sint-btn", "n_clicks"),
         State("sint-table", "data"),
+        running=[(Output("export-sint-btn", "disabled"), True, False)],
         prevent_initial_call=True,
     )
     def export_sint(n, data):
@@ -750,22 +1171,103 @@ def register_callbacks(app):
         return dcc.send_data_frame(df.to_excel, fname, index=False)
 
     # Exportar Analítico
-    @app.callback(
+    @callback_longo(
+        app,
         Output("download-analit", "data"),
         Input("export-analit-btn", "n_clicks"),
-        State("analitico-table", "data"),
+        State("a-date-range", "start_date"),
+        State("a-date-range", "end_date"),
+        State("a-tipo", "value"),
+        State("a-estrutura", "value"),
+        State("a-bundle", "value"),
+        running=[(Output("export-analit-btn", "disabled"), True, False)],
         prevent_initial_call=True,
     )
-    def export_analit(n, data):
-        if not n or not data:
+    def export_analit(n, start_iso, end_iso, tipo, estrutura, bundle):
+        # Refeito no servidor com os filtros: na visão "grupos" a tabela só tem
+        # cabeçalhos e as páginas já abertas
+        if not n:
             return no_update
-        import pandas as pd
-        df = pd.DataFrame(data)
+        df = _analitico_df(start_iso, end_iso, tipo, estrutura, bundle)
+        if df.empty:
+            return no_update
+        df = pd.DataFrame(registros(_analitico_derivados(df)))
         fname = f"analitico_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         return dcc.send_data_frame(df.to_excel, fname, index=False)
 
+    # Recalcular: refaz os checkpoints históricos (posições em data passada)
+    @callback_longo(
+        app,
+        Output("output-recalcular", "children"),
+        Input("recalcular-btn", "n_clicks"),
+        progress=[Output("output-recalcular", "children")],
+        running=[
+            (Output("recalcular-btn", "disabled"), True, False),
+            (Output("cancelar-recalcular-btn", "style"), {"display": "inline"}, {"display": "none"}),
+        ],
+        cancel=[Input("cancelar-recalcular-btn", "n_clicks")],
+        prevent_initial_call=True,
+    )
+    def recalcular(set_progress, n):
+        if not n:
+            return no_update
+        t0 = time.perf_counter()
+        ultimo = [-1]
+
+        def progresso(feitos, total):
+            pct = int(100 * feitos / max(total, 1))
+            if pct != ultimo[0]:
+                ultimo[0] = pct
+                set_progress(f"Recalculando... {pct}%")
+
+        set_progress("Recalculando...")
+        try:
+            n_cp = recalcular_checkpoints(progresso=progresso)
+        except Exception as e:
+            return f"Erro ao recalcular: {e}"
+        return f"{n_cp} checkpoint(s) recalculados em {time.perf_counter() - t0:.1f}s"
+
+    # -------------------------------
+    # Contas: seletor e visão consolidada
+    # -------------------------------
+    @app.callback(
+        Output("conta-select", "options"),
+        Output("conta-select", "value"),
+        Input("conta-select", "id"),
+        prevent_initial_call=False,
+    )
+    def carregar_contas(_id):
+        return [{"label": c, "value": c} for c in listar_contas()], conta_atual()
+
+    @app.callback(
+        Output("contas-table", "data"),
+        Input("rel-tabs", "active_tab"),
+        Input("table-refresh-seq", "data"),
+        prevent_initial_call=False,
+    )
+    def contas_consolidado(tab, _seq):
+        if tab != "tab-contas":
+            return no_update
+        df = resumo_consolidado()
+        if df.empty:
+            return []
+        total = df.drop(columns=["conta"]).sum()
+        df.loc[len(df)] = {"conta": "TOTAL", **total.to_dict()}
+        df[["n_abertas", "n_encerradas"]] = df[["n_abertas", "n_encerradas"]].astype(int)
+        for col in ("fluxo_aberto", "gp_realizado"):
+            # total em centavos inteiros (a linha TOTAL somada acima é refeita exata)
+            cent = centavos_np(df[col].iloc[:-1])
+            df[col] = [fmt_centavos(v, moeda=False) for v in [*cent.tolist(), int(cent.sum())]]
+        return df.to_dict("records")
 
     # Clientside callbacks
+    app.clientside_callback(
+        "window.dash_clientside.clientside.trocarConta",
+        Output("conta-trocada", "data"),
+        Input("conta-select", "value"),
+        prevent_initial_call=True,
+    )
+
     app.clientside_callback(
         "window.dash_clientside.clientside.focusTicker",
         Output("focus-ticker-pulse", "data"),
@@ -5,6 +5,7 @@ import dash_bootstrap_components as dbc
 from datetime import date, timedelta, datetime as dt_now
 
 from database import init_database
+from estruturas import MODELOS
 
 #init_database()
 
@@ -15,12 +16,35 @@ app = dash.Dash(
 )
 server = app.server
 
+# Instrumentação: tempo/linhas/payload por callback, /metrics e slow-log
+from metrics import instrumentar_app
+instrumentar_app(app)
+
+# Conta da requisição (cookie gravado pelo seletor de conta) -> roteador do database
+from flask import request
+from database import usar_conta
+
+@server.before_request
+def _conta_da_requisicao():
+    usar_conta(request.cookies.get('monitor_conta'))
+
+# Cadastro de séries: GET /series?ticker=... (lookup do ticker digitado)
+from series import registrar_rota
+registrar_rota(server)
+
+# Gravação dos payloads de callbacks para replay no teste de carga (carga.py --replay)
+import os
+if os.environ.get('MONITOR_GRAVAR_CARGA'):
+    from carga import instalar_gravador
+    instalar_gravador(app, os.environ['MONITOR_GRAVAR_CARGA'])
+
 app.layout = dbc.Container([
     html.H1("Monitor de Opções", className="text-center my-4"),
 
     dbc.Row([
+        dbc.Col(dcc.Dropdown(id='conta-select', placeholder='Conta', clearable=False), width=2),
         dbc.Col(dbc.Switch(id='theme-switch', label='Dark Mode', value=False), width=2)
-    ], className="mb-3", justify="end"),
+    ], className="mb-3", justify="end", align="center"),
 
     dbc.Row([
         dbc.Col([
@@ -38,11 +62,14 @@ app.layout = dbc.Container([
         ], width=3),
 
         dbc.Col(dbc.Button("Nova", id="nova-operacao-btn", color='success', size="sm"), width=1),
+        dbc.Col(dbc.Button("Estrutura", id="nova-estrutura-btn", color='success', size="sm"), width=1),
         dbc.Col(dbc.Button("Alterar", id="alterar-operacao-btn", color='primary', size="sm"), width=1),
         dbc.Col(dbc.Button("Encerrar", id="encerrar-operacao-btn", color='warning', size="sm"), width=1),
+        dbc.Col(dbc.Button("Enc. Estrutura", id="encerrar-estrutura-btn", color='warning', size="sm"), width=1),
+        dbc.Col(dbc.Button("Rolar", id="rolar-btn", color='warning', size="sm"), width=1),
         dbc.Col(dbc.Button("Recalcular", id="recalcular-btn", color='info', size="sm"), width=1),
         dbc.Col(dbc.Button("Exportar", id="export-btn", color='secondary', size="sm"), width=1),
-        dbc.Col(dbc.Button("Atualizar Cotações", id="atualizar-cotacoes-btn", color='info', size="sm"), width=2),
+        dbc.Col(dbc.Button("Atualizar Cotações", id="atualizar-cotacoes-btn", color='info', size="sm"), width=1),
     ], className="g-2 mb-4", justify="center", align="center"),
 
     dbc.Row([
@@ -68,14 +95,27 @@ app.layout = dbc.Container([
     ], className="g-3 mb-4", justify="center"),
 
     dbc.Row([
-        dbc.Col(dbc.Input(id='busca-ticker', type='text', placeholder='Buscar Ticker', className="form-control form-control-sm"), width=2),
+        dbc.Col(dbc.Input(id='busca-ticker', type='text', placeholder='Buscar Ticker', debounce=300, className="form-control form-control-sm"), width=2),
+        dbc.Col(dcc.DatePickerSingle(
+            id='posicao-data-ref',
+            placeholder='Posição em (hoje)',
+            display_format='DD/MM/YYYY',
+            first_day_of_week=1,
+            clearable=True,
+            className="form-control form-control-sm",
+            style={"height": "38px", "borderRadius": "6px"}
+        ), width=2),
         dbc.Col(dcc.Dropdown(
             id='export-format',
             options=[{'label': 'Excel', 'value': 'excel'}, {'label': 'CSV', 'value': 'csv'}],
             value='excel',
             clearable=False
         ), width=2),
-        dbc.Col(html.Div(id='output-recalcular', className="text-danger text-center"), width=3)
+        dbc.Col([
+            html.Span(id='output-recalcular', className="text-danger text-center"),
+            dbc.Button("Cancelar", id="cancelar-recalcular-btn", color='link', size="sm",
+                       className="ms-2 p-0", style={'display': 'none'}),
+        ], width=3, className="text-center")
     ], justify="center", className="mb-3"),
 
     dbc.Row([
@@ -94,6 +134,7 @@ app.layout = dbc.Container([
                 {'name': 'DATA OP', 'id': 'DATA OP'},
                 {'name': 'DATA EXERC', 'id': 'DATA EXERC'},
                 {'name': 'ESTRUTURA', 'id': 'ESTRUTURA'},
+                {'name': 'BUNDLE', 'id': 'BUNDLE'},
                 {'name': 'ROLAGEM', 'id': 'ROLAGEM'}
             ],
             hidden_columns=['id'],
@@ -117,6 +158,7 @@ app.layout = dbc.Container([
     # Stores
     dcc.Store(id='selected-row-id', data=None),
     dcc.Store(id='table-refresh-seq', data=0),
+    dcc.Store(id='conta-trocada', data=None),
     dcc.Store(id='focus-ticker-pulse', data=0),  # para clientside focus
 
     # Modal de Nova Operação
@@ -201,6 +243,68 @@ app.layout = dbc.Container([
         size="md",
     ),
 
+    # Modal de Nova Estrutura (todas as pernas numa transação)
+    dbc.Modal(
+        [
+            dbc.ModalHeader("Nova Estrutura", close_button=True),
+            dbc.ModalBody([
+                dbc.Form(className="form-group", style={'padding': '15px'}, children=[
+                    dbc.Row([
+                        dbc.Col(html.Label("MODELO", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Dropdown(
+                            id='estr-modelo',
+                            options=[{'label': nome.capitalize(), 'value': nome} for nome in MODELOS],
+                            placeholder="Livre (pernas manuais)",
+                            className="form-control"
+                        ), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("STRIKE CENTRAL / PASSO", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='estr-strike', type='number', step=0.01, className="form-control"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='estr-passo', type='number', step=0.01, className="form-control"), width=4, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("QUANTIDADE BASE", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='estr-quantidade', type='number', className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("ESTRUTURA", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='estr-nome', type='text', className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("DATA OP", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='estr-data-op', placeholder="DD/MM/YYYY", type='text', className="form-control", value=dt_now.now().strftime('%d/%m/%Y')), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                ]),
+                dash_table.DataTable(
+                    id='estr-pernas',
+                    columns=[
+                        {'name': 'TICKER', 'id': 'TICKER', 'editable': True},
+                        {'name': 'OPERAÇÃO', 'id': 'OPERAÇÃO', 'editable': False},
+                        {'name': 'DIREÇÃO', 'id': 'DIREÇÃO', 'presentation': 'dropdown', 'editable': True},
+                        {'name': 'STRIKE', 'id': 'STRIKE', 'type': 'numeric', 'editable': True},
+                        {'name': 'QUANTIDADE', 'id': 'QUANTIDADE', 'type': 'numeric', 'editable': True},
+                        {'name': 'VALOR OPÇÃO', 'id': 'VALOR OPÇÃO', 'type': 'numeric', 'editable': True},
+                    ],
+                    dropdown={'DIREÇÃO': {'options': [{'label': 'Compra', 'value': 'Compra'}, {'label': 'Venda', 'value': 'Venda'}]}},
+                    data=[],
+                    row_deletable=True,
+                    style_cell={'textAlign': 'center', 'padding': '5px', 'fontSize': '13px'},
+                    style_header={'backgroundColor': 'rgb(230, 240, 250)', 'fontWeight': 'bold'},
+                ),
+                dbc.Button("+ Perna", id="estr-add-perna-btn", color='link', size="sm"),
+                html.Div(id='modal-estr-mensagem', style={'color': 'red', 'textAlign': 'center', 'marginTop': '10px'}),
+            ]),
+            dbc.ModalFooter([
+                dbc.Button("Confirmar Estrutura", id="confirmar-estr-btn", color='success', className='me-2'),
+                dbc.Button("Cancelar", id="cancelar-estr-btn", color='secondary'),
+            ]),
+        ],
+        id='modal-nova-estrutura',
+        is_open=False,
+        size="lg",
+    ),
+
     # Modal Alterar Operação
     dbc.Modal(
         [
@@ -339,6 +443,119 @@ app.layout = dbc.Container([
         is_open=False,
         size="md",
     ),
+
+    # Modal Encerrar Estrutura (todas as pernas do bundle numa transação)
+    dbc.Modal(
+        [
+            dbc.ModalHeader("Encerrar Estrutura", close_button=True),
+            dbc.ModalBody([
+                html.Div(id='encestr-alvo', className="fw-bold text-center mb-2"),
+                dash_table.DataTable(
+                    id='encestr-pernas',
+                    columns=[
+                        {'name': 'id', 'id': 'id'},
+                        {'name': 'TICKER', 'id': 'TICKER', 'editable': False},
+                        {'name': 'OPERAÇÃO', 'id': 'OPERAÇÃO', 'editable': False},
+                        {'name': 'DIREÇÃO', 'id': 'DIREÇÃO', 'editable': False},
+                        {'name': 'QUANTIDADE', 'id': 'QUANTIDADE', 'editable': False},
+                        {'name': 'VALOR OPÇÃO', 'id': 'VALOR OPÇÃO', 'editable': False},
+                        {'name': 'VALOR ENCERR', 'id': 'VALOR ENCERR', 'type': 'numeric', 'editable': True},
+                        {'name': 'G/P', 'id': 'G/P', 'type': 'numeric', 'editable': False,
+                         'format': {'specifier': ',.2f'}},
+                    ],
+                    hidden_columns=['id'],
+                    data=[],
+                    style_cell={'textAlign': 'center', 'padding': '5px', 'fontSize': '13px'},
+                    style_header={'backgroundColor': 'rgb(230, 240, 250)', 'fontWeight': 'bold'},
+                ),
+                html.Div(id='encestr-gp-total', className="fw-bold text-end mt-2"),
+                dbc.Form(className="form-group", style={'padding': '15px'}, children=[
+                    dbc.Row([
+                        dbc.Col(html.Label("ENCERRAR (%)", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='encestr-percentual', type='number', min=1, max=100, value=100, className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("DATA ENCERRAMENTO", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='encestr-data', placeholder="DD/MM/YYYY", type='text', className="form-control", value=dt_now.now().strftime('%d/%m/%Y')), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("MOTIVO", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Dropdown(
+                            id='encestr-motivo',
+                            options=[
+                                {'label': 'Target', 'value': 'target'},
+                                {'label': 'Stop', 'value': 'stop'},
+                                {'label': 'Rolagem', 'value': 'rolagem'},
+                                {'label': 'Margem', 'value': 'margem'},
+                                {'label': 'Outro', 'value': 'outro'},
+                            ],
+                            placeholder="(opcional)",
+                            clearable=True,
+                            className="form-control"
+                        ), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                ]),
+                html.Div(id='modal-encestr-mensagem', style={'color': 'red', 'textAlign': 'center', 'marginTop': '10px'}),
+            ]),
+            dbc.ModalFooter([
+                dbc.Button("Confirmar Encerramento", id="confirmar-encestr-btn", color='danger', className='me-2'),
+                dbc.Button("Cancelar", id="cancelar-encestr-btn", color='secondary'),
+            ]),
+        ],
+        id='modal-encerrar-estrutura',
+        is_open=False,
+        size="lg",
+    ),
+    dcc.Store(id='encestr-chave', data=None),
+
+    # Modal Rolar (encerra a perna e abre a nova numa transação)
+    dbc.Modal(
+        [
+            dbc.ModalHeader("Rolar Operação", close_button=True),
+            dbc.ModalBody([
+                html.Div(id='rolar-origem', className="fw-bold text-center mb-2"),
+                dbc.Form(className="form-group", style={'padding': '15px'}, children=[
+                    dbc.Row([
+                        dbc.Col(html.Label("QTD ENCERRADA", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='rolar-qtd-encerr', type='number', className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("VALOR ENCERRAMENTO", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='rolar-valor-encerr', type='number', step=0.01, className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("DATA ROLAGEM", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='rolar-data', placeholder="DD/MM/YYYY", type='text', className="form-control", value=dt_now.now().strftime('%d/%m/%Y')), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("NOVO TICKER", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='rolar-ticker', type='text', className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("NOVO STRIKE", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='rolar-strike', type='number', step=0.0001, className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("NOVA QUANTIDADE", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='rolar-quantidade', type='number', className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                    dbc.Row([
+                        dbc.Col(html.Label("NOVO VALOR OPÇÃO", className="label"), width=4, style={'padding': '5px'}),
+                        dbc.Col(dcc.Input(id='rolar-valor-opcao', type='number', step=0.0001, className="form-control"), width=8, style={'padding': '5px'}),
+                    ], style={'marginBottom': '10px', 'alignItems': 'center'}),
+                ]),
+                html.Div(id='rolar-cadeia', className="text-muted text-center"),
+                html.Div(id='modal-rolar-mensagem', style={'color': 'red', 'textAlign': 'center', 'marginTop': '10px'}),
+            ]),
+            dbc.ModalFooter([
+                dbc.Button("Confirmar Rolagem", id="confirmar-rolar-btn", color='warning', className='me-2'),
+                dbc.Button("Cancelar", id="cancelar-rolar-btn", color='secondary'),
+            ]),
+        ],
+        id='modal-rolar',
+        is_open=False,
+        size="md",
+    ),
     # === Relatórios: Sintético e Analítico ===
     html.Hr(className="my-4"),
     html.H2("Relatórios", className="text-center my-3"),
@@ -378,7 +595,7 @@ app.layout = dbc.Container([
                 ], width=2),
                 dbc.Col([
                     html.Label("Ticker", className="form-label mb-1"),
-                    dcc.Input(id="e-ticker", type="text", placeholder="Filtro", className="form-control form-control-sm")
+                    dcc.Input(id="e-ticker", type="text", placeholder="Filtro", debounce=0.3, className="form-control form-control-sm")
                 ], width=2),
             ], className="g-2 mb-3", justify="center"),
 
@@ -396,8 +613,8 @@ app.layout = dbc.Container([
             ], className="g-2 mb-3", justify="center"),
 
             dbc.Row([
-                dbc.Col(dcc.Graph(id="graf-gp-mensal", config={"displayModeBar": False}), width=6),
-                dbc.Col(dcc.Graph(id="graf-simples-vs-estrutura", config={"displayModeBar": False}), width=6),
+                dbc.Col(dcc.Graph(id="graf-gp-mensal", className="grafico-rel", config={"displayModeBar": False}), width=6),
+                dbc.Col(dcc.Graph(id="graf-simples-vs-estrutura", className="grafico-rel", config={"displayModeBar": False}), width=6),
             ], className="mb-3"),
 
             dbc.Row([
@@ -513,6 +730,22 @@ app.layout = dbc.Container([
             dbc.Button("Exportar Analítico", id="export-analit-btn", color="secondary", size="sm", className="mt-2"),
             dcc.Download(id="download-analit"),
         ]),
+        dbc.Tab(label="Contas", tab_id="tab-contas", children=[
+            html.H5("Consolidado por conta", className="mt-3 mb-2"),
+            dash_table.DataTable(
+                id="contas-table",
+                columns=[
+                    {"name": "Conta", "id": "conta"},
+                    {"name": "Abertas", "id": "n_abertas"},
+                    {"name": "Fluxo Aberto (R$)", "id": "fluxo_aberto"},
+                    {"name": "Encerradas", "id": "n_encerradas"},
+                    {"name": "G/P Realizado (R$)", "id": "gp_realizado"},
+                ],
+                style_cell={'textAlign': 'center', 'padding': '5px', 'fontSize': '13px'},
+                style_header={'backgroundColor': 'rgb(230, 240, 250)', 'fontWeight': 'bold'},
+                style_data_conditional=[{"if": {"filter_query": '{conta} = "TOTAL"'}, "fontWeight": "bold"}],
+            ),
+        ]),
     ]),
 
 ], fluid=True, className="px-4")
@@ -521,5 +754,18 @@ app.layout = dbc.Container([
 from app_callbacks import register_callbacks
 register_callbacks(app)
 
+# Jobs em background (checkpoints diários da carteira)
+from historico import iniciar_job_checkpoints
+iniciar_job_checkpoints()
+# Arquivamento anual (MONITOR_ARQUIVO_MANTER_DIAS > 0)
+from arquivo import iniciar_job_arquivo
+iniciar_job_arquivo()
+# Liquidação de pernas vencidas (startup + a cada hora)
+from vencimentos import iniciar_job_vencimentos
+iniciar_job_vencimentos()
+# Manutenção do SQLite: checkpoint do WAL, estatísticas e backup online
+from manutencao import iniciar_jobs_manutencao
+iniciar_jobs_manutencao()
+
 if __name__ == '__main__':
     app.run(debug=True)
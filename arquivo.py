@@ -0,0 +1,163 @@
+# arquivo.py
+#
+# Arquivamento anual: encerradas e log_alteracoes anteriores a um corte saem do
+# banco "quente" para <dir do banco>/arquivo/<base>_<ano>.db. A tabela
+# particoes (manifesto) guarda o intervalo de datas de cada partição; as
+# leituras (get_encerradas, historico) anexam só as partições que intersectam
+# o período pedido.
+# Uso:
+#   python arquivo.py --corte 2025-01-01 [--conta principal] [--vacuum]
+#   python arquivo.py --manter-dias 365            (todas as contas)
+
+import os
+import sqlite3
+import logging
+import argparse
+import datetime as dt
+from typing import List, Optional
+
+from database import (_connect, _iso_sql, _caminho_particao, _migrar_particao, _bump_data_version,
+                      init_database, listar_contas, na_conta)
+from historico import _to_iso, materializar_checkpoints
+import jobs
+from metrics import medir
+
+logging.basicConfig(level=logging.INFO)
+
+_DATA = {'encerradas': _iso_sql('data_encerr'), 'log_alteracoes': _iso_sql('data_alteracao')}
+# Índices replicados em cada partição (mesmos filtros dos relatórios/replay)
+_INDICES = {
+    'encerradas': [('idx_enc_data_iso', _DATA['encerradas']), ('idx_enc_idorigem', 'id_origem'),
+                   ('idx_enc_estrutura', 'estrutura'), ('idx_enc_bundle', 'estrutura_bundle'),
+                   ('idx_enc_ticker', 'ticker')],
+    'log_alteracoes': [('idx_log_tx_data', f"transacao_id, {_DATA['log_alteracoes']}"),
+                       ('idx_log_data', _DATA['log_alteracoes'])],
+}
+# Manter N dias no banco quente (job diário); 0 desliga
+MANTER_DIAS = int(os.environ.get('MONITOR_ARQUIVO_MANTER_DIAS', '0'))
+
+def _preparar_particao(c: sqlite3.Cursor, tabela: str) -> List[str]:
+    """Cria/migra arq.<tabela> com o schema da tabela atual; retorna as colunas."""
+    c.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", (tabela,))
+    ddl = c.fetchone()[0]
+    c.execute(ddl.replace(f"CREATE TABLE {tabela}", f"CREATE TABLE IF NOT EXISTS arq.{tabela}", 1)
+                 .replace(f"CREATE TABLE IF NOT EXISTS {tabela}", f"CREATE TABLE IF NOT EXISTS arq.{tabela}", 1))
+    # partição de antes de uma migração: colunas novas (ponto fixo com backfill)
+    colunas = _migrar_particao(c, 'arq', tabela)
+    for nome, expr in _INDICES[tabela]:
+        c.execute(f"CREATE INDEX IF NOT EXISTS arq.{nome} ON {tabela} ({expr})")
+    return colunas
+
+def _filtro(tabela: str) -> str:
+    """Linhas elegíveis de um ano (parâmetros: _params)."""
+    data = _DATA[tabela]
+    filtro = f"{data} >= ? AND {data} < ? AND {data} < ?"
+    if tabela == 'log_alteracoes':
+        # só pernas encerradas por completo antes do corte: o replay de pernas
+        # abertas (historico._estado_inicial) continua usando apenas o banco quente
+        filtro += f""" AND transacao_id NOT IN (SELECT id FROM main.transacoes)
+                       AND NOT EXISTS (SELECT 1 FROM main.log_alteracoes l2
+                                       WHERE l2.transacao_id = log_alteracoes.transacao_id
+                                         AND {_iso_sql('l2.data_alteracao')} >= ?)"""
+    return filtro
+
+def _params(tabela: str, ano: str, corte: str) -> tuple:
+    base = (f'{ano}-01-01', f'{int(ano) + 1}-01-01', corte)
+    return base + (corte,) if tabela == 'log_alteracoes' else base
+
+@medir('db')
+def arquivar(corte, vacuum: bool = False) -> dict:
+    """
+    Move para as partições anuais as linhas de encerradas/log_alteracoes
+    com data < corte (conta ativa). Antes, materializa o checkpoint do corte:
+    o replay de datas >= corte não depende das partições.
+    Cada ano é uma transação (BEGIN IMMEDIATE) sobre o banco e a partição;
+    a cópia é INSERT OR REPLACE por id, então repetir após uma falha é seguro.
+    Retorna {'encerradas': n, 'log_alteracoes': n, 'anos': [...]}.
+    """
+    corte_iso = _to_iso(corte)
+    init_database()
+    materializar_checkpoints(ate=corte_iso)
+
+    movidas = {'encerradas': 0, 'log_alteracoes': 0, 'anos': []}
+    conn = _connect()
+    conn.isolation_level = None  # transações manuais: ATTACH/DETACH ficam fora delas
+    try:
+        c = conn.cursor()
+        anos = set()
+        for tabela, data in _DATA.items():
+            c.execute(f"SELECT DISTINCT substr({data},1,4) FROM {tabela} WHERE {data} < ?", (corte_iso,))
+            anos.update(r[0] for r in c.fetchall() if r[0] and r[0].isdigit())
+        for ano in sorted(anos):
+            caminho = _caminho_particao(int(ano))
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            c.execute("ATTACH DATABASE ? AS arq", (caminho,))
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                n_ano = 0
+                try:
+                    for tabela, data in _DATA.items():
+                        colunas = ', '.join(_preparar_particao(c, tabela))
+                        filtro = _filtro(tabela)
+                        params = _params(tabela, ano, corte_iso)
+                        c.execute(f"INSERT OR REPLACE INTO arq.{tabela} ({colunas}) "
+                                  f"SELECT {colunas} FROM main.{tabela} WHERE {filtro}", params)
+                        c.execute(f"DELETE FROM main.{tabela} WHERE {filtro}", params)
+                        movidas[tabela] += c.rowcount
+                        n_ano += c.rowcount
+                        # centavos (dinheiro.py); linhas arquivadas antes da migração só têm o REAL
+                        total = ("SUM(COALESCE(g_p_cent, CAST(ROUND(ROUND(g_p * 100, 6)) AS INTEGER)))"
+                                 if tabela == 'encerradas' else "NULL")
+                        c.execute(f"""INSERT OR REPLACE INTO main.particoes
+                                      (tabela, ano, arquivo, data_min, data_max, n_linhas, total, total_cent, corte, atualizado_em)
+                                      SELECT ?, ?, ?, MIN({data}), MAX({data}), COUNT(*), {total} / 100.0, {total}, ?, ?
+                                      FROM arq.{tabela}""",
+                                  (tabela, int(ano), os.path.basename(caminho), corte_iso,
+                                   dt.datetime.now().isoformat(timespec='seconds')))
+                    c.execute("COMMIT")
+                except Exception:
+                    c.execute("ROLLBACK")
+                    raise
+            finally:
+                c.execute("DETACH DATABASE arq")
+            if n_ano:
+                movidas['anos'].append(int(ano))
+        if vacuum and anos:
+            c.execute("VACUUM")
+    finally:
+        conn.close()
+    if movidas['anos']:
+        _bump_data_version()
+    logging.info(f"[ARQ] corte {corte_iso}: {movidas['encerradas']} encerradas, "
+                 f"{movidas['log_alteracoes']} logs -> anos {movidas['anos']}")
+    return movidas
+
+def arquivar_contas(manter_dias: int) -> None:
+    corte = (dt.date.today() - dt.timedelta(days=manter_dias)).isoformat()
+    for conta in listar_contas():
+        with na_conta(conta):
+            arquivar(corte)
+
+def iniciar_job_arquivo(manter_dias: Optional[int] = None, intervalo_s: float = 86400.0) -> bool:
+    """Arquivamento diário (todas as contas) quando MONITOR_ARQUIVO_MANTER_DIAS > 0."""
+    dias = MANTER_DIAS if manter_dias is None else manter_dias
+    if dias <= 0:
+        return False
+    return jobs.agendar('arquivo', lambda: arquivar_contas(dias), intervalo_s, atraso_inicial_s=60.0)
+
+def main():
+    ap = argparse.ArgumentParser(description="Arquiva encerradas/log antigos em partições anuais")
+    grupo = ap.add_mutually_exclusive_group(required=True)
+    grupo.add_argument('--corte', help="data de corte (YYYY-MM-DD ou DD/MM/YYYY); linhas anteriores são arquivadas")
+    grupo.add_argument('--manter-dias', type=int, help="mantém N dias no banco quente (todas as contas)")
+    ap.add_argument('--conta', default=None)
+    ap.add_argument('--vacuum', action='store_true', help="compacta o banco após mover as linhas")
+    args = ap.parse_args()
+    if args.manter_dias is not None:
+        arquivar_contas(args.manter_dias)
+        return
+    with na_conta(args.conta or listar_contas()[0]):
+        print(arquivar(args.corte, vacuum=args.vacuum))
+
+if __name__ == '__main__':
+    main()
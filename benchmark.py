@@ -0,0 +1,198 @@
+# benchmark.py
+#
+# Benchmark da aplicação sobre bancos sintéticos (gerar_dados.py).
+# Uso:
+#   python benchmark.py --escalas 1k,100k [--dados bench_data] [--repeticoes 5]
+#                       [--saida bench_report.json] [--comparar base.json --tolerancia 0.20]
+# O relatório JSON é comparável entre execuções; com --comparar, sai com código 1
+# se alguma mediana piorar além da tolerância.
+
+import os
+import sys
+import json
+import time
+import inspect
+import logging
+import platform
+import argparse
+import statistics
+import subprocess
+import datetime as dt
+from typing import Callable, Dict, List
+
+os.environ.setdefault('MONITOR_JOBS', '0')
+# Os cenários medem o cálculo; o acerto do cache de relatórios tem cenário próprio
+os.environ.setdefault('MONITOR_RELATORIOS_CACHE', '0')
+
+import gerar_dados
+
+# Períodos usados nos cenários: histórico completo (pior caso) e a janela padrão da UI
+PERIODO_TUDO = (None, None)
+PERIODO_90D = ('2025-04-01', '2025-06-30')
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return ''
+
+def _callbacks(app) -> Dict[str, Callable]:
+    """Funções originais dos callbacks (sem o wrapper do Dash), por nome."""
+    return {inspect.unwrap(v['callback']).__name__: inspect.unwrap(v['callback'])
+            for v in app.callback_map.values() if 'callback' in v}
+
+def _linhas(res) -> int:
+    if hasattr(res, 'shape'):
+        return int(res.shape[0])
+    if isinstance(res, list):
+        return len(res)
+    if isinstance(res, tuple):
+        return sum(len(x) for x in res if isinstance(x, list))
+    return 0
+
+def _medir(fn: Callable, repeticoes: int) -> dict:
+    fn()  # aquecimento (imports, caches de plano do SQLite)
+    tempos: List[float] = []
+    res = None
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        res = fn()
+        tempos.append(time.perf_counter() - t0)
+    tempos.sort()
+    return {
+        'n': repeticoes,
+        'min_s': tempos[0],
+        'mediana_s': statistics.median(tempos),
+        'p95_s': tempos[min(len(tempos) - 1, int(0.95 * len(tempos)))],
+        'linhas': _linhas(res),
+    }
+
+def cenarios(app) -> Dict[str, Callable]:
+    import database
+    import calculations
+    import snapshot
+    import cache_relatorios
+    cb = _callbacks(app)
+    ini90, fim90 = PERIODO_90D
+    maior = {}
+
+    def _abrir_grupo():
+        # abre o maior grupo da visão "grupos" (1ª página das linhas, sob demanda)
+        if 'cab' not in maior:
+            cabecalhos, _ = cb['rel_analitico'](*PERIODO_TUDO, '', '', '', 'grupos')
+            maior['cab'] = max(cabecalhos, key=lambda r: r['__N__'])
+        return cb['analitico_grupo']({'row_id': maior['cab']['id']}, [maior['cab']], *PERIODO_TUDO, '', 'grupos')
+
+    def _sintetico_cache():
+        # a 1ª chamada (aquecimento) grava; as medidas são acertos
+        cache_relatorios.ATIVO = True
+        try:
+            return cb['rel_sintetico'](*PERIODO_TUDO, '', '', '', None)
+        finally:
+            cache_relatorios.ATIVO = False
+
+    cen = {
+        'get_transactions': lambda: database.get_transactions(),
+        'get_encerradas': lambda: database.get_encerradas(),
+        'snapshot.ler_encerradas': lambda: snapshot.ler_encerradas(),
+        'load_table': lambda: cb['load_table'](0, *PERIODO_TUDO, None, None),
+        'load_table_busca': lambda: cb['load_table'](0, *PERIODO_TUDO, 'PETR', None),
+        'rel_sintetico': lambda: cb['rel_sintetico'](*PERIODO_TUDO, '', '', '', None),
+        'rel_sintetico_90d': lambda: cb['rel_sintetico'](ini90, fim90, '', '', '', None),
+        'rel_sintetico_cache': lambda: _sintetico_cache(),
+        'rel_analitico_linhas': lambda: cb['rel_analitico'](*PERIODO_TUDO, '', '', '', 'linhas'),
+        'rel_analitico_grupos': lambda: cb['rel_analitico'](*PERIODO_TUDO, '', '', '', 'grupos'),
+        'rel_analitico_abrir_grupo': lambda: _abrir_grupo(),
+    }
+    for nome, fn in inspect.getmembers(calculations, inspect.isfunction):
+        if not nome.startswith('card') or fn.__module__ != 'calculations':
+            continue
+        params = inspect.signature(fn).parameters
+        if len(params) == 2:
+            cen[f'calculations.{nome}'] = (lambda f: lambda: f(ini90, fim90))(fn)
+        else:
+            cen[f'calculations.{nome}'] = fn
+    return cen
+
+def rodar(escalas: List[str], dados: str, repeticoes: int, filtro: str = '') -> dict:
+    import database
+    logging.getLogger().setLevel(logging.WARNING)
+    # O app registra os callbacks ao importar; o banco é trocado por escala
+    os.environ.setdefault('MONITOR_DB_PATH', os.path.join(dados, f'{escalas[0]}.db'))
+    database.DB_PATH = os.environ['MONITOR_DB_PATH']
+    os.environ.setdefault('MONITOR_RELATORIOS_DIR', os.path.join(dados, '.relatorios'))
+    import app_layout
+
+    relatorio = {
+        'meta': {
+            'data': dt.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'sqlite': __import__('sqlite3').sqlite_version,
+            'pandas': __import__('pandas').__version__,
+            'repeticoes': repeticoes,
+        },
+        'resultados': {},
+    }
+    for escala in escalas:
+        caminho = os.path.join(dados, f'{escala}.db')
+        if not os.path.exists(caminho):
+            n = gerar_dados.ESCALAS.get(escala.lower()) or int(escala)
+            print(f"[BENCH] gerando {caminho} ({n} operações)...", file=sys.stderr)
+            gerar_dados.gerar(caminho, n)
+        database.DB_PATH = caminho
+        database.init_database()
+        res = {}
+        for nome, fn in cenarios(app_layout.app).items():
+            if filtro and filtro not in nome:
+                continue
+            res[nome] = _medir(fn, repeticoes)
+            print(f"[BENCH] {escala:>6} {nome:<36} mediana={res[nome]['mediana_s'] * 1000:9.1f}ms "
+                  f"linhas={res[nome]['linhas']}", file=sys.stderr)
+        relatorio['resultados'][escala] = res
+    return relatorio
+
+def comparar(atual: dict, base: dict, tolerancia: float) -> List[str]:
+    """Regressões: mediana atual > mediana base * (1 + tolerância)."""
+    regressoes = []
+    for escala, res in atual['resultados'].items():
+        for nome, m in res.items():
+            b = base.get('resultados', {}).get(escala, {}).get(nome)
+            if not b or not b.get('mediana_s'):
+                continue
+            razao = m['mediana_s'] / b['mediana_s']
+            if razao > 1.0 + tolerancia:
+                regressoes.append(f"{escala} {nome}: {b['mediana_s'] * 1000:.1f}ms -> "
+                                  f"{m['mediana_s'] * 1000:.1f}ms ({razao:.2f}x)")
+    return regressoes
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do Monitor de Opções")
+    ap.add_argument('--escalas', default='1k,100k', help="lista separada por vírgula (1k,100k,1m)")
+    ap.add_argument('--dados', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data'))
+    ap.add_argument('--repeticoes', type=int, default=5)
+    ap.add_argument('--filtro', default='', help="roda só cenários cujo nome contém o texto")
+    ap.add_argument('--saida', default='bench_report.json')
+    ap.add_argument('--comparar', help="relatório base para detectar regressões")
+    ap.add_argument('--tolerancia', type=float, default=0.20)
+    args = ap.parse_args()
+
+    escalas = [e.strip() for e in args.escalas.split(',') if e.strip()]
+    rel = rodar(escalas, args.dados, args.repeticoes, args.filtro)
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(rel, f, indent=2, ensure_ascii=False)
+    print(f"[BENCH] relatório: {args.saida}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        regressoes = comparar(rel, base, args.tolerancia)
+        for r in regressoes:
+            print(f"[BENCH] REGRESSÃO {r}", file=sys.stderr)
+        sys.exit(1 if regressoes else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# cache_relatorios.py
+#
+# Resultados de relatórios memorizados por filtro: a chave é (relatório,
+# banco, filtros, versão dos dados) e o valor é a tupla de outputs já
+# serializada em JSON (figuras como dict do Plotly, tabelas como registros).
+# Voltar a uma combinação de filtros vista há pouco não refaz consultas,
+# agregações nem figuras.
+# - diskcache em disco local (MONITOR_RELATORIOS_DIR), compartilhado entre os
+#   workers do gunicorn; descarte LRU ao passar de MONITOR_RELATORIOS_MB e
+#   resultados acima de MONITOR_RELATORIOS_ITEM_KB não são guardados;
+# - sem diskcache: LRU em memória do processo, com os mesmos limites;
+# - a versão é a de tarefas._versao_dados() (igual em todos os workers), então
+#   qualquer escrita torna as entradas antigas inalcançáveis (saem pelo LRU);
+# - acertos/faltas em metrics.contar('cache', nome, 'hit'|'miss'); tamanho
+#   gravado em payload_bytes. MONITOR_RELATORIOS_CACHE=0 desliga.
+# Uso:
+#   python cache_relatorios.py [--limpar]
+
+import os
+import json
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence
+
+from plotly.io.json import to_json_plotly
+
+from metrics import contar, observar
+from tarefas import _versao_dados
+
+logging.basicConfig(level=logging.INFO)
+
+ATIVO = os.environ.get('MONITOR_RELATORIOS_CACHE', '1') != '0'
+RELATORIOS_DIR = os.environ.get('MONITOR_RELATORIOS_DIR',
+                                os.path.join(os.path.dirname(__file__), '.relatorios'))
+LIMITE_BYTES = int(float(os.environ.get('MONITOR_RELATORIOS_MB', '64')) * 1024 * 1024)
+LIMITE_ITEM = int(float(os.environ.get('MONITOR_RELATORIOS_ITEM_KB', '2048')) * 1024)
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+class _LRUMemoria:
+    """Fallback sem diskcache: LRU por bytes, só no processo."""
+
+    def __init__(self, limite: int):
+        self.limite = limite
+        self.itens: 'OrderedDict[str, bytes]' = OrderedDict()
+        self.volume = 0
+        self.lock = threading.Lock()
+
+    def get(self, chave: str) -> Optional[bytes]:
+        with self.lock:
+            valor = self.itens.get(chave)
+            if valor is not None:
+                self.itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave: str, valor: bytes) -> None:
+        with self.lock:
+            antigo = self.itens.pop(chave, None)
+            if antigo is not None:
+                self.volume -= len(antigo)
+            self.itens[chave] = valor
+            self.volume += len(valor)
+            while self.volume > self.limite and self.itens:
+                _, fora = self.itens.popitem(last=False)
+                self.volume -= len(fora)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.itens.clear()
+            self.volume = 0
+
+_ARMAZEM = None
+
+def _armazem():
+    global _ARMAZEM
+    if _ARMAZEM is None:
+        if diskcache is not None:
+            # stats: acertos/faltas somados entre os workers (estatisticas())
+            _ARMAZEM = diskcache.Cache(RELATORIOS_DIR, size_limit=LIMITE_BYTES,
+                                       eviction_policy='least-recently-used')
+            _ARMAZEM.stats(enable=True)
+        else:
+            logging.warning("[CACHE] diskcache indisponível; cache de relatórios só em memória")
+            _ARMAZEM = _LRUMemoria(LIMITE_BYTES)
+    return _ARMAZEM
+
+def _chave(nome: str, filtros: Sequence) -> str:
+    caminho, versao = _versao_dados()
+    # '' e None são o mesmo filtro nos dropdowns
+    return json.dumps([nome, caminho, versao, *[f if f not in ('', None) else None for f in filtros]])
+
+def memorizado(nome: str, filtros: Sequence, calcular: Callable[[], tuple]) -> tuple:
+    """
+    Outputs do relatório 'nome' para 'filtros': do cache quando a mesma
+    combinação já foi calculada nesta versão do banco; senão calcular().
+    """
+    if not ATIVO:
+        return calcular()
+    chave = _chave(nome, filtros)
+    try:
+        dados = _armazem().get(chave)
+    except Exception as e:  # cache corrompido/ilegível não derruba o relatório
+        logging.warning(f"[CACHE] leitura falhou ({e})")
+        dados = None
+    if dados is not None:
+        contar('cache', nome, 'hit')
+        return tuple(json.loads(dados))
+    contar('cache', nome, 'miss')
+    res = calcular()
+    # mesmo encoder do Dash: figuras viram dict, NumPy/pandas viram listas
+    dados = to_json_plotly(list(res)).encode('utf-8')
+    observar('cache', nome, payload=len(dados))
+    if len(dados) <= LIMITE_ITEM:
+        try:
+            _armazem().set(chave, dados)
+        except Exception as e:
+            logging.warning(f"[CACHE] gravação falhou ({e})")
+    return res
+
+def estatisticas() -> dict:
+    """Acertos/faltas (todos os workers com diskcache), entradas e volume em bytes."""
+    arm = _armazem()
+    if isinstance(arm, _LRUMemoria):
+        return {'entradas': len(arm.itens), 'bytes': arm.volume}
+    hits, misses = arm.stats()
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'taxa_acerto': hits / total if total else 0.0,
+            'entradas': len(arm), 'bytes': arm.volume()}
+
+def limpar() -> None:
+    _armazem().clear()
+
+def main():
+    ap = argparse.ArgumentParser(description="Cache de resultados dos relatórios")
+    ap.add_argument('--limpar', action='store_true', help="remove todas as entradas")
+    args = ap.parse_args()
+    if args.limpar:
+        limpar()
+    print(json.dumps(estatisticas(), indent=2))
+
+if __name__ == '__main__':
+    main()
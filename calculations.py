@@ -7,6 +7,7 @@ import logging
 from datetime import datetime
 
 from database import get_transactions, get_encerradas
+from dinheiro import centavos_np, somar, fmt_centavos, premio, fluxo, reais
 
 logging.basicConfig(level=logging.INFO)
 
@@ -42,11 +43,7 @@ def calculate_operation_value(direcao: str, quantidade: int, valor_opcao: float)
     - quantidade: absoluto (input do form)
     Retorna cash flow da abertura (neg compra, pos venda)
     """
-    q = abs(int(quantidade))
-    p = abs(float(valor_opcao))
-    if direcao == 'Compra':
-        return -q * p
-    return q * p
+    return reais(fluxo(premio(valor_opcao), quantidade, -1 if direcao == 'Compra' else 1))
 
 def _filter_periodo(df: pd.DataFrame, col_data: str, start_iso: Optional[str], end_iso: Optional[str]) -> pd.DataFrame:
     if df.empty:
@@ -54,7 +51,8 @@ def _filter_periodo(df: pd.DataFrame, col_data: str, start_iso: Optional[str], e
     # DatePickerRange envia ISO YYYY-MM-DD
     start_dt = datetime.fromisoformat(start_iso) if start_iso else None
     end_dt = datetime.fromisoformat(end_iso) if end_iso else None
-    dcol = df[col_data].apply(_to_dt)
+    # colunas de data já vêm em datetime64 (esquema.py)
+    dcol = df[col_data] if pd.api.types.is_datetime64_any_dtype(df[col_data]) else df[col_data].apply(_to_dt)
     mask = pd.Series(True, index=df.index)
     if start_dt:
         mask &= dcol >= start_dt
@@ -67,18 +65,20 @@ def cards_aberturas(periodo_start_iso: Optional[str], periodo_end_iso: Optional[
     if tx.empty:
         return ("R$ 0,00",) * 4
     txp = _filter_periodo(tx.copy(), 'DATA OP', periodo_start_iso, periodo_end_iso)
+    # OPERAÇÃO/DIREÇÃO são category: um groupby sobre os códigos em vez de 4 filtros;
+    # somas em centavos int64 (dinheiro.py)
+    somas = txp.assign(_CENT=centavos_np(txp['VALOR OPERAÇÃO'])).groupby(['OPERAÇÃO', 'DIREÇÃO'], observed=True)['_CENT'].sum()
     def soma(oper, direc):
-        df = txp[(txp['OPERAÇÃO'] == oper) & (txp['DIREÇÃO'] == direc)]
-        return float(df['VALOR OPERAÇÃO'].sum()) if not df.empty else 0.0
+        return int(somas.get((oper, direc), 0))
     return (
-        fmt_br(soma('Call', 'Compra')),
-        fmt_br(soma('Call', 'Venda')),
-        fmt_br(soma('Put', 'Compra')),
-        fmt_br(soma('Put', 'Venda')),
+        fmt_centavos(soma('Call', 'Compra')),
+        fmt_centavos(soma('Call', 'Venda')),
+        fmt_centavos(soma('Put', 'Compra')),
+        fmt_centavos(soma('Put', 'Venda')),
     )
 
 def cards_gp(periodo_start_iso: Optional[str], periodo_end_iso: Optional[str]) -> Tuple[str, str]:
-    enc = get_encerradas()
+    enc = get_encerradas(inicio=periodo_start_iso, fim=periodo_end_iso)
     if enc.empty:
         return ("R$ 0,00", "R$ 0,00")
     enc = enc.copy()
@@ -87,27 +87,27 @@ def cards_gp(periodo_start_iso: Optional[str], periodo_end_iso: Optional[str]) -
     if encp.empty:
         return ("R$ 0,00", "R$ 0,00")
     encp['ESTRUTURA'] = encp['estrutura'].fillna('')
-    gp_estrut = encp[encp['ESTRUTURA'] != '']['g_p'].sum() if 'g_p' in encp.columns else 0.0
-    gp_simples = encp[encp['ESTRUTURA'] == '']['g_p'].sum() if 'g_p' in encp.columns else 0.0
-    return (fmt_br(gp_estrut), fmt_br(gp_simples))
+    gp_estrut = somar(encp[encp['ESTRUTURA'] != '']['g_p']) if 'g_p' in encp.columns else 0
+    gp_simples = somar(encp[encp['ESTRUTURA'] == '']['g_p']) if 'g_p' in encp.columns else 0
+    return (fmt_centavos(gp_estrut), fmt_centavos(gp_simples))
 
 def card_fluxo(periodo_start_iso: Optional[str], periodo_end_iso: Optional[str]) -> str:
     tx = get_transactions()
-    enc = get_encerradas()
-    total = 0.0
+    enc = get_encerradas(inicio=periodo_start_iso, fim=periodo_end_iso)
+    total = 0  # centavos
     if not tx.empty:
         txp = _filter_periodo(tx, 'DATA OP', periodo_start_iso, periodo_end_iso)
-        total += float(txp['VALOR OPERAÇÃO'].sum()) if not txp.empty else 0.0
+        total += somar(txp['VALOR OPERAÇÃO']) if not txp.empty else 0
     if not enc.empty:
         enc = enc.copy()
         enc.rename(columns={'data_encerr': 'DATA ENCERR'}, inplace=True)
         encp = _filter_periodo(enc, 'DATA ENCERR', periodo_start_iso, periodo_end_iso)
         if not encp.empty and 'valor_oper_encerr' in encp.columns:
-            total += float(encp['valor_oper_encerr'].sum())
-    return fmt_br(total)
+            total += somar(encp['valor_oper_encerr'])
+    return fmt_centavos(total)
 
 def card_posicao_aberta() -> str:
     tx = get_transactions()
     if tx.empty:
         return "R$ 0,00"
-    return fmt_br(float(tx['VALOR OPERAÇÃO'].sum()))
+    return fmt_centavos(somar(tx['VALOR OPERAÇÃO']))
@@ -0,0 +1,347 @@
+# carga.py
+#
+# Teste de carga local: reproduz o tráfego de callbacks Dash (POST /_dash-update-component)
+# com N usuários virtuais contra uma instância local (gunicorn) sobre um banco semeado.
+# Uso:
+#   python carga.py --iniciar --workers 2 --threads 4 --escala 1k --usuarios 16 --duracao 30
+#   python carga.py --url http://127.0.0.1:8050 --usuarios 8 --duracao 20
+#   python carga.py --url ... --replay gravacao.jsonl      (payloads gravados, ver instalar_gravador)
+# Relatório por callback: vazão, p50/p95/p99, erros e "database is locked".
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import datetime as dt
+from urllib.parse import urlparse
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import gerar_dados
+
+# Callback alvo -> (trecho do output que o identifica, peso no mix de tráfego)
+ALVOS = {
+    'load_table': ('tabela-operacoes.data', 30),
+    'cards_aberturas': ('compra-call-value.children', 10),
+    'cards_gp': ('g_p-estrutura-value.children', 10),
+    'card_fluxo': ('fluxo-periodo-value.children', 10),
+    'card_posicao': ('posicao-aberta-value.children', 10),
+    'rel_sintetico': ('kpi-gp-real.children', 10),
+    'rel_analitico': ('analitico-table.data', 8),
+    'confirmar_nova': ('modal-nova-mensagem.children', 8),
+    'confirmar_encerrar': ('modal-encerrar-mensagem.children', 4),
+}
+RAIZES = list(gerar_dados.RAIZES)
+# Intervalo de polling dos callbacks em background (tarefas.py)
+POLL_S = 0.1
+POLL_TIMEOUT_S = 120.0
+
+def _periodo(rng: random.Random):
+    fim = dt.date(2025, 6, 30) - dt.timedelta(days=rng.randint(0, 365))
+    return (fim - dt.timedelta(days=rng.choice((30, 90, 365)))).isoformat(), fim.isoformat()
+
+class _Cenario:
+    """Gera os valores de inputs/state (chave 'id.prop') para um callback alvo."""
+
+    def __init__(self, db_path: Optional[str], seed: int):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.abertas: List[int] = []
+        if db_path and os.path.exists(db_path):
+            with sqlite3.connect(db_path) as c:
+                self.abertas = [r[0] for r in c.execute("SELECT id FROM transacoes WHERE ABS(quantidade) > 1")]
+            self.rng.shuffle(self.abertas)
+
+    def valores(self, alvo: str) -> Dict[str, object]:
+        rng = self.rng
+        ini, fim = _periodo(rng)
+        if alvo == 'load_table':
+            return {'periodo-date-range.start_date': ini, 'periodo-date-range.end_date': fim,
+                    'busca-ticker.value': rng.choice([None, None, rng.choice(RAIZES)[:rng.randint(2, 4)]]),
+                    'table-refresh-seq.data': 0}
+        if alvo in ('cards_aberturas', 'cards_gp', 'card_fluxo', 'card_posicao'):
+            return {'periodo-date-range.start_date': ini, 'periodo-date-range.end_date': fim,
+                    'table-refresh-seq.data': 0}
+        if alvo == 'rel_sintetico':
+            return {'e-date-range.start_date': ini, 'e-date-range.end_date': fim,
+                    'e-tipo.value': rng.choice(['', 'Simples', 'Estrutura']), 'e-estrutura.value': '',
+                    'e-bundle.value': '', 'e-ticker.value': rng.choice([None, rng.choice(RAIZES)])}
+        if alvo == 'rel_analitico':
+            return {'a-date-range.start_date': ini, 'a-date-range.end_date': fim,
+                    'a-tipo.value': '', 'a-estrutura.value': '', 'a-bundle.value': '',
+                    'a-view-mode.value': rng.choice(['linhas', 'grupos'])}
+        if alvo == 'confirmar_nova':
+            venc = gerar_dados._terceira_sexta(2025, rng.randint(7, 12))
+            operacao = rng.choice(['Call', 'Put'])
+            serie = (gerar_dados.SERIES_CALL if operacao == 'Call' else gerar_dados.SERIES_PUT)[venc.month - 1]
+            return {'confirmar-nova-btn.n_clicks': 1,
+                    'nova-ticker.value': f"{rng.choice(RAIZES)}{serie}{rng.randint(10, 999)}",
+                    'nova-operacao.value': operacao, 'nova-direcao.value': rng.choice(['Compra', 'Venda']),
+                    'nova-strike.value': round(rng.uniform(5, 100), 2), 'nova-quantidade.value': rng.choice([100, 200, 500]),
+                    'nova-valor-opcao.value': round(rng.uniform(0.05, 3.0), 2),
+                    'nova-data-op.value': dt.date.today().strftime('%d/%m/%Y'),
+                    'nova-data-exerc.value': venc.strftime('%d/%m/%Y'),
+                    'nova-estrutura.value': '', 'nova-rolagem.value': '', 'table-refresh-seq.data': 0}
+        if alvo == 'confirmar_encerrar':
+            with self.lock:
+                row_id = self.abertas[rng.randrange(len(self.abertas))] if self.abertas else 1
+            return {'confirmar-encerr-btn.n_clicks': 1, 'selected-row-id.data': row_id,
+                    'encerrar-quantidade.value': 1, 'valor-encerr.value': round(rng.uniform(0.01, 3.0), 2),
+                    'data-encerr.value': dt.date.today().strftime('%d/%m/%Y'), 'rolagem.value': '',
+                    'motivo-encerr.value': rng.choice([None, 'target', 'stop']), 'table-refresh-seq.data': 0}
+        raise KeyError(alvo)
+
+def _outputs(output: str):
+    def um(p):
+        cid, prop = p.rsplit('.', 1)
+        return {'id': cid, 'property': prop}
+    if output.startswith('..'):
+        return [um(p) for p in output[2:-2].split('...')]
+    return um(output)
+
+def montar_corpo(dep: dict, valores: Dict[str, object]) -> dict:
+    """Corpo do POST como o renderer do Dash envia (inputs/state com 'value')."""
+    def com_valor(lst):
+        return [{**i, 'value': valores.get(f"{i['id']}.{i['property']}")} for i in lst]
+    inputs = com_valor(dep.get('inputs', []))
+    return {
+        'output': dep['output'],
+        'outputs': _outputs(dep['output']),
+        'inputs': inputs,
+        'state': com_valor(dep.get('state', [])),
+        'changedPropIds': [f"{inputs[0]['id']}.{inputs[0]['property']}"] if inputs else [],
+    }
+
+def _classificar(status: int, corpo: bytes) -> str:
+    texto = corpo.decode('utf-8', 'replace')
+    if 'database is locked' in texto or 'database table is locked' in texto:
+        return 'lock'
+    if status >= 400:
+        return 'http'
+    if 'Erro ao' in texto:
+        return 'app'
+    return 'ok'
+
+def _percentil(ordenados: List[float], q: float) -> float:
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+def _requisitar(conn: http.client.HTTPConnection, corpo: str) -> Tuple[int, bytes]:
+    """POST do callback; callbacks em background são acompanhados até o resultado."""
+    def post(sufixo=''):
+        conn.request('POST', '/_dash-update-component' + sufixo, body=corpo,
+                     headers={'Content-Type': 'application/json'})
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+
+    status, dados = post()
+    if status != 200 or not dados.startswith(b'{"cacheKey"'):
+        return status, dados
+    job = json.loads(dados)
+    sufixo = f"?cacheKey={job['cacheKey']}" + (f"&job={job['job']}" if job.get('job') else '')
+    limite = time.monotonic() + POLL_TIMEOUT_S
+    while time.monotonic() < limite:
+        status, dados = post(sufixo)
+        if status != 200 or b'"response"' in dados:
+            return status, dados
+        time.sleep(POLL_S)
+    return 599, b'timeout aguardando job em background'
+
+def executar(url: str, usuarios: int, duracao_s: float, fontes: Dict[str, Callable[[], dict]],
+             pesos: Dict[str, int], seed: int = 1) -> dict:
+    """Dispara 'usuarios' threads (conexão keep-alive cada) por 'duracao_s' segundos."""
+    alvo_url = urlparse(url)
+    amostras = defaultdict(list)   # alvo -> [(latência, classe)]
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao_s
+    nomes = list(fontes)
+
+    def vu(i: int):
+        rng = random.Random(seed + i)
+        conn = http.client.HTTPConnection(alvo_url.hostname, alvo_url.port or 80, timeout=60)
+        while time.monotonic() < fim:
+            alvo = rng.choices(nomes, weights=[pesos.get(n, 1) for n in nomes])[0]
+            corpo = json.dumps(fontes[alvo]())
+            t0 = time.perf_counter()
+            try:
+                status, dados = _requisitar(conn, corpo)
+                classe = _classificar(status, dados)
+            except Exception:
+                classe = 'conexao'
+                conn.close()
+                conn = http.client.HTTPConnection(alvo_url.hostname, alvo_url.port or 80, timeout=60)
+            with lock:
+                amostras[alvo].append((time.perf_counter() - t0, classe))
+        conn.close()
+
+    t0 = time.monotonic()
+    threads = [threading.Thread(target=vu, args=(i,), daemon=True) for i in range(usuarios)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    decorrido = time.monotonic() - t0
+
+    relatorio = {}
+    for alvo, lst in sorted(amostras.items()):
+        lat = sorted(x[0] for x in lst)
+        classes = defaultdict(int)
+        for _, c in lst:
+            classes[c] += 1
+        relatorio[alvo] = {
+            'n': len(lst),
+            'req_s': len(lst) / decorrido,
+            'p50_ms': _percentil(lat, 0.50) * 1000,
+            'p95_ms': _percentil(lat, 0.95) * 1000,
+            'p99_ms': _percentil(lat, 0.99) * 1000,
+            'ok': classes['ok'],
+            'erros_lock': classes['lock'],
+            'erros_http': classes['http'] + classes['conexao'],
+            'erros_app': classes['app'],
+        }
+    total = sum(r['n'] for r in relatorio.values())
+    return {'usuarios': usuarios, 'duracao_s': decorrido, 'total': total,
+            'req_s': total / decorrido if decorrido else 0.0, 'callbacks': relatorio}
+
+# -------------------------------
+# Gravação de payloads reais (MONITOR_GRAVAR_CARGA=arquivo.jsonl)
+# -------------------------------
+def instalar_gravador(app, caminho: str) -> None:
+    """Anexa cada POST /_dash-update-component (JSON) a 'caminho', para --replay."""
+    from flask import request
+    lock = threading.Lock()
+
+    @app.server.before_request
+    def _gravar():
+        if request.path.endswith('_dash-update-component') and request.method == 'POST':
+            with lock, open(caminho, 'a', encoding='utf-8') as f:
+                f.write(request.get_data(as_text=True).replace('\n', ' ') + '\n')
+
+def _fontes_replay(caminho: str, seed: int) -> Dict[str, Callable[[], dict]]:
+    por_output = defaultdict(list)
+    with open(caminho, encoding='utf-8') as f:
+        for linha in f:
+            if linha.strip():
+                corpo = json.loads(linha)
+                por_output[corpo['output']].append(corpo)
+    rng = random.Random(seed)
+    fontes = {}
+    for output, corpos in por_output.items():
+        nome = next((n for n, (trecho, _) in ALVOS.items() if trecho in output), output[:60])
+        fontes[nome] = (lambda cs: lambda: rng.choice(cs))(corpos)
+    return fontes
+
+# -------------------------------
+# Instância local (gunicorn) com banco semeado
+# -------------------------------
+def _aguardar(url: str, timeout_s: float = 60.0) -> None:
+    alvo = urlparse(url)
+    limite = time.monotonic() + timeout_s
+    while time.monotonic() < limite:
+        try:
+            c = http.client.HTTPConnection(alvo.hostname, alvo.port, timeout=2)
+            c.request('GET', '/_dash-dependencies')
+            if c.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"instância não respondeu em {url}")
+
+def iniciar_instancia(db_path: str, porta: int, workers: int, threads: int) -> subprocess.Popen:
+    env = dict(os.environ, MONITOR_DB_PATH=db_path, MONITOR_JOBS='0',
+               MONITOR_TAREFAS_DIR=os.path.join(os.path.dirname(db_path), 'tarefas'))
+    cmd = [sys.executable, '-m', 'gunicorn', 'app_layout:server', '-b', f'127.0.0.1:{porta}',
+           '-w', str(workers), '--threads', str(threads), '--timeout', '120', '--log-level', 'warning']
+    return subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+def _dependencias(url: str) -> List[dict]:
+    alvo = urlparse(url)
+    c = http.client.HTTPConnection(alvo.hostname, alvo.port, timeout=10)
+    c.request('GET', '/_dash-dependencies')
+    return json.loads(c.getresponse().read())
+
+def main():
+    ap = argparse.ArgumentParser(description="Teste de carga dos callbacks Dash")
+    ap.add_argument('--url', default='http://127.0.0.1:8050')
+    ap.add_argument('--iniciar', action='store_true', help="sobe gunicorn local com banco semeado")
+    ap.add_argument('--workers', type=int, default=2)
+    ap.add_argument('--threads', type=int, default=4)
+    ap.add_argument('--escala', default='1k', help="banco semeado (gerar_dados): 1k | 100k | 1m")
+    ap.add_argument('--dados', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data'))
+    ap.add_argument('--db', help="banco usado para escolher ids nos encerramentos (padrão: o semeado)")
+    ap.add_argument('--usuarios', type=int, default=8)
+    ap.add_argument('--duracao', type=float, default=20.0)
+    ap.add_argument('--replay', help="arquivo .jsonl gravado com MONITOR_GRAVAR_CARGA")
+    ap.add_argument('--somente', default='', help="alvos separados por vírgula (padrão: todos)")
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--saida', default='carga_report.json')
+    args = ap.parse_args()
+
+    proc = None
+    tmpdir = None
+    db_path = args.db
+    url = args.url
+    try:
+        if args.iniciar:
+            base = os.path.join(args.dados, f'{args.escala}.db')
+            if not os.path.exists(base):
+                gerar_dados.gerar(base, gerar_dados.ESCALAS.get(args.escala.lower()) or int(args.escala))
+            # cópia descartável: as escritas do teste não sujam o dataset do benchmark
+            tmpdir = tempfile.mkdtemp(prefix='carga_')
+            db_path = os.path.join(tmpdir, 'transacoes.db')
+            shutil.copy(base, db_path)
+            porta = urlparse(url).port or 8050
+            proc = iniciar_instancia(db_path, porta, args.workers, args.threads)
+        _aguardar(url)
+
+        if args.replay:
+            fontes = _fontes_replay(args.replay, args.seed)
+        else:
+            cen = _Cenario(db_path, args.seed)
+            deps = _dependencias(url)
+            fontes = {}
+            for nome, (trecho, _) in ALVOS.items():
+                dep = next((d for d in deps if trecho in d['output'] and not d.get('clientside_function')), None)
+                if dep is None:
+                    print(f"[CARGA] callback não encontrado: {nome}", file=sys.stderr)
+                    continue
+                fontes[nome] = (lambda d, n: lambda: montar_corpo(d, cen.valores(n)))(dep, nome)
+        if args.somente:
+            sel = {s.strip() for s in args.somente.split(',')}
+            fontes = {k: v for k, v in fontes.items() if k in sel}
+
+        rel = executar(url, args.usuarios, args.duracao, fontes,
+                       {n: p for n, (_, p) in ALVOS.items()}, seed=args.seed)
+        rel['config'] = {'url': url, 'workers': args.workers if args.iniciar else None,
+                         'threads': args.threads if args.iniciar else None,
+                         'escala': args.escala if args.iniciar else None, 'replay': args.replay}
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(rel, f, indent=2, ensure_ascii=False)
+
+        print(f"{'callback':<20}{'n':>7}{'req/s':>9}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'lock':>6}{'http':>6}{'app':>6}")
+        for nome, r in rel['callbacks'].items():
+            print(f"{nome:<20}{r['n']:>7}{r['req_s']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+                  f"{r['p99_ms']:>9.1f}{r['erros_lock']:>6}{r['erros_http']:>6}{r['erros_app']:>6}")
+        print(f"total: {rel['total']} req em {rel['duracao_s']:.1f}s ({rel['req_s']:.1f} req/s) -> {args.saida}")
+    finally:
+        if proc:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,17 @@ function NO_UPDATE_N(n) {
 let hasFocusedTicker = false;
 
 window.dash_clientside.clientside = {
+  // Seletor de conta: grava o cookie lido pelo servidor e recarrega a página
+  trocarConta: function (conta) {
+    const atual = (document.cookie.match(/(?:^|;\s*)monitor_conta=([^;]*)/) || [])[1];
+    if (!conta || decodeURIComponent(atual || 'principal') === conta) {
+      return window.dash_clientside.no_update;
+    }
+    document.cookie = 'monitor_conta=' + encodeURIComponent(conta) + '; path=/; max-age=31536000; SameSite=Lax';
+    window.location.reload();
+    return conta;
+  },
+
   // Dá foco no campo TICKER ao abrir o modal Nova
   focusTicker: function (is_open) {
     try {
@@ -44,6 +55,7 @@ window.dash_clientside.clientside = {
   },
 
   // Extrai OPERAÇÃO e DATA EXERC a partir do TICKER
+  // (dedução pela letra da série; o callback preencher_serie sobrescreve com o cadastro, se houver)
   // 2 outputs: nova-operacao.value, nova-data-exerc.value
   extractInfo: function (is_open, ticker) {
     if (!is_open) return NO_UPDATE_N(2);
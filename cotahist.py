@@ -0,0 +1,278 @@
+# cotahist.py
+#
+# Ingestão do COTAHIST da B3 (série histórica de cotações, texto de largura
+# fixa: 245 colunas por linha, CRLF ou LF):
+# - o arquivo é mapeado em memória (np.memmap) com um dtype estruturado que
+#   descreve o layout; filtros e conversões são operações vetoriais sobre as
+#   colunas, sem split de linha em Python (.ZIP é lido inteiro para a memória);
+# - séries de opção (TPMERC 070/080) dos tickers presentes em transacoes vão
+#   para a tabela cotacoes; o fechamento do ativo-objeto (mercado à vista, lote
+#   padrão, papel de maior volume da raiz no dia) completa fechamentos, usada
+#   por vencimentos.py;
+# - valor_atual de cada perna aberta passa a ser o último preço da série até o
+#   vencimento da perna.
+# Uso:
+#   python cotahist.py COTAHIST_A2024.TXT [--conta principal]
+#   python cotahist.py --bench [--linhas 1500000] [--conta principal]
+
+import os
+import json
+import time
+import logging
+import zipfile
+import argparse
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from database import (_connect, _iso_sql, _sql_inserir, _bump_data_version, init_database,
+                      listar_contas, na_conta)
+from dinheiro import PREMIO
+from metrics import medir, observar
+
+logging.basicConfig(level=logging.INFO)
+
+# Layout do registro 01 (cotação), na ordem do arquivo: (campo, largura).
+# Preços e strike em centavos (11 inteiros + 2 decimais), divididos por FATCOT.
+LAYOUT = [
+    ('tipreg', 2), ('data', 8), ('codbdi', 2), ('codneg', 12), ('tpmerc', 3), ('nomres', 12),
+    ('especi', 10), ('prazot', 3), ('modref', 4), ('preabe', 13), ('premax', 13), ('premin', 13),
+    ('premed', 13), ('preult', 13), ('preofc', 13), ('preofv', 13), ('totneg', 5), ('quatot', 18),
+    ('voltot', 18), ('preexe', 13), ('indopc', 1), ('datven', 8), ('fatcot', 7), ('ptoexe', 13),
+    ('codisi', 12), ('dismes', 3),
+]
+LARGURA = sum(w for _, w in LAYOUT)  # 245
+TPMERC_OPCAO = {b'070': 'Call', b'080': 'Put'}
+TPMERC_VISTA = b'010'
+CODBDI_LOTE_PADRAO = b'02'
+BENCH_LINHAS = 1_500_000  # ordem de grandeza de um ano de pregões
+
+def _dtype(registro: int) -> np.dtype:
+    """dtype do layout para registros de 'registro' bytes (linha + fim de linha); raiz* sobrepõem codneg."""
+    nomes, formatos, offsets, pos = [], [], [], 0
+    for nome, largura in LAYOUT:
+        nomes.append(nome)
+        formatos.append(f'S{largura}')
+        offsets.append(pos)
+        if nome == 'codneg':
+            # mesmos bytes como inteiros: isin numérico em vez de comparar strings
+            nomes += ['raiz', 'raiz_u4', 'codneg_u8']
+            formatos += ['S4', '<u4', '<u8']
+            offsets += [pos, pos, pos]
+        pos += largura
+    return np.dtype({'names': nomes, 'formats': formatos, 'offsets': offsets, 'itemsize': registro})
+
+def ler(caminho: str) -> np.ndarray:
+    """
+    Registros do arquivo como array estruturado de bytes (sem cópia para .TXT).
+    Uma última linha sem quebra (trailer) fica de fora.
+    """
+    if zipfile.is_zipfile(caminho):
+        with zipfile.ZipFile(caminho) as z:
+            dados = z.read(z.namelist()[0])
+        fim = dados.find(b'\n')
+        if fim < LARGURA:
+            raise ValueError(f"{caminho}: não parece um COTAHIST")
+        return np.frombuffer(dados, dtype=_dtype(fim + 1), count=len(dados) // (fim + 1))
+    with open(caminho, 'rb') as f:
+        inicio = f.read(LARGURA + 2)
+        tamanho = os.fstat(f.fileno()).st_size
+    fim = inicio.find(b'\n')
+    if fim < LARGURA:
+        raise ValueError(f"{caminho}: não parece um COTAHIST")
+    return np.memmap(caminho, dtype=_dtype(fim + 1), mode='r', shape=(tamanho // (fim + 1),))
+
+def _em(coluna: np.ndarray, valores: Iterable[str], largura: int) -> np.ndarray:
+    alvo = np.array(sorted({v.upper().ljust(largura)[:largura] for v in valores}), dtype=f'S{largura}')
+    return np.isin(coluna, alvo)
+
+def _chaves(valores: Iterable[str], largura: int, tipo: str) -> np.ndarray:
+    """Primeiros 'largura' bytes (com espaços à direita) de cada texto, lidos como inteiro 'tipo'."""
+    b = b''.join(sorted({v.upper().ljust(largura)[:largura].encode('ascii') for v in valores}))
+    return np.frombuffer(b, dtype=tipo)
+
+def _iso(coluna: np.ndarray) -> List[str]:
+    """'AAAAMMDD' (S8) -> 'AAAA-MM-DD', montado byte a byte em bloco."""
+    b = np.ascontiguousarray(coluna).view(np.uint8).reshape(-1, 8)
+    out = np.full((len(b), 10), ord('-'), dtype=np.uint8)
+    out[:, 0:4], out[:, 5:7], out[:, 8:10] = b[:, 0:4], b[:, 4:6], b[:, 6:8]
+    return out.view('S10').ravel().astype('U10').tolist()
+
+def _texto(coluna: np.ndarray) -> List[str]:
+    return np.strings.strip(coluna.astype('U')).tolist()
+
+def _int(coluna: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(coluna).astype(np.int64)
+
+def _cotacao(regs: np.ndarray) -> np.ndarray:
+    return (regs['tipreg'] == b'01') & np.isin(regs['tpmerc'], list(TPMERC_OPCAO))
+
+def opcoes(regs: np.ndarray, tickers: Optional[Iterable[str]] = None) -> np.ndarray:
+    """Cotações (registro 01) de séries de opção, opcionalmente só dos tickers dados."""
+    if tickers is None:
+        return regs[_cotacao(regs)]
+    # pré-filtro pelos 8 primeiros bytes do código (inteiro), o mais seletivo;
+    # o resto só nos candidatos
+    tickers = list(tickers)
+    sel = regs[np.isin(regs['codneg_u8'], _chaves(tickers, 8, '<u8'))]
+    return sel[_cotacao(sel) & _em(sel['codneg'], tickers, 12)]
+
+def vista(regs: np.ndarray, raizes: Iterable[str]) -> np.ndarray:
+    """Fechamento por (raiz, data): papel à vista de lote padrão com maior volume no dia."""
+    # à vista é pequena parte do arquivo (opções das mesmas raízes dominam): filtra o mercado primeiro
+    sel = regs[regs['tpmerc'] == TPMERC_VISTA]
+    sel = sel[(sel['tipreg'] == b'01') & (sel['codbdi'] == CODBDI_LOTE_PADRAO)
+              & np.isin(sel['raiz_u4'], _chaves(raizes, 4, '<u4'))]
+    if not len(sel):
+        return sel
+    sel = sel[np.lexsort((_int(sel['voltot']), sel['data'], sel['raiz']))]
+    chave = np.char.add(sel['raiz'], sel['data'])
+    ultimo_do_grupo = np.append(chave[1:] != chave[:-1], True)
+    return sel[ultimo_do_grupo]
+
+def _linhas_cotacoes(sel: np.ndarray) -> list:
+    fator = np.maximum(_int(sel['fatcot']), 1)
+    precos = {campo: (_int(sel[col]) / fator / 100.0).tolist()
+              for campo, col in (('abertura', 'preabe'), ('minimo', 'premin'), ('maximo', 'premax'),
+                                 ('medio', 'premed'))}
+    # centavos -> 1e-4 R$, arredondado para o inteiro mais próximo
+    ultimo_e4 = ((_int(sel['preult']) * (PREMIO // 100) * 2 + fator) // (2 * fator)).tolist()
+    operacao = [TPMERC_OPCAO[t] for t in sel['tpmerc'].tolist()]
+    return list(zip(_texto(sel['codneg']), _iso(sel['data']), operacao,
+                    (_int(sel['preexe']) / 100.0).tolist(), _iso(sel['datven']),
+                    precos['abertura'], precos['minimo'], precos['maximo'], precos['medio'],
+                    _int(sel['totneg']).tolist(), _int(sel['quatot']).tolist(), ultimo_e4))
+
+_COLUNAS_COTACOES = ('ticker', 'data', 'operacao', 'strike', 'vencimento', 'abertura', 'minimo',
+                     'maximo', 'medio', 'negocios', 'quantidade', 'ultimo_e4')
+
+@medir('db')
+def importar(regs: np.ndarray) -> Dict[str, int]:
+    """
+    Carrega, na conta ativa, as cotações das séries em transacoes e os
+    fechamentos das suas raízes, e atualiza valor_atual das pernas abertas.
+    """
+    init_database()
+    with _connect() as conn:
+        c = conn.cursor()
+        tickers = [t for t, in c.execute("SELECT DISTINCT ticker FROM transacoes WHERE ticker IS NOT NULL")]
+        sel = opcoes(regs, tickers) if tickers else regs[:0]
+        spot = vista(regs, {t[:4] for t in tickers}) if tickers else regs[:0]
+        c.executemany(_sql_inserir('cotacoes', _COLUNAS_COTACOES, 'REPLACE'), _linhas_cotacoes(sel))
+        # fechamento informado à mão (vencimentos.py --fechamento) prevalece
+        c.executemany("INSERT OR IGNORE INTO fechamentos (raiz, data, preco, ativo) VALUES (?,?,?,?)",
+                      zip(_texto(spot['raiz']), _iso(spot['data']),
+                          (_int(spot['preult']) / np.maximum(_int(spot['fatcot']), 1) / 100.0).tolist(),
+                          _texto(spot['codneg'])))
+        exerc = _iso_sql('transacoes.data_exerc')
+        c.execute(f"""UPDATE transacoes
+                      SET valor_atual = (SELECT q.ultimo_e4 / {PREMIO}.0 FROM cotacoes q
+                                         WHERE q.ticker = transacoes.ticker AND q.data <= {exerc}
+                                         ORDER BY q.data DESC LIMIT 1)
+                      WHERE ticker IN (SELECT value FROM json_each(?))
+                        AND EXISTS (SELECT 1 FROM cotacoes q
+                                    WHERE q.ticker = transacoes.ticker AND q.data <= {exerc})""",
+                  (json.dumps(sorted(set(_texto(sel['codneg'])))),))
+        atualizadas = c.rowcount
+        conn.commit()
+    if len(sel) or len(spot):
+        _bump_data_version()
+    res = {'cotacoes': int(len(sel)), 'fechamentos': int(len(spot)), 'pernas_atualizadas': atualizadas}
+    logging.info(f"[COTAHIST] {res}")
+    return res
+
+def carregar(caminho: str, contas: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """Lê o arquivo uma vez e importa em cada conta (padrão: todas)."""
+    t0 = time.perf_counter()
+    regs = ler(caminho)
+    observar('cotahist', 'ler', time.perf_counter() - t0, linhas=len(regs))
+    res = {}
+    for conta in contas or listar_contas():
+        with na_conta(conta):
+            res[conta] = importar(regs)
+    return res
+
+# -------------------------------
+# Benchmark: arquivo sintético com o layout do COTAHIST
+# -------------------------------
+def _campo(valores: np.ndarray, largura: int) -> np.ndarray:
+    return np.strings.zfill(valores.astype(f'U{largura}'), largura).astype(f'S{largura}')
+
+def gerar_sintetico(caminho: str, linhas: int, tickers: Iterable[str] = (), seed: int = 42) -> str:
+    """
+    Arquivo no layout do COTAHIST (CRLF) com 'linhas' cotações em ~248 pregões:
+    ~85% opções (incluindo os tickers dados), o resto à vista; com header e trailer.
+    """
+    rng = np.random.default_rng(seed)
+    raizes = ['PETR', 'VALE', 'BBAS', 'ITUB', 'BBDC', 'ABEV', 'BOVA', 'MGLU', 'WEGE', 'PRIO']
+    series = [f"{r}{s}{k}" for r in raizes for s in 'ABCDEFGHIJKLMNOPQRSTUVWX' for k in range(100, 600, 5)]
+    pool = np.array(sorted(set(series) | {t.upper() for t in tickers}), dtype='U12')
+    acoes = np.array([f"{r}{c}" for r in raizes for c in ('3', '4')], dtype='U12')
+    pregoes = np.datetime64('2024-01-02') + np.sort(rng.choice(365, 248, replace=False)).astype('timedelta64[D]')
+
+    dt = np.dtype([(n, f'S{w}') for n, w in LAYOUT] + [('eol', 'S2')])
+    arr = np.zeros(linhas, dtype=dt)
+    for nome, largura in LAYOUT:
+        arr[nome] = b' ' * largura
+    eh_opcao = rng.random(linhas) < 0.85
+    codneg = np.where(eh_opcao, pool[rng.integers(0, len(pool), linhas)], acoes[rng.integers(0, len(acoes), linhas)])
+    arr['tipreg'] = b'01'
+    arr['data'] = np.strings.replace(np.sort(rng.choice(pregoes, linhas)).astype('U10'), '-', '').astype('S8')
+    arr['codbdi'] = np.where(eh_opcao, b'78', b'02')
+    arr['codneg'] = np.strings.ljust(codneg, 12).astype('S12')
+    letra = np.array([ord(t[4]) if len(t) > 4 else 65 for t in codneg.tolist()])
+    arr['tpmerc'] = np.where(~eh_opcao, TPMERC_VISTA, np.where(letra < ord('M'), b'070', b'080'))
+    preco = np.where(eh_opcao, rng.integers(1, 1500, linhas), rng.integers(800, 13000, linhas))
+    for col in ('preabe', 'premax', 'premin', 'premed', 'preult', 'preofc', 'preofv'):
+        arr[col] = _campo(np.maximum(preco + rng.integers(-5, 6, linhas), 1), 13)
+    arr['totneg'] = _campo(rng.integers(1, 9999, linhas), 5)
+    arr['quatot'] = _campo(rng.integers(100, 10**6, linhas), 18)
+    arr['voltot'] = _campo(rng.integers(10**4, 10**10, linhas), 18)
+    arr['preexe'] = np.where(eh_opcao, _campo(rng.integers(500, 15000, linhas), 13), b'0' * 13)
+    arr['datven'] = np.where(eh_opcao, b'20241220', b'99991231')
+    arr['fatcot'] = b'0000001'
+    arr['eol'] = b'\r\n'
+    with open(caminho, 'wb') as f:
+        f.write(b'00COTAHIST.2024BOVESPA 20241231'.ljust(LARGURA) + b'\r\n')
+        f.write(arr.tobytes())
+        f.write(b'99COTAHIST.2024BOVESPA 20241231' + f"{linhas + 2:011d}".encode().ljust(LARGURA - 31) + b'\r\n')
+    return caminho
+
+def bench(linhas: int, conta: Optional[str] = None) -> dict:
+    """Gera um ano sintético (com os tickers da conta) e mede leitura, filtro e conversão."""
+    with na_conta(conta or listar_contas()[0]):
+        with _connect() as conn:
+            tickers = [t for t, in conn.execute("SELECT DISTINCT ticker FROM transacoes")]
+    caminho = os.path.join(os.environ.get('TMPDIR', '/tmp'), f'cotahist_bench_{linhas}.txt')
+    if not os.path.exists(caminho):
+        gerar_sintetico(caminho, linhas, tickers)
+    tempos = {}
+    t0 = time.perf_counter()
+    regs = ler(caminho)
+    tempos['ler_s'] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    sel = opcoes(regs, tickers)
+    spot = vista(regs, {t[:4] for t in tickers})
+    tempos['filtrar_s'] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    n = len(_linhas_cotacoes(sel))
+    tempos['converter_s'] = time.perf_counter() - t0
+    return {'arquivo': caminho, 'mb': os.path.getsize(caminho) / 1e6, 'registros': int(len(regs)),
+            'cotacoes': n, 'fechamentos': int(len(spot)), **tempos}
+
+def main():
+    ap = argparse.ArgumentParser(description="Importa cotações de opções do COTAHIST da B3")
+    ap.add_argument('arquivo', nargs='?', help="COTAHIST_AAAAA.TXT ou .ZIP")
+    ap.add_argument('--conta', default=None, help="padrão: todas")
+    ap.add_argument('--bench', action='store_true', help="mede a ingestão num ano sintético")
+    ap.add_argument('--linhas', type=int, default=BENCH_LINHAS)
+    args = ap.parse_args()
+    if args.bench:
+        print(bench(args.linhas, args.conta))
+    elif args.arquivo:
+        print(carregar(args.arquivo, [args.conta] if args.conta else None))
+    else:
+        ap.error("informe o arquivo ou --bench")
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,126 @@
 # database.py
 
 import sqlite3
+import numpy as np
 import pandas as pd
 import datetime as dt
 import logging
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import quote
 import os
+import re
+import json
+from functools import lru_cache
+
+from metrics import medir
+from esquema import TRANSACOES, ENCERRADAS, tipar
+from dinheiro import CENTAVOS, PREMIO, premio, fluxo, reais
+from dominio import PernaAberta, PernaEncerrada, EventoLog, Estrutura, de_numpy, papel_perna, selecionar
 
 logging.basicConfig(level=logging.INFO)
 
-# Path absoluto (robusto ao cwd)
-DB_PATH = os.path.join(os.path.dirname(__file__), 'transacoes.db')
+# Path absoluto (robusto ao cwd); MONITOR_DB_PATH aponta para outro banco (ex.: dados sintéticos)
+DB_PATH = os.environ.get('MONITOR_DB_PATH') or os.path.join(os.path.dirname(__file__), 'transacoes.db')
+
+# Multi-conta: um arquivo SQLite por conta (<conta>.db em CONTAS_DIR), de modo que
+# escritas numa conta nunca bloqueiam outra. A conta 'principal' é o DB_PATH.
+# A conta ativa é por requisição/thread (ContextVar; ver usar_conta).
+CONTAS_DIR = os.environ.get('MONITOR_CONTAS_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'contas')
+CONTA_PADRAO = 'principal'
+_CONTA: ContextVar[str] = ContextVar('monitor_conta', default=CONTA_PADRAO)
+_RE_CONTA = re.compile(r'^[A-Za-z0-9_-]{1,40}$')
+_MAX_ATTACH = 10  # SQLITE_MAX_ATTACHED padrão
+
+def _caminho_conta(conta: str) -> str:
+    if not conta or conta == CONTA_PADRAO:
+        return DB_PATH
+    if not _RE_CONTA.match(conta):
+        raise ValueError(f"nome de conta inválido: {conta!r}")
+    return os.path.join(CONTAS_DIR, f'{conta}.db')
+
+def listar_contas() -> List[str]:
+    """'principal' + contas com arquivo em CONTAS_DIR."""
+    try:
+        extras = sorted(f[:-3] for f in os.listdir(CONTAS_DIR)
+                        if f.endswith('.db') and _RE_CONTA.match(f[:-3]) and f[:-3] != CONTA_PADRAO)
+    except FileNotFoundError:
+        extras = []
+    return [CONTA_PADRAO] + extras
+
+def conta_atual() -> str:
+    return _CONTA.get()
+
+def usar_conta(conta: Optional[str]) -> str:
+    """Roteia as conexões deste contexto para 'conta' (desconhecida/vazia -> principal)."""
+    if not conta or conta not in listar_contas():
+        conta = CONTA_PADRAO
+    _CONTA.set(conta)
+    return conta
+
+@contextmanager
+def na_conta(conta: str):
+    """Bloco executado na conta indicada (jobs, scripts)."""
+    token = _CONTA.set(conta)
+    try:
+        yield conta
+    finally:
+        _CONTA.reset(token)
+
+def _db_path() -> str:
+    """Roteador: arquivo da conta ativa."""
+    return _caminho_conta(_CONTA.get())
+
+def criar_conta(conta: str) -> str:
+    """Cria o arquivo da conta (com o schema) e retorna o caminho."""
+    caminho = _caminho_conta(conta)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with na_conta(conta):
+        init_database()
+    logging.info(f"[DB] Conta '{conta}' em {caminho}")
+    return caminho
+
+def _iso_sql(col: str) -> str:
+    """Expressão SQL que converte uma coluna 'DD/MM/YYYY' em 'YYYY-MM-DD' (ordenável/indexável)."""
+    return f"(substr({col},7,4)||'-'||substr({col},4,2)||'-'||substr({col},1,2))"
+
+_WAL_LIMITE = int(float(os.environ.get('MONITOR_WAL_MAX_MB', '64')) * 1e6)
+
+# Gancho de rastreio: recebe cada comando SQL das conexões abertas depois de ligado (ver planos.py)
+_RASTREIO = None
+
+def rastrear_sql(fn) -> None:
+    """Liga (fn(sql)) ou desliga (None) o rastreio dos comandos SQL das novas conexões."""
+    global _RASTREIO
+    _RASTREIO = fn
 
 def _connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES, timeout=5.0)
+    conn = sqlite3.connect(_db_path(), detect_types=sqlite3.PARSE_DECLTYPES, timeout=5.0)
+    if _RASTREIO is not None:
+        conn.set_trace_callback(_RASTREIO)
     try:
         conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute("PRAGMA busy_timeout=5000;")
+        conn.execute(f"PRAGMA journal_size_limit={_WAL_LIMITE};")  # -wal volta a este tamanho após checkpoint
         conn.execute("PRAGMA foreign_keys=OFF;")  # simples/local
     except Exception as e:
         logging.warning(f"[DB] PRAGMA falhou: {e}")
     return conn
 
+@contextmanager
+def _tx(conn: Optional[sqlite3.Connection] = None):
+    """
+    Conexão para uma escrita: própria (commit ao sair) ou a do chamador,
+    que agrupa várias escritas numa transação e faz o commit ele mesmo.
+    """
+    if conn is not None:
+        yield conn
+        return
+    with _connect() as own:
+        yield own
+
+@medir('db')
 def init_database() -> None:
     logging.info("[DB] Inicializando banco e migrações")
     with _connect() as conn:
@@ -44,7 +143,9 @@ def init_database() -> None:
             valor_atual REAL,       -- preço unitário atual via Provider (opcional)
             estrutura_bundle TEXT,  -- agrupamento (2-em-1), opcional
             perna_ordem INTEGER,    -- ordem da perna no bundle/estrutura, opcional
-            perna_papel TEXT        -- LONG_CALL/SHORT_CALL/LONG_PUT/SHORT_PUT, opcional
+            perna_papel TEXT,       -- LONG_CALL/SHORT_CALL/LONG_PUT/SHORT_PUT, opcional
+            valor_opcao_e4 INTEGER, -- valor_opcao em 1e-4 R$ (ver dinheiro.py)
+            valor_operacao_cent INTEGER  -- valor_operacao em centavos
         )''')
 
         # Garante colunas novas em transacoes (migração idempotente)
@@ -60,11 +161,16 @@ def init_database() -> None:
             c.execute("ALTER TABLE transacoes ADD COLUMN perna_ordem INTEGER")
         if 'perna_papel' not in cols:
             c.execute("ALTER TABLE transacoes ADD COLUMN perna_papel TEXT")
+        _migrar_ponto_fixo(c, 'transacoes', cols)
 
         # índices úteis
         c.execute("CREATE INDEX IF NOT EXISTS idx_tx_ticker ON transacoes (ticker)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_tx_dataop ON transacoes (data_op)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_tx_estr_bundle ON transacoes (estrutura_bundle)")
+        # estruturas sem bundle (legado): pernas por estrutura já na ordem de entrada (rowid = id no fim)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tx_estrutura ON transacoes (estrutura, perna_ordem)")
+        # Pernas vencidas (liquidação automática, ver vencimentos.py)
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_tx_exerc_iso ON transacoes ({_iso_sql('data_exerc')})")
 
         # log_alteracoes
         c.execute('''CREATE TABLE IF NOT EXISTS log_alteracoes (
@@ -76,6 +182,32 @@ def init_database() -> None:
             tipo_alteracao TEXT,
             data_alteracao TEXT
         )''')
+        # Replay por transação e por período (datas 'DD/MM/YYYY' indexadas como ISO)
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_log_tx_data ON log_alteracoes (transacao_id, {_iso_sql('data_alteracao')})")
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_log_data ON log_alteracoes ({_iso_sql('data_alteracao')})")
+
+        # checkpoints da carteira (ver historico.py): posições abertas ao fim de data_ref
+        c.execute('''CREATE TABLE IF NOT EXISTS checkpoints (
+            data_ref TEXT PRIMARY KEY,  -- 'YYYY-MM-DD'
+            n_posicoes INTEGER,
+            criado_em TEXT
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS checkpoint_posicoes (
+            data_ref TEXT,
+            transacao_id INTEGER,
+            ticker TEXT,
+            operacao TEXT,
+            direcao TEXT,
+            strike REAL,
+            quantidade INTEGER,
+            valor_opcao REAL,
+            data_exerc TEXT,
+            data_op TEXT,
+            estrutura TEXT,
+            rolagem TEXT,
+            estrutura_bundle TEXT,
+            PRIMARY KEY (data_ref, transacao_id)
+        ) WITHOUT ROWID''')
 
         # encerradas
         c.execute('''CREATE TABLE IF NOT EXISTS encerradas (
@@ -96,7 +228,12 @@ def init_database() -> None:
             valor_encerr REAL,          -- unitário encerramento
             valor_oper_encerr REAL,     -- cash flow do encerramento
             g_p REAL,                   -- P&L realizado (parte encerrada)
-            perdas_invest REAL          -- reservado
+            perdas_invest REAL,         -- reservado
+            valor_opcao_e4 INTEGER,     -- ponto fixo (dinheiro.py): prêmios em 1e-4 R$,
+            valor_operacao_cent INTEGER, -- fluxos e G/P em centavos
+            valor_encerr_e4 INTEGER,
+            valor_oper_encerr_cent INTEGER,
+            g_p_cent INTEGER
         )''')
 
         # migra colunas se faltarem em encerradas
@@ -111,6 +248,10 @@ def init_database() -> None:
         # Nova coluna para motivo do encerramento (fase 1)
         if 'motivo' not in ecols:
             c.execute("ALTER TABLE encerradas ADD COLUMN motivo TEXT")
+        # Bundle copiado da abertura no encerramento (filtros/opções de relatório)
+        if 'estrutura_bundle' not in ecols:
+            c.execute("ALTER TABLE encerradas ADD COLUMN estrutura_bundle TEXT")
+        _migrar_ponto_fixo(c, 'encerradas', ecols)
 
         c.execute("CREATE INDEX IF NOT EXISTS idx_enc_idorigem ON encerradas (id_origem)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_enc_dataenc ON encerradas (data_encerr)")
@@ -118,22 +259,275 @@ def init_database() -> None:
         c.execute("CREATE INDEX IF NOT EXISTS idx_enc_ticker ON encerradas (ticker)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_enc_direcao ON encerradas (direcao)")
         c.execute("CREATE INDEX IF NOT EXISTS idx_enc_operacao ON encerradas (operacao)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_enc_bundle ON encerradas (estrutura_bundle)")
+        # Filtro de período dos relatórios (data_encerr 'DD/MM/YYYY' indexada como ISO)
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_enc_data_iso ON encerradas ({_iso_sql('data_encerr')})")
+
+        # manifesto das partições anuais arquivadas (ver arquivo.py)
+        c.execute('''CREATE TABLE IF NOT EXISTS particoes (
+            tabela TEXT,            -- 'encerradas' | 'log_alteracoes'
+            ano INTEGER,
+            arquivo TEXT,           -- nome do arquivo em <dir do banco>/arquivo/
+            data_min TEXT,          -- 'YYYY-MM-DD'
+            data_max TEXT,
+            n_linhas INTEGER,
+            total REAL,             -- soma de g_p (encerradas)
+            corte TEXT,             -- corte do último arquivamento ('YYYY-MM-DD')
+            atualizado_em TEXT,
+            total_cent INTEGER,     -- total em centavos
+            PRIMARY KEY (tabela, ano)
+        )''')
+        _migrar_ponto_fixo(c, 'particoes')
+
+        # rolagens: perna encerrada -> perna(s) que a substituíram (ver rolar)
+        c.execute('''CREATE TABLE IF NOT EXISTS rolagens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            origem_id INTEGER,      -- perna rolada (transacoes.id / encerradas.id_origem)
+            destino_id INTEGER,     -- perna nova (transacoes.id)
+            encerrada_id INTEGER,   -- parte encerrada na rolagem (encerradas.id)
+            cadeia_id INTEGER,      -- primeira perna da cadeia
+            data_rolagem TEXT       -- 'DD/MM/YYYY'
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rol_origem ON rolagens (origem_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rol_destino ON rolagens (destino_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rol_cadeia ON rolagens (cadeia_id)")
+        # G/P acumulado por cadeia, somado a cada encerramento de perna da cadeia
+        # (continua certo depois que as encerradas antigas vão para o arquivo)
+        c.execute('''CREATE TABLE IF NOT EXISTS cadeias_rolagem (
+            cadeia_id INTEGER PRIMARY KEY,
+            n_rolagens INTEGER,
+            g_p REAL,
+            atualizado_em TEXT,
+            g_p_cent INTEGER
+        )''')
+        _migrar_ponto_fixo(c, 'cadeias_rolagem')
+
+        # fechamento diário do ativo-objeto por raiz (PETR, VALE...): liquidação no vencimento
+        c.execute('''CREATE TABLE IF NOT EXISTS fechamentos (
+            raiz TEXT,              -- 4 primeiras letras do ticker da opção
+            data TEXT,              -- 'YYYY-MM-DD'
+            preco REAL,
+            ativo TEXT,             -- código do ativo (ex.: PETR4), informativo
+            PRIMARY KEY (raiz, data)
+        )''')
+        # cotação diária das séries de opção (COTAHIST da B3, ver cotahist.py): alimenta valor_atual
+        c.execute('''CREATE TABLE IF NOT EXISTS cotacoes (
+            ticker TEXT,
+            data TEXT,              -- 'YYYY-MM-DD' (pregão)
+            operacao TEXT,          -- 'Call'/'Put'
+            strike REAL,
+            vencimento TEXT,        -- 'YYYY-MM-DD'
+            abertura REAL,
+            minimo REAL,
+            maximo REAL,
+            medio REAL,
+            ultimo REAL,
+            negocios INTEGER,
+            quantidade INTEGER,
+            ultimo_e4 INTEGER,      -- ultimo em 1e-4 R$ (ver dinheiro.py)
+            PRIMARY KEY (ticker, data)
+        )''')
+        # cadastro de séries de opção (arquivo de referência, ver series.py): lookup no modal Nova
+        c.execute('''CREATE TABLE IF NOT EXISTS series (
+            ticker TEXT PRIMARY KEY,
+            ativo TEXT,             -- ativo-objeto (ex.: PETR4) ou a raiz, se o arquivo não informa
+            strike REAL,
+            vencimento TEXT,        -- 'YYYY-MM-DD'
+            tipo TEXT,              -- 'Call'/'Put'
+            estilo TEXT,            -- 'A' americana / 'E' europeia / NULL
+            atualizado_em TEXT
+        )''')
+
+        _init_busca_ticker(c)
         conn.commit()
+        # partições arquivadas antes de uma migração das tabelas acima
+        _migrar_particoes(conn)
     logging.info("[DB] Banco pronto")
 
+# Colunas inteiras (ver dinheiro.py): coluna -> (espelho REAL, escala)
+_PONTO_FIXO = {
+    'transacoes': {'valor_opcao_e4': ('valor_opcao', PREMIO),
+                   'valor_operacao_cent': ('valor_operacao', CENTAVOS)},
+    'encerradas': {'valor_opcao_e4': ('valor_opcao', PREMIO),
+                   'valor_operacao_cent': ('valor_operacao', CENTAVOS),
+                   'valor_encerr_e4': ('valor_encerr', PREMIO),
+                   'valor_oper_encerr_cent': ('valor_oper_encerr', CENTAVOS),
+                   'g_p_cent': ('g_p', CENTAVOS)},
+    'cadeias_rolagem': {'g_p_cent': ('g_p', CENTAVOS)},
+    'particoes': {'total_cent': ('total', CENTAVOS)},
+    'cotacoes': {'ultimo_e4': ('ultimo', PREMIO)},
+}
+
+def _migrar_ponto_fixo(c: sqlite3.Cursor, tabela: str, cols: Optional[List[str]] = None,
+                       schema: str = 'main') -> None:
+    """
+    Cria as colunas inteiras que faltam e as preenche a partir do espelho REAL
+    (arredondado a 6 casas antes: 0.285 * 100 = 28.4999...), que é reescrito
+    como inteiro / escala. Só roda quando a coluna é criada. schema: 'main'
+    ou uma partição anexada (ver _migrar_particao).
+    """
+    if cols is None:
+        c.execute(f"PRAGMA {schema}.table_info({tabela})")
+        cols = [row[1] for row in c.fetchall()]
+    for col, (espelho, escala) in _PONTO_FIXO[tabela].items():
+        if col in cols:
+            continue
+        c.execute(f"ALTER TABLE {schema}.{tabela} ADD COLUMN {col} INTEGER")
+        c.execute(f"""UPDATE {schema}.{tabela}
+                      SET {col} = CAST(ROUND(ROUND({espelho} * {escala}, 6)) AS INTEGER),
+                          {espelho} = ROUND(ROUND({espelho} * {escala}, 6)) / {escala}.0
+                      WHERE {espelho} IS NOT NULL""")
+        logging.info(f"[DB] {schema}.{tabela}.{col}: {c.rowcount} linhas migradas para ponto fixo")
+
+def _migrar_particao(c: sqlite3.Cursor, schema: str, tabela: str) -> List[str]:
+    """
+    Iguala as colunas de <schema>.<tabela> (partição anexada) às de main:
+    colunas de ponto fixo com backfill do espelho REAL, demais como NULL.
+    Retorna as colunas de main, na ordem da tabela.
+    """
+    c.execute(f"PRAGMA main.table_info({tabela})")
+    info = [(r[1], r[2]) for r in c.fetchall()]
+    c.execute(f"PRAGMA {schema}.table_info({tabela})")
+    existentes = [r[1] for r in c.fetchall()]
+    if tabela in _PONTO_FIXO:
+        _migrar_ponto_fixo(c, tabela, existentes, schema)
+        existentes += list(_PONTO_FIXO[tabela])
+    for nome, tipo in info:
+        if nome not in existentes:
+            c.execute(f"ALTER TABLE {schema}.{tabela} ADD COLUMN {nome} {tipo}")
+    return [nome for nome, _ in info]
+
+_PARTICOES_MIGRADAS = set()
+
+def _migrar_particoes(conn: sqlite3.Connection) -> None:
+    """Partições criadas antes de uma migração de main ganham as colunas novas (uma vez por arquivo/processo)."""
+    c = conn.cursor()
+    c.execute("SELECT DISTINCT tabela, arquivo FROM particoes")
+    pendentes = [(t, os.path.join(_dir_particoes(), a)) for t, a in c.fetchall()]
+    pendentes = [(t, p) for t, p in pendentes if (t, p) not in _PARTICOES_MIGRADAS and os.path.exists(p)]
+    if not pendentes:
+        return
+    conn.commit()  # ATTACH não pode rodar dentro de uma transação
+    for tabela, caminho in pendentes:
+        c.execute("ATTACH DATABASE ? AS arq_mig", (caminho,))
+        try:
+            _migrar_particao(c, 'arq_mig', tabela)
+            conn.commit()
+        finally:
+            c.execute("DETACH DATABASE arq_mig")
+        _PARTICOES_MIGRADAS.add((tabela, caminho))
+
+# -------------------------------
+# Versão dos dados (invalidação de caches)
+# -------------------------------
+_WRITE_SEQ = 0
+
+def _bump_data_version() -> None:
+    global _WRITE_SEQ
+    _WRITE_SEQ += 1
+
+def data_version() -> tuple:
+    """
+    Token barato que muda a cada escrita.
+    - _WRITE_SEQ cobre as escritas deste processo;
+    - mtime/tamanho do banco e do -wal cobrem commits de outros workers.
+    """
+    caminho = _db_path()
+    partes = [caminho, _WRITE_SEQ]
+    for p in (caminho, caminho + '-wal'):
+        try:
+            st = os.stat(p)
+            partes.extend((st.st_mtime_ns, st.st_size))
+        except OSError:
+            partes.extend((0, 0))
+    return tuple(partes)
+
+# Busca de ticker disponível via FTS5 trigram? (depende do build do SQLite)
+_FTS_OK = True
+
+def _init_busca_ticker(c: sqlite3.Cursor) -> None:
+    """
+    Índice de busca de tickers:
+    - 'tickers': tickers distintos (maiúsculos) de transacoes/encerradas, mantidos por triggers;
+    - 'ticker_fts': FTS5 trigram (content externo) sobre 'tickers' para busca por substring.
+    Na primeira criação normaliza os tickers já gravados e faz o backfill.
+    """
+    global _FTS_OK
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='tickers'")
+    novo = c.fetchone() is None
+
+    c.execute('''CREATE TABLE IF NOT EXISTS tickers (
+        id INTEGER PRIMARY KEY,
+        ticker TEXT NOT NULL UNIQUE
+    )''')
+    try:
+        c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS ticker_fts
+                     USING fts5(ticker, content='tickers', content_rowid='id', tokenize='trigram')""")
+        c.execute("""CREATE TRIGGER IF NOT EXISTS trg_tickers_fts AFTER INSERT ON tickers BEGIN
+                         INSERT INTO ticker_fts(rowid, ticker) VALUES (NEW.id, NEW.ticker);
+                     END""")
+    except sqlite3.OperationalError as e:
+        _FTS_OK = False
+        logging.warning(f"[DB] FTS5 trigram indisponível, busca por substring sem índice: {e}")
+
+    for tabela in ('transacoes', 'encerradas'):
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_{tabela}_ticker_busca AFTER INSERT ON {tabela} BEGIN
+                          INSERT OR IGNORE INTO tickers(ticker) VALUES (NEW.ticker);
+                      END""")
+
+    if novo:
+        # Armazenamento normalizado: o índice de prefixo (idx_tx_ticker/idx_enc_ticker) assume maiúsculas
+        for tabela in ('transacoes', 'encerradas'):
+            c.execute(f"UPDATE {tabela} SET ticker=UPPER(TRIM(ticker)) WHERE ticker <> UPPER(TRIM(ticker))")
+        c.execute("""INSERT OR IGNORE INTO tickers(ticker)
+                     SELECT ticker FROM transacoes WHERE ticker IS NOT NULL
+                     UNION SELECT ticker FROM encerradas WHERE ticker IS NOT NULL""")
+        logging.info("[DB] Índice de busca de tickers criado")
+
+def _ticker_filter(busca: Optional[str]) -> Tuple[str, list]:
+    """
+    Cláusula WHERE (sem o 'WHERE') para a busca de ticker, ou ('', []) se vazia.
+    - até 2 caracteres: prefixo por faixa (ticker >= 'PE' AND ticker < 'PF'), via idx_*_ticker;
+    - 3+ caracteres: substring via ticker_fts (trigram) e depois idx_*_ticker.
+    """
+    termo = re.sub(r'[^A-Z0-9]', '', str(busca or '').upper())
+    if not termo:
+        return '', []
+    if len(termo) < 3:
+        fim = termo[:-1] + chr(ord(termo[-1]) + 1)
+        return 'ticker >= ? AND ticker < ?', [termo, fim]
+    if _FTS_OK:
+        return ('ticker IN (SELECT ticker FROM ticker_fts WHERE ticker_fts MATCH ?)',
+                [f'"{termo}"'])
+    return 'ticker IN (SELECT ticker FROM tickers WHERE ticker LIKE ?)', [f'%{termo}%']
+
 def _hoje_str() -> str:
     return dt.datetime.now().strftime('%d/%m/%Y')
 
-def get_transactions() -> pd.DataFrame:
+def _invalidar_checkpoints(c: sqlite3.Cursor, data_evento: str) -> None:
+    """Evento datado em data_evento ('DD/MM/YYYY') torna obsoletos os checkpoints >= essa data."""
+    data_iso = f"{data_evento[6:10]}-{data_evento[3:5]}-{data_evento[0:2]}"
+    c.execute("DELETE FROM checkpoints WHERE data_ref >= ?", (data_iso,))
+    c.execute("DELETE FROM checkpoint_posicoes WHERE data_ref >= ?", (data_iso,))
+
+@medir('db')
+def get_transactions(busca: Optional[str] = None) -> pd.DataFrame:
+    """
+    busca: filtro de ticker (prefixo/substring), resolvido no SQLite.
+    Colunas tipadas conforme esquema.TRANSACOES (datas em datetime64).
+    """
     try:
         init_database()
+        where, params = _ticker_filter(busca)
         with _connect() as conn:
             df = pd.read_sql_query(
                 """SELECT id, ticker, operacao, direcao, strike, quantidade,
                           valor_opcao, data_exerc, data_op, valor_operacao,
-                          estrutura, rolagem, vinculo_prejuizo, valor_atual
-                   FROM transacoes""",
-                conn
+                          estrutura, rolagem, vinculo_prejuizo, valor_atual,
+                          estrutura_bundle
+                   FROM transacoes""" + (f" WHERE {where}" if where else ""),
+                conn,
+                params=params
             )
             # Nomes com padrão da UI
             df.rename(columns={
@@ -149,31 +543,188 @@ def get_transactions() -> pd.DataFrame:
                 'estrutura': 'ESTRUTURA',
                 'rolagem': 'ROLAGEM',
                 'vinculo_prejuizo': 'VINCULO_PREJUIZO',
-                'valor_atual': 'VALOR ATUAL'
+                'valor_atual': 'VALOR ATUAL',
+                'estrutura_bundle': 'BUNDLE'
             }, inplace=True)
-            return df
+            return tipar(df, TRANSACOES)
     except Exception as e:
         logging.error(f"[DB] get_transactions erro: {e}")
         return pd.DataFrame()
 
-def get_encerradas() -> pd.DataFrame:
+# -------------------------------
+# Partições arquivadas (manifesto 'particoes'; escrita em arquivo.py)
+# -------------------------------
+def _dir_particoes() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(_db_path())), 'arquivo')
+
+def _caminho_particao(ano: int) -> str:
+    base = os.path.splitext(os.path.basename(_db_path()))[0]
+    return os.path.join(_dir_particoes(), f'{base}_{ano}.db')
+
+def _particoes(c: sqlite3.Cursor, tabela: str, inicio: Optional[str] = None,
+               fim: Optional[str] = None) -> List[str]:
+    """Arquivos das partições de 'tabela' cujo intervalo [data_min, data_max] intersecta [inicio, fim]."""
+    c.execute("""SELECT arquivo FROM particoes
+                 WHERE tabela=? AND n_linhas > 0 AND data_max >= ? AND data_min <= ?
+                 ORDER BY ano""", (tabela, (inicio or '')[:10], (fim or '9999-12-31')[:10]))
+    caminhos = []
+    for (arquivo,) in c.fetchall():
+        caminho = os.path.join(_dir_particoes(), arquivo)
+        if os.path.exists(caminho):
+            caminhos.append(caminho)
+        else:
+            logging.warning(f"[DB] partição ausente: {caminho}")
+    return caminhos
+
+def _ler_particionado(conn: sqlite3.Connection, tabela: str, colunas: str, where: str,
+                      params: list, inicio: Optional[str], fim: Optional[str]) -> pd.DataFrame:
+    """SELECT na tabela atual + UNION ALL nas partições anexadas que intersectam o período."""
+    filtro = f" WHERE {where}" if where else ""
+    frames = [pd.read_sql_query(f"SELECT {colunas} FROM {tabela}{filtro} ORDER BY id", conn, params=params)]
+    arquivos = _particoes(conn.cursor(), tabela, inicio, fim)
+    for i in range(0, len(arquivos), _MAX_ATTACH):
+        lote = arquivos[i:i + _MAX_ATTACH]
+        for j, caminho in enumerate(lote):
+            conn.execute(f"ATTACH DATABASE ? AS arq{j}", (caminho,))
+        try:
+            sql = " UNION ALL ".join(f"SELECT {colunas} FROM arq{j}.{tabela}{filtro}" for j in range(len(lote)))
+            frames.append(pd.read_sql_query(sql, conn, params=params * len(lote)))
+        finally:
+            for j in range(len(lote)):
+                conn.execute(f"DETACH DATABASE arq{j}")
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True).sort_values('id', ignore_index=True)
+
+_ENC_COLS = """id, id_origem, ticker, operacao, direcao, strike,
+                quantidade, valor_opcao, valor_operacao, data_op,
+                data_exerc, estrutura, rolagem, data_encerr,
+                valor_encerr, valor_oper_encerr, g_p, perdas_invest,
+                motivo, estrutura_bundle"""
+
+@medir('db')
+def get_encerradas(busca: Optional[str] = None, inicio: Optional[str] = None,
+                   fim: Optional[str] = None) -> pd.DataFrame:
+    """
+    busca: filtro de ticker (prefixo/substring), resolvido no SQLite.
+    inicio/fim: período de data_encerr ('YYYY-MM-DD', inclusivo) via idx_enc_data_iso;
+    só as partições arquivadas que intersectam o período são lidas.
+    Colunas tipadas conforme esquema.ENCERRADAS (datas em datetime64).
+    """
     try:
         init_database()
+        where, params = _ticker_filter(busca)
+        conds = [where] if where else []
+        if inicio:
+            conds.append(f"{_iso_sql('data_encerr')} >= ?")
+            params = params + [str(inicio)[:10]]
+        if fim:
+            conds.append(f"{_iso_sql('data_encerr')} <= ?")
+            params = params + [str(fim)[:10]]
         with _connect() as conn:
-            df = pd.read_sql_query(
-                """SELECT id, id_origem, ticker, operacao, direcao, strike,
-                          quantidade, valor_opcao, valor_operacao, data_op,
-                          data_exerc, estrutura, rolagem, data_encerr,
-                          valor_encerr, valor_oper_encerr, g_p, perdas_invest,
-                          motivo
-                   FROM encerradas""",
-                conn
-            )
-            return df
+            df = _ler_particionado(conn, 'encerradas', _ENC_COLS, " AND ".join(conds), params, inicio, fim)
+        return tipar(df, ENCERRADAS)
     except Exception as e:
         logging.error(f"[DB] get_encerradas erro: {e}")
         return pd.DataFrame()
 
+# Cache dos valores distintos (dropdowns), válido até a próxima escrita
+_LOOKUP_CACHE = {'versao': None, 'valores': None}
+
+def _distinct_indexed(c: sqlite3.Cursor, tabela: str, coluna: str) -> list:
+    """
+    SELECT DISTINCT via "loose index scan": cada passo é um MIN(coluna) > anterior,
+    resolvido em O(log n) pelo índice da coluna. Custo ~ nº de valores distintos,
+    independente do tamanho da tabela.
+    """
+    valores = []
+    c.execute(f"SELECT MIN({coluna}) FROM {tabela} WHERE {coluna} IS NOT NULL")
+    atual = c.fetchone()[0]
+    while atual is not None:
+        if str(atual).strip():
+            valores.append(atual)
+        c.execute(f"SELECT MIN({coluna}) FROM {tabela} WHERE {coluna} > ?", (atual,))
+        atual = c.fetchone()[0]
+    return valores
+
+@medir('db')
+def get_lookup_values() -> dict:
+    """
+    Valores distintos de 'estrutura' e 'estrutura_bundle' em encerradas
+    (opções dos dropdowns de relatório). Usa idx_enc_estrutura/idx_enc_bundle
+    e fica em memória até a próxima escrita (ver data_version()).
+    """
+    versao = data_version()
+    if _LOOKUP_CACHE['versao'] == versao:
+        return _LOOKUP_CACHE['valores']
+    try:
+        with _connect() as conn:
+            c = conn.cursor()
+            valores = {
+                'estrutura': _distinct_indexed(c, 'encerradas', 'estrutura'),
+                'bundle': _distinct_indexed(c, 'encerradas', 'estrutura_bundle'),
+            }
+            # partições arquivadas (mesmos índices em cada arquivo)
+            for caminho in _particoes(c, 'encerradas'):
+                c.execute("ATTACH DATABASE ? AS arq", (caminho,))
+                try:
+                    for chave, coluna in (('estrutura', 'estrutura'), ('bundle', 'estrutura_bundle')):
+                        valores[chave] = sorted(set(valores[chave]) | set(_distinct_indexed(c, 'arq.encerradas', coluna)))
+                finally:
+                    c.execute("DETACH DATABASE arq")
+    except Exception as e:
+        logging.error(f"[DB] get_lookup_values erro: {e}")
+        return {'estrutura': [], 'bundle': []}
+    _LOOKUP_CACHE['versao'] = versao
+    _LOOKUP_CACHE['valores'] = valores
+    return valores
+
+# -------------------------------
+# Visão consolidada (todas as contas)
+# -------------------------------
+_CONSOLIDADO_COLS = ['conta', 'n_abertas', 'fluxo_aberto', 'n_encerradas', 'gp_realizado']
+
+@medir('db')
+def resumo_consolidado() -> pd.DataFrame:
+    """
+    Totais por conta numa única consulta: os arquivos das contas são anexados
+    (ATTACH, somente leitura) a uma conexão em memória e agregados com
+    UNION ALL + GROUP BY. Acima de _MAX_ATTACH contas, roda em lotes.
+    """
+    frames = []
+    contas = [c for c in listar_contas() if os.path.exists(_caminho_conta(c))]
+    for i in range(0, len(contas), _MAX_ATTACH):
+        lote = contas[i:i + _MAX_ATTACH]
+        conn = sqlite3.connect('file::memory:', uri=True)
+        try:
+            partes, params = [], []
+            for j, conta in enumerate(lote):
+                with na_conta(conta):
+                    init_database()
+                conn.execute(f"ATTACH DATABASE ? AS c{j}", (f"file:{quote(_caminho_conta(conta))}?mode=ro",))
+                # somas inteiras em centavos (dinheiro.py); reais só no fim
+                partes.append(f"SELECT ? AS conta, COUNT(*) AS n_abertas, COALESCE(SUM(valor_operacao_cent), 0) AS fluxo_aberto,"
+                              f" 0 AS n_encerradas, 0 AS gp_realizado FROM c{j}.transacoes")
+                partes.append(f"SELECT ?, 0, 0, COUNT(*), COALESCE(SUM(g_p_cent), 0) FROM c{j}.encerradas")
+                # encerradas já arquivadas: totais do manifesto, sem abrir as partições
+                partes.append(f"SELECT ?, 0, 0, COALESCE(SUM(n_linhas), 0), COALESCE(SUM(total_cent), 0)"
+                              f" FROM c{j}.particoes WHERE tabela = 'encerradas'")
+                params += [conta, conta, conta]
+            sql = f"""SELECT conta, SUM(n_abertas) AS n_abertas, SUM(fluxo_aberto) / 100.0 AS fluxo_aberto,
+                             SUM(n_encerradas) AS n_encerradas, SUM(gp_realizado) / 100.0 AS gp_realizado
+                      FROM ({' UNION ALL '.join(partes)})
+                      GROUP BY conta"""
+            frames.append(pd.read_sql_query(sql, conn, params=params))
+        except Exception as e:
+            logging.error(f"[DB] resumo_consolidado erro: {e}")
+        finally:
+            conn.close()
+    if not frames:
+        return pd.DataFrame(columns=_CONSOLIDADO_COLS)
+    df = pd.concat(frames, ignore_index=True)
+    ordem = {c: i for i, c in enumerate(contas)}
+    return df.sort_values('conta', key=lambda s: s.map(ordem)).reset_index(drop=True)[_CONSOLIDADO_COLS]
+
 def _calc_signals(direcao: str) -> Tuple[int, int]:
     """
     Retorna (sign_qtd, sign_cashflow_abertura)
@@ -183,6 +734,119 @@ def _calc_signals(direcao: str) -> Tuple[int, int]:
         return (+1, -1)
     return (-1, +1)
 
+# -------------------------------
+# Escrita em lote (registros de dominio.py)
+# -------------------------------
+@lru_cache(maxsize=None)
+def _sql_inserir(tabela: str, colunas: Tuple[str, ...], conflito: str = '') -> str:
+    """
+    INSERT [OR conflito] com parâmetros numerados; colunas inteiras de
+    _PONTO_FIXO gravam também o espelho REAL.
+    """
+    espelhos = _PONTO_FIXO.get(tabela, {})
+    nomes, valores = list(colunas), [f"?{i}" for i in range(1, len(colunas) + 1)]
+    for i, col in enumerate(colunas, start=1):
+        if col in espelhos:
+            espelho, escala = espelhos[col]
+            nomes.append(espelho)
+            valores.append(f"?{i} / {escala}.0")
+    ou = f" OR {conflito}" if conflito else ''
+    return f"INSERT{ou} INTO {tabela} ({', '.join(nomes)}) VALUES ({', '.join(valores)})"
+
+def _inserir(c: sqlite3.Cursor, tabela: str, itens: list) -> None:
+    """
+    executemany dos registros na ordem de COLUNAS. Registros com 'id' recebem
+    os ids gerados: AUTOINCREMENT + escritor único => ids consecutivos até o
+    seq de sqlite_sequence (executemany não preenche lastrowid).
+    """
+    if not itens:
+        return
+    cls = type(itens[0])
+    auto = cls.COLUNAS[0] == 'id'
+    linhas = map(cls.valores, itens)
+    c.executemany(_sql_inserir(tabela, cls.COLUNAS[1:] if auto else cls.COLUNAS),
+                  (v[1:] for v in linhas) if auto else linhas)
+    if auto:
+        ultimo, = c.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (tabela,)).fetchone()
+        for novo_id, item in enumerate(itens, start=ultimo - len(itens) + 1):
+            item.id = novo_id
+
+def _mais_antiga(datas) -> str:
+    return min(datas, key=lambda d: (d[6:10], d[3:5], d[0:2]))
+
+def _inserir_pernas(c: sqlite3.Cursor, pernas: List[PernaAberta]) -> None:
+    """Inclui as pernas (ids preenchidos nelas), com log INSERCAO de cada uma."""
+    if not pernas:
+        return
+    _inserir(c, 'transacoes', pernas)
+    _inserir(c, 'log_alteracoes', [
+        EventoLog(p.id, 'INSERCAO', '', f'{p.ticker}/{p.operacao}/{p.direcao}', 'INSERCAO', p.data_op)
+        for p in pernas])
+    _invalidar_checkpoints(c, _mais_antiga(p.data_op for p in pernas))
+
+def _encerrar_pernas(
+    c: sqlite3.Cursor,
+    pedidos: List[Tuple[int, int, float]],  # (id da perna, quantidade absoluta, valor de encerramento unitário)
+    data_encerr: str,
+    rolagem_texto: Optional[str] = None,
+    motivo_encerr: Optional[str] = None,
+) -> List[PernaEncerrada]:
+    """
+    Encerramento parcial/total de várias pernas: um SELECT, um executemany por
+    tabela (encerradas, log, cadeias, transacoes). Retorna as encerradas, na
+    ordem dos pedidos, com id preenchido.
+    """
+    ids = [int(tid) for tid, _, _ in pedidos]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Perna repetida no encerramento")
+    abertas = {p.id: p for p in selecionar(c.connection, PernaAberta, 'transacoes',
+                                           'id IN (SELECT value FROM json_each(?))', (json.dumps(ids),))}
+    encerradas, restantes = [], []
+    for tid, qtd_encerrada, valor_encerr_unit in pedidos:
+        perna = abertas.get(int(tid))
+        if perna is None:
+            raise ValueError("Operação original não encontrada")
+        qtd = abs(int(qtd_encerrada))
+        if qtd <= 0:
+            raise ValueError("Quantidade encerrada inválida")
+        # direção de fechamento é a oposta da original; valores em centavos (dinheiro.py)
+        encerradas.append(PernaEncerrada.de_perna(perna, qtd, premio(valor_encerr_unit), data_encerr,
+                                                  rolagem_texto, motivo_encerr))
+        # nova_qtd = qtd_atual - qtd * sinal(qtd_atual)
+        restantes.append((perna.id, perna.quantidade - (1 if perna.quantidade > 0 else -1) * qtd))
+
+    _inserir(c, 'encerradas', encerradas)
+    _inserir(c, 'log_alteracoes', [
+        EventoLog(tid, 'status', 'aberta',
+                  f'encerrada_parcial({e.quantidade})' if nova_qtd != 0 else f'encerrada_total({e.quantidade})',
+                  'ENCERRAMENTO', data_encerr)
+        for e, (tid, nova_qtd) in zip(encerradas, restantes)])
+    _invalidar_checkpoints(c, data_encerr)
+    _somar_cadeias(c, [(e.id_origem, e.g_p_cent) for e in encerradas])
+    c.executemany("DELETE FROM transacoes WHERE id=?", [(tid,) for tid, q in restantes if q == 0])
+    c.executemany("UPDATE transacoes SET quantidade=? WHERE id=?", [(q, tid) for tid, q in restantes if q != 0])
+    return encerradas
+
+@medir('db')
+def importar_pernas(pernas: Union[List[PernaAberta], np.ndarray],
+                    conn: Optional[sqlite3.Connection] = None) -> List[int]:
+    """
+    Importação em lote de pernas já montadas: lista de PernaAberta ou array
+    estruturado (dominio.para_numpy) numa transação. Retorna os ids na ordem
+    recebida. Com 'conn', roda na transação do chamador (sem commit).
+    """
+    if isinstance(pernas, np.ndarray):
+        pernas = de_numpy(pernas, PernaAberta)
+    if conn is None:
+        init_database()
+    with _tx(conn) as cx:
+        _inserir_pernas(cx.cursor(), pernas)
+    if pernas and conn is None:
+        _bump_data_version()
+        logging.info(f"[DB] {len(pernas)} pernas importadas")
+    return [p.id for p in pernas]
+
+@medir('db')
 def add_operation(
     ticker: str,
     operacao: str,      # 'Call'/'Put'
@@ -193,69 +857,99 @@ def add_operation(
     data_exerc: str,
     estrutura: Optional[str],
     rolagem: Optional[str],
-    data_op: Optional[str] = None   # usa se válido, senão hoje
+    data_op: Optional[str] = None,  # usa se válido, senão hoje
+    estrutura_bundle: Optional[str] = None,
+    perna_ordem: Optional[int] = None,
+    perna_papel: Optional[str] = None,
+    conn: Optional[sqlite3.Connection] = None  # transação do chamador (lote)
 ) -> int:
-    init_database()
-    sign_qtd, sign_cash = _calc_signals(direcao)
-    quantidade_norm = sign_qtd * abs(int(quantidade))
-    valor_operacao = sign_cash * abs(float(valor_opcao)) * abs(int(quantidade))
-
+    if conn is None:
+        init_database()
     data_op_final = data_op if (isinstance(data_op, str) and len(data_op) == 10) else _hoje_str()
+    # valor_atual permanece NULL até integração
+    perna = PernaAberta.nova(ticker, operacao, direcao, strike, quantidade, valor_opcao, data_exerc,
+                             data_op_final, estrutura, rolagem, estrutura_bundle, perna_ordem, perna_papel)
+    with _tx(conn) as cx:
+        _inserir_pernas(cx.cursor(), [perna])
+    if conn is None:
+        _bump_data_version()
+        logging.info(f"[DB] Nova operação id={perna.id} inserida")
+    return perna.id
+
+@medir('db')
+def add_structure(
+    estrutura: str,
+    pernas: List[dict],   # ticker, operacao, direcao, strike, quantidade, valor_opcao, data_exerc
+    bundle: Optional[str] = None,
+    rolagem: Optional[str] = None,
+    data_op: Optional[str] = None,
+    conn: Optional[sqlite3.Connection] = None
+) -> List[int]:
+    """
+    Inclui todas as pernas de uma estrutura numa única transação, com
+    estrutura_bundle, perna_ordem (1..n) e perna_papel preenchidos.
+    Sem bundle informado, usa '<estrutura> #<id da 1ª perna>'.
+    Retorna os ids na ordem das pernas.
+    """
+    if not pernas:
+        raise ValueError("estrutura sem pernas")
+    if not (estrutura or '').strip():
+        raise ValueError("nome da estrutura obrigatório")
+    if conn is None:
+        init_database()
+    data_op = data_op if (isinstance(data_op, str) and len(data_op) == 10) else _hoje_str()
+    est = Estrutura(estrutura, [
+        PernaAberta.nova(p['ticker'], p['operacao'], p['direcao'], p.get('strike'), p['quantidade'],
+                         p['valor_opcao'], p['data_exerc'], data_op, rolagem=rolagem)
+        for p in pernas], bundle)
+    with _tx(conn) as cx:
+        _inserir_pernas(cx.cursor(), est.pernas)
+        if est.bundle is None:
+            est.bundle = f"{est.nome} #{est.pernas[0].id}"
+            cx.execute("UPDATE transacoes SET estrutura_bundle=? WHERE id IN (SELECT value FROM json_each(?))",
+                       (est.bundle, json.dumps([p.id for p in est.pernas])))
+    ids = [p.id for p in est.pernas]
+    if conn is None:
+        _bump_data_version()
+        logging.info(f"[DB] Estrutura '{est.bundle}' incluída: pernas {ids}")
+    return ids
 
+@medir('db')
+def get_pernas(bundle: Optional[str] = None, estrutura: Optional[str] = None) -> pd.DataFrame:
+    """
+    Pernas abertas de um bundle (idx_tx_estr_bundle) ou, sem bundle, de uma
+    estrutura (idx_tx_estrutura), na ordem de entrada.
+    """
+    filtro, chave = ('estrutura_bundle = ?', bundle) if bundle else ('estrutura = ?', estrutura)
     with _connect() as conn:
-        c = conn.cursor()
-        c.execute(
-            """INSERT INTO transacoes
-               (ticker, operacao, strike, quantidade, valor_opcao, data_exerc,
-                data_op, valor_operacao, estrutura, rolagem, vinculo_prejuizo,
-                direcao, valor_atual)
-               VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)""",
-            (
-                ticker.upper().strip(),
-                operacao,
-                float(strike) if strike is not None else None,
-                quantidade_norm,
-                abs(float(valor_opcao)),
-                data_exerc,
-                data_op_final,
-                valor_operacao,
-                (estrutura or None),
-                (rolagem or None),
-                None,
-                direcao,
-                None  # valor_atual permanece NULL até integração
-            )
-        )
-        new_id = c.lastrowid
-        # LOG
-        c.execute(
-            """INSERT INTO log_alteracoes
-               (transacao_id, campo_alterado, valor_antigo, valor_novo, tipo_alteracao, data_alteracao)
-               VALUES (?,?,?,?,?,?)""",
-            (new_id, 'INSERCAO', '', f'{ticker}/{operacao}/{direcao}', 'INSERCAO', data_op_final)
-        )
-        conn.commit()
-        logging.info(f"[DB] Nova operação id={new_id} inserida")
-        return new_id
+        return pd.read_sql_query(
+            f"""SELECT id, ticker, operacao, direcao, strike, quantidade, valor_opcao,
+                       data_exerc, data_op, estrutura, estrutura_bundle, perna_ordem, perna_papel
+                FROM transacoes WHERE {filtro}
+                ORDER BY perna_ordem, id""", conn, params=(chave,))
 
+@medir('db')
 def update_operation(
     operacao_id: int,
     quantidade: Optional[int] = None,  # absoluto
     estrutura: Optional[str] = None,
-    rolagem: Optional[str] = None
+    rolagem: Optional[str] = None,
+    conn: Optional[sqlite3.Connection] = None  # transação do chamador (lote)
 ) -> None:
     """
     Editáveis: quantidade, estrutura, rolagem.
     data_op e valor_opcao NÃO editáveis aqui.
     Recalcula valor_operacao se quantidade mudar.
     """
-    with _connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT id, direcao, valor_opcao, quantidade, estrutura, rolagem FROM transacoes WHERE id=?", (operacao_id,))
+    with _tx(conn) as cx:
+        c = cx.cursor()
+        c.execute("""SELECT id, direcao, COALESCE(valor_opcao_e4, CAST(ROUND(valor_opcao * 10000) AS INTEGER)),
+                            quantidade, estrutura, rolagem
+                     FROM transacoes WHERE id=?""", (operacao_id,))
         row = c.fetchone()
         if not row:
             raise ValueError("Operação não encontrada")
-        _, direcao_old, valor_opcao, quantidade_old, estrutura_old, rolagem_old = row
+        _, direcao_old, premio_e4, quantidade_old, estrutura_old, rolagem_old = row
 
         updates = []
         logs = []
@@ -263,11 +957,12 @@ def update_operation(
         if quantidade is not None:
             sign_qtd, sign_cash = _calc_signals(direcao_old)
             quantidade_norm = sign_qtd * abs(int(quantidade))
-            valor_operacao = sign_cash * abs(float(valor_opcao)) * abs(int(quantidade))
+            valor_operacao_cent = fluxo(premio_e4, quantidade, sign_cash)
             updates.append(('quantidade', quantidade_norm))
-            updates.append(('valor_operacao', valor_operacao))
+            updates.append(('valor_operacao', reais(valor_operacao_cent)))
+            updates.append(('valor_operacao_cent', valor_operacao_cent))
             logs.append(('quantidade', str(quantidade_old), str(quantidade_norm)))
-            logs.append(('valor_operacao', '', str(valor_operacao)))
+            logs.append(('valor_operacao', '', str(reais(valor_operacao_cent))))
 
         if estrutura is not None and estrutura != estrutura_old:
             updates.append(('estrutura', estrutura))
@@ -289,94 +984,231 @@ def update_operation(
                        VALUES (?,?,?,?,?,?)""",
                     (operacao_id, campo, antigo, novo, 'ALTERACAO', _hoje_str())
                 )
-            conn.commit()
-            logging.info(f"[DB] Operação id={operacao_id} atualizada")
+            _invalidar_checkpoints(c, _hoje_str())
+    if updates and conn is None:
+        _bump_data_version()
+        logging.info(f"[DB] Operação id={operacao_id} atualizada")
 
+@medir('db')
 def close_operation(
     row_id: int,
     qtd_encerrada: int,        # absoluto
     valor_encerr_unit: float,  # unitário positivo
     data_encerr: str,
     rolagem_texto: Optional[str] = None,
-    motivo_encerr: Optional[str] = None
+    motivo_encerr: Optional[str] = None,
+    conn: Optional[sqlite3.Connection] = None  # transação do chamador (lote)
 ) -> int:
     """
     Encerramento parcial/total.
     - Gera registro em 'encerradas' com id_origem, valor_oper_encerr e g_p.
     - Atualiza/remover a operação aberta.
     Retorna id do registro em 'encerradas'.
+    Com 'conn', roda na transação do chamador (sem commit).
     """
-    with _connect() as conn:
-        c = conn.cursor()
-        c.execute("""SELECT id, ticker, operacao, direcao, strike, quantidade,
-                            valor_opcao, valor_operacao, data_op, data_exerc,
-                            estrutura, rolagem
-                     FROM transacoes WHERE id=?""", (row_id,))
-        tx = c.fetchone()
-        if not tx:
-            raise ValueError("Operação original não encontrada")
+    with _tx(conn) as cx:
+        enc, = _encerrar_pernas(cx.cursor(), [(row_id, qtd_encerrada, valor_encerr_unit)], data_encerr,
+                                rolagem_texto, motivo_encerr)
+    if conn is None:
+        _bump_data_version()
+        logging.info(f"[DB] Encerramento id={enc.id} (origem {enc.id_origem}) registrado")
+    return enc.id
 
-        (tid, ticker, operacao, direcao, strike, quantidade_atual, valor_opcao,
-         valor_operacao_abertura, data_op, data_exerc, estrutura, rolagem_old) = tx
+@medir('db')
+def encerrar_pernas(
+    pedidos: List[Tuple[int, int, float]],  # (id da perna, quantidade absoluta, valor de encerramento unitário)
+    data_encerr: str,
+    rolagem_texto: Optional[str] = None,
+    motivo_encerr: Optional[str] = None,
+    conn: Optional[sqlite3.Connection] = None  # transação do chamador (lote)
+) -> List[PernaEncerrada]:
+    """
+    Encerramento em lote (mesma data e motivo) de várias pernas numa transação.
+    Retorna as encerradas, na ordem dos pedidos, com id preenchido.
+    """
+    with _tx(conn) as cx:
+        encerradas = _encerrar_pernas(cx.cursor(), pedidos, data_encerr, rolagem_texto, motivo_encerr)
+    if encerradas and conn is None:
+        _bump_data_version()
+        logging.info(f"[DB] {len(encerradas)} encerramentos registrados")
+    return encerradas
 
-        qtd = abs(int(qtd_encerrada))
-        if qtd <= 0:
-            raise ValueError("Quantidade encerrada inválida")
+# -------------------------------
+# Rolagens (cadeias de pernas)
+# -------------------------------
+def _somar_cadeias(c: sqlite3.Cursor, itens: List[Tuple[int, int]]) -> None:
+    """Soma o G/P (centavos) de cada encerramento (perna, g_p_cent) ao acumulado da sua cadeia (se houver)."""
+    agora = dt.datetime.now().isoformat(timespec='seconds')
+    c.executemany(
+        """UPDATE cadeias_rolagem SET g_p_cent = g_p_cent + ?1, g_p = (g_p_cent + ?1) / 100.0, atualizado_em = ?2
+           WHERE cadeia_id IN (SELECT cadeia_id FROM rolagens WHERE destino_id = ?3
+                               UNION SELECT cadeia_id FROM rolagens WHERE origem_id = ?3)""",
+        [(g_p_cent, agora, tid) for tid, g_p_cent in itens]
+    )
 
-        # Sinais
-        sign_qtd_open, sign_cash_open = _calc_signals(direcao)  # abertura
-        # Direção de fechamento é a oposta da original
-        direcao_encerr = 'Venda' if direcao == 'Compra' else 'Compra'
-        _, sign_cash_close = _calc_signals(direcao_encerr)
-
-        # Cash flow da parte encerrada na abertura (por parte)
-        cash_open_part = sign_cash_open * abs(float(valor_opcao)) * qtd
-        # Cash flow do encerramento (por parte)
-        cash_close_part = sign_cash_close * abs(float(valor_encerr_unit)) * qtd
-        # P&L realizado da parte encerrada
-        gp_part = cash_close_part + cash_open_part
-
-        # Atualiza quantidade remanescente
-        # Regra: nova_qtd = qtd_atual - qtd * sinal(qtd_atual)
-        sinal_atual = 1 if quantidade_atual > 0 else -1
-        nova_qtd = quantidade_atual - sinal_atual * qtd
-
-        # Inserir encerrada
-        c.execute(
-            """INSERT INTO encerradas
-               (id_origem, ticker, operacao, direcao, strike, quantidade,
-                valor_opcao, valor_operacao, data_op, data_exerc, estrutura, rolagem,
-                data_encerr, valor_encerr, valor_oper_encerr, g_p, perdas_invest, motivo)
-               VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
-            (
-                tid, ticker, operacao, direcao, strike, qtd,
-                valor_opcao, cash_open_part, data_op, data_exerc, estrutura,
-                (rolagem_texto or rolagem_old),
-                data_encerr, abs(float(valor_encerr_unit)), cash_close_part, gp_part, None,
-                motivo_encerr
-            )
-        )
-        encerr_id = c.lastrowid
+@medir('db')
+def rolar(
+    row_id: int,
+    qtd_encerrada: int,
+    valor_encerr_unit: float,
+    data_rolagem: str,
+    novas: List[dict],  # ticker, operacao, direcao, strike, quantidade, valor_opcao, data_exerc
+    motivo_encerr: Optional[str] = 'rolagem',
+    conn: Optional[sqlite3.Connection] = None
+) -> dict:
+    """
+    Rolagem atômica: encerra (total ou parcial) a perna row_id e abre as
+    pernas novas na mesma transação, ligando origem -> destino em 'rolagens'.
+    As novas herdam estrutura, bundle e ordem da perna rolada.
+    Retorna {'encerrada_id', 'novas': [ids], 'cadeia_id'}.
+    """
+    if not novas:
+        raise ValueError("Rolagem sem perna nova")
+    with _tx(conn) as cx:
+        c = cx.cursor()
+        c.execute("SELECT ticker, estrutura, estrutura_bundle, perna_ordem FROM transacoes WHERE id=?", (row_id,))
+        origem = c.fetchone()
+        if not origem:
+            raise ValueError("Operação original não encontrada")
+        ticker, estrutura, bundle, ordem = origem
+        encerr_id = close_operation(row_id, qtd_encerrada, valor_encerr_unit, data_rolagem,
+                                    rolagem_texto=f"rolada para {', '.join(n['ticker'].upper() for n in novas)}",
+                                    motivo_encerr=motivo_encerr, conn=cx)
+        c.execute("SELECT cadeia_id FROM rolagens WHERE destino_id=? LIMIT 1", (row_id,))
+        r = c.fetchone()
+        cadeia_id = r[0] if r else row_id
+        if not r:
+            # cadeia nova: acumulado parte de todos os encerramentos da primeira perna
+            c.execute("""INSERT OR IGNORE INTO cadeias_rolagem (cadeia_id, n_rolagens, g_p, g_p_cent, atualizado_em)
+                         SELECT ?, 0, COALESCE(SUM(g_p_cent), 0) / 100.0, COALESCE(SUM(g_p_cent), 0), ?
+                         FROM encerradas WHERE id_origem=?""",
+                      (cadeia_id, dt.datetime.now().isoformat(timespec='seconds'), row_id))
+        pernas = [PernaAberta.nova(n['ticker'], n['operacao'], n['direcao'], n.get('strike'), n['quantidade'],
+                                   n['valor_opcao'], n['data_exerc'], data_rolagem, estrutura,
+                                   f"rolagem de {ticker}", bundle, ordem, papel_perna(n['operacao'], n['direcao']))
+                  for n in novas]
+        _inserir_pernas(c, pernas)
+        ids = [p.id for p in pernas]
+        c.executemany("""INSERT INTO rolagens (origem_id, destino_id, encerrada_id, cadeia_id, data_rolagem)
+                         VALUES (?,?,?,?,?)""", [(row_id, i, encerr_id, cadeia_id, data_rolagem) for i in ids])
+        c.execute("UPDATE cadeias_rolagem SET n_rolagens = n_rolagens + 1 WHERE cadeia_id=?", (cadeia_id,))
+    if conn is None:
+        _bump_data_version()
+        logging.info(f"[DB] Rolagem {row_id} -> {ids} (cadeia {cadeia_id})")
+    return {'encerrada_id': encerr_id, 'novas': ids, 'cadeia_id': cadeia_id}
+
+@medir('db')
+def get_cadeia(tid: int) -> pd.DataFrame:
+    """
+    Cadeia de rolagens que contém a perna 'tid', numa consulta: sobe até a
+    primeira perna e desce por todas as rolagens (CTEs recursivas sobre
+    idx_rol_destino/idx_rol_origem). Uma linha por perna, com G/P realizado
+    (encerradas no banco quente) e acumulado na ordem da cadeia.
+    """
+    with _connect() as conn:
+        return pd.read_sql_query(
+            """WITH RECURSIVE
+                 acima(tid) AS (
+                   SELECT ?
+                   UNION SELECT r.origem_id FROM rolagens r JOIN acima a ON r.destino_id = a.tid
+                 ),
+                 raiz(tid) AS (
+                   SELECT tid FROM acima a WHERE NOT EXISTS (SELECT 1 FROM rolagens r WHERE r.destino_id = a.tid)
+                 ),
+                 cadeia(tid, nivel, data_rolagem) AS (
+                   SELECT tid, 0, NULL FROM raiz
+                   UNION SELECT r.destino_id, c.nivel + 1, r.data_rolagem
+                         FROM rolagens r JOIN cadeia c ON r.origem_id = c.tid
+                 )
+               SELECT c.tid AS id, c.nivel, c.data_rolagem,
+                      COALESCE(t.ticker, e.ticker) AS ticker,
+                      COALESCE(t.data_exerc, e.data_exerc) AS data_exerc,
+                      t.quantidade AS quantidade_aberta,
+                      COALESCE(e.g_p_cent, 0) / 100.0 AS g_p,
+                      SUM(COALESCE(e.g_p_cent, 0)) OVER (ORDER BY c.nivel, c.tid) / 100.0 AS g_p_acumulado
+               FROM cadeia c
+               LEFT JOIN transacoes t ON t.id = c.tid
+               LEFT JOIN (SELECT id_origem, MAX(ticker) AS ticker, MAX(data_exerc) AS data_exerc,
+                                 SUM(g_p_cent) AS g_p_cent
+                          FROM encerradas WHERE id_origem IN (SELECT tid FROM cadeia)
+                          GROUP BY id_origem) e ON e.id_origem = c.tid
+               ORDER BY c.nivel, c.tid""",
+            conn, params=(int(tid),))
+
+@medir('db')
+def get_cadeias() -> pd.DataFrame:
+    """Cadeias com G/P acumulado (cache em cadeias_rolagem) e a perna inicial."""
+    with _connect() as conn:
+        return pd.read_sql_query(
+            """SELECT k.cadeia_id, k.n_rolagens, k.g_p,
+                      COALESCE(t.ticker, (SELECT e.ticker FROM encerradas e WHERE e.id_origem = k.cadeia_id LIMIT 1)) AS ticker,
+                      k.atualizado_em
+               FROM cadeias_rolagem k LEFT JOIN transacoes t ON t.id = k.cadeia_id
+               ORDER BY k.cadeia_id""", conn)
 
-        # Log encerramento
+@medir('db')
+def close_structure(
+    precos: Dict[int, float],  # id da perna -> valor de encerramento unitário
+    data_encerr: str,
+    bundle: Optional[str] = None,
+    estrutura: Optional[str] = None,  # estruturas sem bundle (legado)
+    fracao: float = 1.0,       # 1 = total; < 1 = parcial proporcional em todas as pernas
+    rolagem_texto: Optional[str] = None,
+    motivo_encerr: Optional[str] = None,
+    conn: Optional[sqlite3.Connection] = None
+) -> dict:
+    """
+    Encerra todas as pernas abertas de um bundle (ou estrutura) numa única
+    transação: um registro em 'encerradas' por perna (_encerrar_pernas) e um
+    log de resumo (ENCERRAMENTO_ESTRUTURA) na primeira perna.
+    Parcial: quantidade da perna x fracao, arredondada (mínimo 1), o que
+    preserva a razão entre as pernas.
+    Retorna {'pernas': [{'id', 'encerrada_id', 'quantidade', 'g_p'}], 'g_p': total}.
+    """
+    if bool(bundle) == bool(estrutura):
+        raise ValueError("Informe o bundle ou a estrutura")
+    if not 0 < float(fracao) <= 1:
+        raise ValueError("Fração de encerramento inválida")
+    filtro, chave = ('estrutura_bundle=?', bundle) if bundle else ('estrutura=?', estrutura)
+    pernas = []
+    total_cent = 0
+    with _tx(conn) as cx:
+        c = cx.cursor()
+        c.execute(f"SELECT id, quantidade FROM transacoes WHERE {filtro} ORDER BY perna_ordem, id", (chave,))
+        abertas = c.fetchall()
+        if not abertas:
+            raise ValueError(f"Nenhuma perna aberta em '{chave}'")
+        faltando = [tid for tid, _ in abertas if precos.get(tid) is None]
+        if faltando:
+            raise ValueError(f"Valor de encerramento ausente para as pernas {faltando}")
+        pedidos = []
+        for tid, quantidade in abertas:
+            qtd = abs(int(quantidade))
+            if fracao < 1:
+                qtd = min(max(int(round(qtd * float(fracao))), 1), qtd)
+            pedidos.append((tid, qtd, precos[tid]))
+        for e in _encerrar_pernas(c, pedidos, data_encerr, rolagem_texto, motivo_encerr):
+            pernas.append({'id': e.id_origem, 'encerrada_id': e.id, 'quantidade': e.quantidade,
+                           'g_p': reais(e.g_p_cent)})
+            total_cent += e.g_p_cent
+        total = reais(total_cent)
+        situacao = 'encerrada_total' if fracao >= 1 else f'encerrada_parcial({fracao:g})'
         c.execute(
             """INSERT INTO log_alteracoes
                (transacao_id, campo_alterado, valor_antigo, valor_novo, tipo_alteracao, data_alteracao)
                VALUES (?,?,?,?,?,?)""",
-            (tid, 'status', 'aberta', f'encerrada_parcial({qtd})' if nova_qtd != 0 else 'encerrada_total', 'ENCERRAMENTO', data_encerr)
+            (abertas[0][0], 'estrutura_bundle' if bundle else 'estrutura', chave,
+             f"{situacao}: {len(pernas)} pernas, g_p={total:.2f}", 'ENCERRAMENTO_ESTRUTURA', data_encerr)
         )
+    if conn is None:
+        _bump_data_version()
+        logging.info(f"[DB] Estrutura '{chave}' encerrada: {len(pernas)} pernas, g_p={total:.2f}")
+    return {'pernas': pernas, 'g_p': total}
 
-        # Ajusta abertura
-        if nova_qtd == 0:
-            c.execute("DELETE FROM transacoes WHERE id=?", (tid,))
-        else:
-            c.execute("UPDATE transacoes SET quantidade=? WHERE id=?", (nova_qtd, tid))
-
-        conn.commit()
-        logging.info(f"[DB] Encerramento id={encerr_id} (origem {tid}) registrado")
-        return encerr_id
-
-def update_valor_atual_transacao(transacao_id: int, valor_atual: Optional[float]) -> None:
-    with _connect() as conn:
-        conn.execute("UPDATE transacoes SET valor_atual=? WHERE id=?", (valor_atual, transacao_id))
-        conn.commit()
+@medir('db')
+def update_valor_atual_transacao(transacao_id: int, valor_atual: Optional[float],
+                                 conn: Optional[sqlite3.Connection] = None) -> None:
+    with _tx(conn) as cx:
+        cx.execute("UPDATE transacoes SET valor_atual=? WHERE id=?", (valor_atual, transacao_id))
+    if conn is None:
+        _bump_data_version()
@@ -0,0 +1,54 @@
+# dinheiro.py
+#
+# Dinheiro em ponto fixo (inteiros):
+# - fluxos de caixa e G/P em centavos (colunas *_cent);
+# - prêmios unitários de opção em 1e-4 R$ (colunas *_e4).
+# As colunas REAL de mesmo nome continuam no banco como espelho (valor inteiro /
+# escala), lidas pela UI, pelo snapshot e pelo histórico; somas e contas usam os
+# inteiros. Como o espelho vem do inteiro, centavos_np() o recupera exatamente.
+# Decimal só na entrada (texto/float do formulário -> inteiro), nunca na exibição.
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+
+import numpy as np
+
+CENTAVOS = 100
+PREMIO = 10_000
+
+def _fixo(valor, escala: int) -> Optional[int]:
+    if valor is None or valor == '':
+        return None
+    return int((Decimal(str(valor)) * escala).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def centavos(valor) -> Optional[int]:
+    """Reais -> centavos (meio centavo arredonda para longe do zero)."""
+    return _fixo(valor, CENTAVOS)
+
+def premio(valor) -> Optional[int]:
+    """Prêmio unitário em reais -> 1e-4 R$."""
+    return _fixo(valor, PREMIO)
+
+def fluxo(premio_e4: int, quantidade: int, sinal: int) -> int:
+    """Fluxo de caixa em centavos de quantidade x prêmio, com o sinal dado (+1/-1)."""
+    bruto = abs(int(premio_e4)) * abs(int(quantidade))  # em 1e-4 R$
+    return sinal * ((bruto + CENTAVOS // 2) // CENTAVOS)
+
+def reais(valor: Optional[int], escala: int = CENTAVOS) -> Optional[float]:
+    return None if valor is None else valor / escala
+
+def centavos_np(valores) -> np.ndarray:
+    """Reais (espelho REAL de coluna em centavos) -> int64 em centavos; NaN/None -> 0."""
+    a = np.asarray(valores, dtype='float64')
+    return np.rint(np.nan_to_num(a) * CENTAVOS).astype(np.int64)
+
+def somar(valores) -> int:
+    """Soma exata, em centavos, de uma série em reais."""
+    return int(centavos_np(valores).sum())
+
+def fmt_centavos(valor: int, moeda: bool = True) -> str:
+    """Centavos -> 'R$ 1.234,56' / '-R$ 0,05' (ou sem 'R$ '), só aritmética inteira."""
+    inteiro, frac = divmod(abs(int(valor)), CENTAVOS)
+    s = f"{inteiro:,}".replace(',', '.') + f",{frac:02d}"
+    sinal = "-" if valor < 0 else ""
+    return f"{sinal}R$ {s}" if moeda else f"{sinal}{s}"
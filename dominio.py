@@ -0,0 +1,138 @@
+# dominio.py
+#
+# Modelo de domínio enxuto dos caminhos de escrita (inclusão de pernas e
+# estruturas, encerramento em lote, importação): classes com __slots__ (sem
+# __dict__ por instância), construídas direto das tuplas do sqlite3 na ordem
+# de COLUNAS e convertidas em lote de/para arrays estruturados do NumPy.
+# Os nomes das colunas são os do banco; dinheiro em ponto fixo (dinheiro.py).
+
+from operator import attrgetter
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from dinheiro import fluxo, premio
+
+class _Registro:
+    __slots__ = ()
+    COLUNAS: Sequence[str] = ()
+    TIPOS: Sequence[str] = ()  # dtype NumPy por coluna ('O': texto/anulável)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.valores = attrgetter(*cls.COLUNAS)  # tupla na ordem de COLUNAS (executemany)
+
+    def __init__(self, *valores, **nomeados):
+        # posicional na ordem de COLUNAS (linha do cursor); o resto por nome ou None
+        for nome, valor in zip(self.COLUNAS, valores):
+            setattr(self, nome, valor)
+        for nome in self.COLUNAS[len(valores):]:
+            setattr(self, nome, nomeados.pop(nome, None))
+        if nomeados:
+            raise TypeError(f"{type(self).__name__}: campos desconhecidos {sorted(nomeados)}")
+
+    @classmethod
+    def fabrica(cls, cursor, linha):
+        """row_factory do sqlite3 (SELECT das COLUNAS, nessa ordem)."""
+        return cls(*linha)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(f'{n}={getattr(self, n)!r}' for n in self.COLUNAS)})"
+
+    def __eq__(self, outro) -> bool:
+        return type(outro) is type(self) and self.valores(self) == outro.valores(outro)
+
+def selecionar(conn, cls, tabela: str, where: str = '', params: Iterable = ()) -> list:
+    """SELECT das COLUNAS de cls em 'tabela' como objetos (row_factory num cursor próprio)."""
+    cur = conn.cursor()
+    cur.row_factory = cls.fabrica
+    cur.execute(f"SELECT {', '.join(cls.COLUNAS)} FROM {tabela}" + (f" WHERE {where}" if where else ''),
+                tuple(params))
+    return cur.fetchall()
+
+def para_numpy(itens: Sequence[_Registro], cls) -> np.ndarray:
+    """Lista de registros -> array estruturado (uma coluna por campo, montada de uma vez)."""
+    dtype = np.dtype(list(zip(cls.COLUNAS, cls.TIPOS)))
+    arr = np.empty(len(itens), dtype=dtype)
+    if itens:
+        for nome, coluna in zip(cls.COLUNAS, zip(*map(cls.valores, itens))):
+            arr[nome] = coluna
+    return arr
+
+def de_numpy(arr: np.ndarray, cls) -> list:
+    """Array estruturado -> registros (tolist() converte as colunas para escalares Python; NaN -> None)."""
+    colunas = []
+    for nome in cls.COLUNAS:
+        valores = arr[nome].tolist()
+        if arr[nome].dtype.kind == 'f':  # None vira NaN em para_numpy
+            valores = [None if v != v else v for v in valores]
+        colunas.append(valores)
+    return [cls(*linha) for linha in zip(*colunas)]
+
+def papel_perna(operacao: str, direcao: str) -> str:
+    """LONG_CALL/SHORT_CALL/LONG_PUT/SHORT_PUT (coluna perna_papel)."""
+    return f"{'LONG' if direcao == 'Compra' else 'SHORT'}_{str(operacao).upper()}"
+
+class PernaAberta(_Registro):
+    """Linha de transacoes (quantidade com sinal: + compra, - venda)."""
+    __slots__ = COLUNAS = ('id', 'ticker', 'operacao', 'direcao', 'strike', 'quantidade',
+                           'valor_opcao_e4', 'valor_operacao_cent', 'data_op', 'data_exerc',
+                           'estrutura', 'rolagem', 'estrutura_bundle', 'perna_ordem', 'perna_papel')
+    TIPOS = ('O', 'O', 'O', 'O', 'f8', 'i8', 'i8', 'i8', 'O', 'O', 'O', 'O', 'O', 'O', 'O')
+
+    @classmethod
+    def nova(cls, ticker: str, operacao: str, direcao: str, strike: Optional[float], quantidade: int,
+             valor_opcao: float, data_exerc: str, data_op: str, estrutura: Optional[str] = None,
+             rolagem: Optional[str] = None, estrutura_bundle: Optional[str] = None,
+             perna_ordem: Optional[int] = None, perna_papel: Optional[str] = None) -> 'PernaAberta':
+        """Perna a incluir: quantidade absoluta do formulário, prêmio unitário em reais."""
+        compra = direcao == 'Compra'
+        q = abs(int(quantidade))
+        premio_e4 = abs(premio(valor_opcao))
+        return cls(None, ticker.upper().strip(), operacao, direcao,
+                   float(strike) if strike is not None else None,
+                   q if compra else -q, premio_e4, fluxo(premio_e4, q, -1 if compra else 1),
+                   data_op, data_exerc, estrutura or None, rolagem or None,
+                   estrutura_bundle or None, perna_ordem, perna_papel or None)
+
+class PernaEncerrada(_Registro):
+    """Linha de encerradas: parte encerrada de uma perna (quantidade sempre positiva)."""
+    __slots__ = COLUNAS = ('id', 'id_origem', 'ticker', 'operacao', 'direcao', 'strike', 'quantidade',
+                           'valor_opcao_e4', 'valor_operacao_cent', 'data_op', 'data_exerc',
+                           'estrutura', 'rolagem', 'data_encerr', 'valor_encerr_e4',
+                           'valor_oper_encerr_cent', 'g_p_cent', 'motivo', 'estrutura_bundle')
+    TIPOS = ('O', 'i8', 'O', 'O', 'O', 'f8', 'i8', 'i8', 'i8', 'O', 'O', 'O', 'O', 'O', 'i8',
+             'i8', 'i8', 'O', 'O')
+
+    @classmethod
+    def de_perna(cls, perna: PernaAberta, quantidade: int, premio_encerr_e4: int, data_encerr: str,
+                 rolagem: Optional[str] = None, motivo: Optional[str] = None) -> 'PernaEncerrada':
+        """Encerramento de 'quantidade' da perna pelo prêmio premio_encerr_e4 (direção oposta)."""
+        q = abs(int(quantidade))
+        sinal_abertura = -1 if perna.direcao == 'Compra' else 1
+        cash_abert = fluxo(perna.valor_opcao_e4, q, sinal_abertura)
+        cash_encerr = fluxo(premio_encerr_e4, q, -sinal_abertura)
+        return cls(None, perna.id, perna.ticker, perna.operacao, perna.direcao, perna.strike, q,
+                   perna.valor_opcao_e4, cash_abert, perna.data_op, perna.data_exerc, perna.estrutura,
+                   rolagem or perna.rolagem, data_encerr, abs(int(premio_encerr_e4)), cash_encerr,
+                   cash_abert + cash_encerr, motivo, perna.estrutura_bundle)
+
+class EventoLog(_Registro):
+    """Linha de log_alteracoes (base do replay em historico.py)."""
+    __slots__ = COLUNAS = ('transacao_id', 'campo_alterado', 'valor_antigo', 'valor_novo',
+                           'tipo_alteracao', 'data_alteracao')
+    TIPOS = ('i8', 'O', 'O', 'O', 'O', 'O')
+
+class Estrutura:
+    """Pernas de uma estrutura incluídas juntas (mesmo nome, bundle e data; ordem 1..n)."""
+    __slots__ = ('nome', 'bundle', 'pernas')
+
+    def __init__(self, nome: str, pernas: List[PernaAberta], bundle: Optional[str] = None):
+        self.nome = nome.strip()
+        self.bundle = bundle
+        self.pernas = pernas
+        for ordem, p in enumerate(pernas, start=1):
+            p.estrutura = self.nome
+            p.estrutura_bundle = bundle
+            p.perna_ordem = ordem
+            p.perna_papel = papel_perna(p.operacao, p.direcao)
@@ -0,0 +1,169 @@
+# escritor.py
+#
+# Escritor único por processo: as escritas dos callbacks entram numa fila e uma
+# thread dedicada as aplica em lotes (group commit): um BEGIN IMMEDIATE por lote,
+# um SAVEPOINT por pedido (a falha de um pedido não desfaz os outros) e um COMMIT.
+# Cada pedido recebe o próprio resultado (ou exceção). Pedido que passa de
+# MONITOR_ESCRITOR_TIMEOUT_S ainda na fila é cancelado e nunca gravado.
+# Entre os workers do gunicorn a disputa pelo lock do SQLite passa a ser de um
+# BEGIN IMMEDIATE por lote, não por escrita. Espera pelo lock, espera total do
+# pedido e tamanho dos lotes vão para /metrics (tipo 'escritor').
+# MONITOR_ESCRITOR=0: cada escrita roda na thread do chamador, como antes.
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List
+
+from database import _connect, _bump_data_version, conta_atual, na_conta, _db_path
+from metrics import observar
+
+logging.basicConfig(level=logging.INFO)
+
+ESCRITOR_ATIVO = os.environ.get('MONITOR_ESCRITOR', '1') != '0'
+# Espera extra por pedidos antes de fechar o lote (0: só o que já está na fila)
+JANELA_S = float(os.environ.get('MONITOR_ESCRITOR_JANELA_MS', '0')) / 1000.0
+MAX_LOTE = int(os.environ.get('MONITOR_ESCRITOR_MAX_LOTE', '64'))
+TIMEOUT_S = float(os.environ.get('MONITOR_ESCRITOR_TIMEOUT_S', '30'))
+# Novas tentativas de BEGIN IMMEDIATE após "database is locked" (busy_timeout esgotado)
+TENTATIVAS = 3
+
+class _Pedido:
+    __slots__ = ('fn', 'args', 'kwargs', 'conta', 'futuro', 't0')
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, conta: str):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.conta = conta
+        self.futuro = Future()
+        self.t0 = time.perf_counter()
+
+_FILA: 'queue.Queue[_Pedido]' = queue.Queue()
+_THREAD = None
+_LOCK = threading.Lock()
+
+def _reiniciar() -> None:
+    # Processo filho (callbacks em background) não herda a thread do escritor
+    global _FILA, _THREAD, _LOCK
+    _FILA = queue.Queue()
+    _THREAD = None
+    _LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_reiniciar)
+
+def escrever(fn: Callable, *args, **kwargs):
+    """
+    fn(*args, conn=<conexão do lote>, **kwargs) no escritor; bloqueia até o
+    COMMIT do lote e devolve o resultado de fn (ou levanta a sua exceção).
+    fn deve aceitar 'conn' e não fazer commit (padrão das escritas de database).
+    """
+    if not ESCRITOR_ATIVO:
+        return fn(*args, **kwargs)
+    _iniciar()
+    pedido = _Pedido(fn, args, kwargs, conta_atual())
+    _FILA.put(pedido)
+    try:
+        return pedido.futuro.result(timeout=TIMEOUT_S)
+    except FutureTimeout:
+        # Ainda na fila: cancela (o escritor pula pedidos cancelados) e o erro
+        # mostrado é verdadeiro. Já no lote em andamento: espera o desfecho, senão
+        # o usuário veria erro de uma escrita que será gravada (e repetiria).
+        if pedido.futuro.cancel():
+            observar('escritor', 'cancelado', time.perf_counter() - pedido.t0)
+            raise TimeoutError(f"escrita não aplicada: escritor ocupado por mais de {TIMEOUT_S:g}s") from None
+        return pedido.futuro.result()
+
+def _iniciar() -> None:
+    global _THREAD
+    if _THREAD is not None and _THREAD.is_alive():
+        return
+    with _LOCK:
+        if _THREAD is None or not _THREAD.is_alive():
+            _THREAD = threading.Thread(target=_loop, name='escritor', daemon=True)
+            _THREAD.start()
+            logging.info(f"[ESCR] escritor iniciado (lote máx. {MAX_LOTE})")
+
+def _proximo_lote() -> List[_Pedido]:
+    lote = [_FILA.get()]
+    limite = time.perf_counter() + JANELA_S
+    while len(lote) < MAX_LOTE:
+        try:
+            restante = limite - time.perf_counter()
+            lote.append(_FILA.get(timeout=restante) if restante > 0 else _FILA.get_nowait())
+        except queue.Empty:
+            break
+    return lote
+
+def _loop() -> None:
+    conexoes: Dict[str, object] = {}
+    while True:
+        lote = _proximo_lote()
+        por_conta: Dict[str, List[_Pedido]] = {}
+        for p in lote:
+            por_conta.setdefault(p.conta, []).append(p)
+        for conta, pedidos in por_conta.items():
+            with na_conta(conta):
+                caminho = _db_path()
+                if caminho not in conexoes:
+                    conexoes[caminho] = _connect()
+                try:
+                    _aplicar(conexoes[caminho], pedidos)
+                except Exception as e:
+                    # conexão em estado incerto: descarta e falha o lote inteiro
+                    logging.error(f"[ESCR] lote de {len(pedidos)} falhou: {e}")
+                    try:
+                        conexoes.pop(caminho).close()
+                    except Exception:
+                        pass
+                    for p in pedidos:
+                        if not p.futuro.done():
+                            p.futuro.set_exception(e)
+
+def _begin(conn) -> None:
+    t0 = time.perf_counter()
+    for tentativa in range(TENTATIVAS):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except Exception as e:
+            if 'locked' not in str(e) or tentativa == TENTATIVAS - 1:
+                observar('escritor', 'lock_espera', time.perf_counter() - t0)
+                raise
+            logging.warning(f"[ESCR] banco ocupado, nova tentativa ({tentativa + 1})")
+    observar('escritor', 'lock_espera', time.perf_counter() - t0)
+
+def _aplicar(conn, pedidos: List[_Pedido]) -> None:
+    _begin(conn)
+    # Com o lock obtido, os pedidos passam a "em execução" (não canceláveis);
+    # os que o chamador desistiu (timeout) ficam fora do lote
+    pedidos = [p for p in pedidos if p.futuro.set_running_or_notify_cancel()]
+    resultados = []
+    try:
+        for p in pedidos:
+            conn.execute("SAVEPOINT pedido")
+            try:
+                resultados.append((p, p.fn(*p.args, conn=conn, **p.kwargs), None))
+                conn.execute("RELEASE pedido")
+            except Exception as e:
+                conn.execute("ROLLBACK TO pedido")
+                conn.execute("RELEASE pedido")
+                resultados.append((p, None, e))
+        t0 = time.perf_counter()
+        conn.commit()
+        observar('escritor', 'commit', time.perf_counter() - t0, linhas=len(pedidos))
+    except Exception:
+        conn.rollback()
+        raise
+    if any(e is None for _, _, e in resultados):
+        _bump_data_version()
+    for p, res, e in resultados:
+        observar('escritor', 'pedido', time.perf_counter() - p.t0)
+        if e is None:
+            p.futuro.set_result(res)
+        else:
+            p.futuro.set_exception(e)
+    logging.info(f"[ESCR] lote de {len(pedidos)} escrita(s) gravado")
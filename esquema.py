@@ -0,0 +1,118 @@
+# esquema.py
+#
+# Tipos dos DataFrames de transações e encerradas, definidos uma vez e aplicados
+# na leitura (database, historico, snapshot); cálculos e relatórios contam com eles.
+# - texto de baixa cardinalidade: category, categorias em ordem lexical e sempre
+#   com '' (os relatórios fazem fillna("")); ticker (quase um por série) e texto
+#   livre ficam em string;
+# - datas 'DD/MM/YYYY' do banco: datetime64 (NaT se vazia/inválida);
+# - inteiros que aceitam NULL no banco: tipos anuláveis do pandas (Int32/Int64).
+# Na saída para a UI (DataTable), registros() volta as datas para 'DD/MM/YYYY'.
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+CATEGORIA = 'category'
+DATA = 'data'
+FORMATO_DATA = '%d/%m/%Y'
+
+# Colunas de get_transactions / historico.posicoes_em (nomes da UI)
+TRANSACOES: Dict[str, str] = {
+    'id': 'int64',
+    'TICKER': 'string',
+    'OPERAÇÃO': CATEGORIA,
+    'DIREÇÃO': CATEGORIA,
+    'STRIKE': 'float64',
+    'QUANTIDADE': 'Int32',
+    'VALOR OPÇÃO': 'float64',
+    'DATA EXERC': DATA,
+    'DATA OP': DATA,
+    'VALOR OPERAÇÃO': 'float64',
+    'ESTRUTURA': CATEGORIA,
+    'ROLAGEM': 'string',
+    'VINCULO_PREJUIZO': 'Int64',
+    'VALOR ATUAL': 'float64',
+    'BUNDLE': CATEGORIA,
+}
+
+# Colunas de get_encerradas / snapshot.ler_encerradas (nomes do banco)
+ENCERRADAS: Dict[str, str] = {
+    'id': 'int64',
+    'id_origem': 'Int64',
+    'ticker': 'string',
+    'operacao': CATEGORIA,
+    'direcao': CATEGORIA,
+    'strike': 'float64',
+    'quantidade': 'Int32',
+    'valor_opcao': 'float64',
+    'valor_operacao': 'float64',
+    'data_op': DATA,
+    'data_exerc': DATA,
+    'estrutura': CATEGORIA,
+    'rolagem': 'string',
+    'data_encerr': DATA,
+    'valor_encerr': 'float64',
+    'valor_oper_encerr': 'float64',
+    'g_p': 'float64',
+    'perdas_invest': 'float64',
+    'motivo': CATEGORIA,
+    'estrutura_bundle': CATEGORIA,
+}
+
+def _categoria(s: pd.Series) -> pd.Series:
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype('category')
+    categorias = s.cat.categories
+    if '' in categorias and categorias.is_monotonic_increasing:
+        return s
+    return s.cat.set_categories(sorted(set(categorias) | {''}))
+
+def _data(s: pd.Series) -> pd.Series:
+    # converte só os valores distintos (poucas datas, muitas linhas); código -1 (NULL) vira NaT
+    codigos, unicas = pd.factorize(s)
+    datas = pd.to_datetime(pd.Series(unicas, dtype=object), format=FORMATO_DATA, errors='coerce')
+    valores = np.append(datas.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    return pd.Series(valores[codigos], index=s.index, name=s.name)
+
+def tipar(df: pd.DataFrame, esquema: Dict[str, str]) -> pd.DataFrame:
+    """Converte (no próprio df) as colunas presentes para os tipos do esquema."""
+    for col, tipo in esquema.items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if tipo == CATEGORIA:
+            df[col] = _categoria(s)
+        elif tipo == DATA:
+            if not pd.api.types.is_datetime64_any_dtype(s):
+                df[col] = _data(s)
+            elif s.dtype != 'datetime64[ns]':
+                df[col] = s.astype('datetime64[ns]')
+        elif tipo == 'string':
+            if s.dtype != 'string':
+                df[col] = s.astype('string')
+        elif s.dtype != tipo:
+            df[col] = pd.to_numeric(s, errors='coerce').astype(tipo)
+    return df
+
+def registros(df: pd.DataFrame) -> list:
+    """
+    df.to_dict("records") para a UI/JSON: datas em 'DD/MM/YYYY', category/string/
+    Int* como objetos Python (None no lugar de NaN/NA/NaT). Evita o caminho lento
+    do pandas, que converte célula a célula quando há colunas de extensão.
+    """
+    colunas = list(df.columns)
+    valores = []
+    for col in colunas:
+        s = df[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            # formata só as datas distintas; NaT (código -1) vira None
+            codigos, unicas = pd.factorize(s)
+            textos = np.append(np.asarray(unicas.strftime(FORMATO_DATA), dtype=object), None)
+            valores.append(textos[codigos].tolist())
+        elif isinstance(s.dtype, pd.api.extensions.ExtensionDtype):
+            valores.append(s.astype(object).where(s.notna(), None).tolist())
+        else:
+            valores.append(s.tolist())
+    return [dict(zip(colunas, linha)) for linha in zip(*valores)]
@@ -0,0 +1,34 @@
+# estruturas.py
+#
+# Modelos de estruturas multi-perna para o formulário "Nova estrutura": a partir
+# de strike central, passo entre strikes e quantidade base geram as pernas
+# (operação, direção, strike, quantidade). Ticker e prêmio de cada perna são
+# preenchidos pelo usuário; a inclusão é atômica via database.add_structure.
+
+from typing import Dict, List, Optional, Tuple
+
+# nome -> pernas: (operacao, direcao, deslocamento em passos, razão da quantidade)
+MODELOS: Dict[str, List[Tuple[str, str, int, int]]] = {
+    'trava de alta': [('Call', 'Compra', 0, 1), ('Call', 'Venda', 1, 1)],
+    'trava de baixa': [('Put', 'Compra', 1, 1), ('Put', 'Venda', 0, 1)],
+    'borboleta': [('Call', 'Compra', -1, 1), ('Call', 'Venda', 0, 2), ('Call', 'Compra', 1, 1)],
+    'condor': [('Put', 'Compra', -2, 1), ('Put', 'Venda', -1, 1), ('Call', 'Venda', 1, 1), ('Call', 'Compra', 2, 1)],
+    'collar': [('Put', 'Compra', -1, 1), ('Call', 'Venda', 1, 1)],
+}
+
+def pernas_do_modelo(modelo: str, quantidade: int, strike: Optional[float] = None,
+                     passo: Optional[float] = None) -> List[dict]:
+    """
+    Pernas de um modelo com quantidade = base x razão. Sem strike central,
+    STRIKE fica vazio; sem passo, todas as pernas usam o strike central.
+    """
+    if modelo not in MODELOS:
+        raise ValueError(f"modelo desconhecido: {modelo}")
+    pernas = []
+    for operacao, direcao, desloc, razao in MODELOS[modelo]:
+        k = None
+        if strike is not None:
+            k = round(float(strike) + desloc * float(passo or 0), 2)
+        pernas.append({'operacao': operacao, 'direcao': direcao, 'strike': k,
+                       'quantidade': abs(int(quantidade)) * razao})
+    return pernas
@@ -0,0 +1,165 @@
+# gerar_dados.py
+#
+# Gerador reprodutível de carteiras sintéticas (benchmarks/carga).
+# Uso:
+#   python gerar_dados.py --escala 100k --saida bench_data/100k.db [--seed 42]
+# Escalas: 1k, 100k, 1m (nº de operações abertas) ou um inteiro.
+
+import os
+import sys
+import random
+import logging
+import argparse
+import datetime as dt
+from typing import List, Tuple
+
+ESCALAS = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+# Raízes B3 com opções líquidas e preço de referência do ativo-objeto
+RAIZES = {
+    'PETR': 38.0, 'VALE': 62.0, 'BBAS': 27.0, 'ITUB': 34.0, 'BBDC': 14.0,
+    'ABEV': 13.0, 'BBSE': 33.0, 'BOVA': 125.0, 'MGLU': 9.0, 'WEGE': 40.0,
+    'PRIO': 45.0, 'SUZB': 55.0, 'GGBR': 18.0, 'CSNA': 10.0, 'ELET': 42.0,
+}
+SERIES_CALL = 'ABCDEFGHIJKL'   # jan..dez
+SERIES_PUT = 'MNOPQRSTUVWX'    # jan..dez
+
+# (nome, pernas: (operacao, direcao, deslocamento_strike, razao_qtd))
+ESTRUTURAS = [
+    ('trava de alta', [('Call', 'Compra', 0, 1), ('Call', 'Venda', 2, 1)]),
+    ('trava de baixa', [('Put', 'Compra', 2, 1), ('Put', 'Venda', 0, 1)]),
+    ('borboleta', [('Call', 'Compra', -2, 1), ('Call', 'Venda', 0, 2), ('Call', 'Compra', 2, 1)]),
+    ('condor', [('Put', 'Compra', -4, 1), ('Put', 'Venda', -2, 1), ('Call', 'Venda', 2, 1), ('Call', 'Compra', 4, 1)]),
+    ('collar', [('Put', 'Compra', -2, 1), ('Call', 'Venda', 2, 1)]),
+    ('straddle', [('Call', 'Venda', 0, 1), ('Put', 'Venda', 0, 1)]),
+]
+MOTIVOS = ['target', 'stop', 'rolagem', 'margem', 'outro', None]
+
+LOTE = 5_000  # operações por transação
+
+def _terceira_sexta(ano: int, mes: int) -> dt.date:
+    d = dt.date(ano, mes, 1)
+    while d.weekday() != 4:
+        d += dt.timedelta(days=1)
+    return d + dt.timedelta(days=14)
+
+def _ticker(rng: random.Random, raiz: str, operacao: str, venc: dt.date, strike: float, semanal: bool) -> str:
+    serie = (SERIES_CALL if operacao == 'Call' else SERIES_PUT)[venc.month - 1]
+    codigo = int(round(strike * 10)) % 1000 or rng.randint(10, 999)
+    sufixo = f"W{rng.choice((1, 2, 4, 5))}" if semanal else ''
+    return f"{raiz}{serie}{codigo}{sufixo}"
+
+def _premio(rng: random.Random, spot: float, strike: float, operacao: str, dias: int) -> float:
+    intrinseco = max(spot - strike, 0.0) if operacao == 'Call' else max(strike - spot, 0.0)
+    extrinseco = spot * 0.02 * max(dias, 1) ** 0.5 / 10 * rng.uniform(0.5, 1.5)
+    return round(max(intrinseco + extrinseco, 0.01), 2)
+
+def _pernas(rng: random.Random, hoje: dt.date, dias_historico: int) -> Tuple[str, List[dict]]:
+    """Gera uma operação simples (estrutura '') ou as pernas de uma estrutura."""
+    raiz = rng.choice(list(RAIZES))
+    spot = RAIZES[raiz] * rng.uniform(0.8, 1.2)
+    data_op = hoje - dt.timedelta(days=rng.randint(0, dias_historico))
+    alvo = data_op + dt.timedelta(days=rng.randint(5, 120))
+    venc = _terceira_sexta(alvo.year, alvo.month)
+    if venc <= data_op:
+        ano, mes = (venc.year + 1, 1) if venc.month == 12 else (venc.year, venc.month + 1)
+        venc = _terceira_sexta(ano, mes)
+    passo = max(round(spot * 0.02, 2), 0.25)
+    qtd_base = rng.choice((100, 200, 300, 500, 1000, 2000))
+    semanal = rng.random() < 0.1
+
+    if rng.random() < 0.45:
+        nome, modelo = rng.choice(ESTRUTURAS)
+    else:
+        nome, modelo = '', [(rng.choice(('Call', 'Put')), rng.choice(('Compra', 'Venda')), rng.randint(-3, 3), 1)]
+
+    pernas = []
+    for operacao, direcao, desloc, razao in modelo:
+        strike = round(spot + desloc * passo, 2)
+        pernas.append({
+            'ticker': _ticker(rng, raiz, operacao, venc, strike, semanal),
+            'operacao': operacao,
+            'direcao': direcao,
+            'strike': strike,
+            'quantidade': qtd_base * razao,
+            'valor_opcao': _premio(rng, spot, strike, operacao, (venc - data_op).days),
+            'data_exerc': venc.strftime('%d/%m/%Y'),
+            'data_op': data_op,
+            'venc': venc,
+        })
+    return nome, pernas
+
+def gerar(caminho: str, n_operacoes: int, seed: int = 42, frac_encerradas: float = 0.6,
+          frac_parcial: float = 0.35, dias_historico: int = 3 * 365) -> dict:
+    """
+    Preenche 'caminho' com n_operacoes pernas abertas e encerra parte delas
+    (total ou parcial), em transações de LOTE operações: uma importação em
+    lote (database.importar_pernas) e um encerramento por (data, motivo).
+    Mesma seed => mesmo banco.
+    """
+    if os.path.exists(caminho):
+        raise FileExistsError(f"{caminho} já existe")
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    os.environ['MONITOR_DB_PATH'] = caminho
+
+    import database
+    from dominio import PernaAberta, para_numpy
+    database.DB_PATH = caminho
+    logging.getLogger().setLevel(logging.WARNING)
+    database.init_database()
+
+    rng = random.Random(seed)
+    hoje = dt.date(2025, 6, 30)  # fixo: reprodutível
+    n_abertas = n_enc = 0
+    conn = database._connect()
+    try:
+        while n_abertas < n_operacoes:
+            # um lote de ~LOTE operações: pernas num array estruturado, importadas de uma vez;
+            # encerramentos agrupados por (data, motivo)
+            novas, fechar = [], []
+            fim_lote = min(n_operacoes, (n_abertas // LOTE + 1) * LOTE)
+            while n_abertas < fim_lote:
+                estrutura, pernas = _pernas(rng, hoje, dias_historico)
+                for p in pernas[: fim_lote - n_abertas]:
+                    novas.append(PernaAberta.nova(
+                        p['ticker'], p['operacao'], p['direcao'], p['strike'], p['quantidade'], p['valor_opcao'],
+                        p['data_exerc'], p['data_op'].strftime('%d/%m/%Y'), estrutura))
+                    n_abertas += 1
+                    if rng.random() < frac_encerradas:
+                        limite = min(p['venc'], hoje)
+                        dias = max((limite - p['data_op']).days, 0)
+                        data_enc = p['data_op'] + dt.timedelta(days=rng.randint(0, dias))
+                        valor = round(max(p['valor_opcao'] * rng.uniform(0.0, 2.2), 0.01), 2)
+                        qtd = p['quantidade']
+                        if rng.random() < frac_parcial:
+                            qtd = max(qtd // rng.choice((2, 4, 5)), 1)
+                        fechar.append((len(novas) - 1, qtd, valor, data_enc.strftime('%d/%m/%Y'),
+                                       rng.choice(MOTIVOS)))
+            ids = database.importar_pernas(para_numpy(novas, PernaAberta), conn=conn)
+            grupos = {}
+            for i, qtd, valor, data_enc, motivo in fechar:
+                grupos.setdefault((data_enc, motivo), []).append((ids[i], qtd, valor))
+            for (data_enc, motivo), pedidos in grupos.items():
+                database.encerrar_pernas(pedidos, data_enc, motivo_encerr=motivo, conn=conn)
+            n_enc += len(fechar)
+            conn.commit()
+            print(f"  {n_abertas}/{n_operacoes} operações", file=sys.stderr)
+    finally:
+        conn.close()
+
+    with database._connect() as c:
+        contagens = {t: c.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                     for t in ('transacoes', 'encerradas', 'log_alteracoes')}
+    return {'caminho': caminho, 'seed': seed, 'operacoes': n_abertas, 'encerramentos': n_enc, **contagens}
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera banco sintético de opções")
+    ap.add_argument('--escala', default='1k', help="1k | 100k | 1m | inteiro")
+    ap.add_argument('--saida', required=True, help="arquivo .db de destino (não pode existir)")
+    ap.add_argument('--seed', type=int, default=42)
+    args = ap.parse_args()
+    n = ESCALAS.get(args.escala.lower()) or int(args.escala)
+    print(gerar(args.saida, n, seed=args.seed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# graficos.py
+#
+# Figuras dos relatórios montadas direto dos arrays já agregados, como dict
+# (spec do Plotly) em vez de plotly.express: sem o import do px/pandas de
+# figura, sem validação dos graph_objects e sem o template padrão do Plotly
+# embutido em cada figura (a maior parte do JSON enviado ao navegador).
+# - TEMPLATE: layout enxuto compartilhado, fundo transparente (herda o fundo
+#   do card) e cores do tema claro; em dark mode o texto e a grade seguem as
+#   variáveis do Bootstrap (style.css, seletor .grafico-rel), sem ida ao servidor;
+# - barras(): gráfico de barras com x/y prontos (listas ou arrays NumPy).
+# Medição (px.bar x barras(): montagem + JSON e tamanho do payload):
+#   python graficos.py [--pontos 36] [--repeticoes 200]
+
+import time
+import argparse
+from typing import Optional, Sequence
+
+import numpy as np
+
+TEMPLATE = {
+    'layout': {
+        'font': {'family': 'Roboto, sans-serif', 'size': 12, 'color': '#212529'},
+        'paper_bgcolor': 'rgba(0,0,0,0)',
+        'plot_bgcolor': 'rgba(0,0,0,0)',
+        'colorway': ['#0d6efd', '#6c757d', '#198754', '#dc3545'],
+        'margin': {'l': 56, 'r': 16, 't': 48, 'b': 40},
+        'title': {'x': 0.02, 'font': {'size': 15}},
+        'xaxis': {'gridcolor': '#dee2e6', 'linecolor': '#dee2e6', 'automargin': True},
+        'yaxis': {'gridcolor': '#dee2e6', 'zerolinecolor': '#adb5bd', 'automargin': True},
+        'hoverlabel': {'font': {'family': 'Roboto, sans-serif'}},
+        'bargap': 0.25,
+    }
+}
+
+def _lista(v) -> list:
+    return v.tolist() if isinstance(v, np.ndarray) else list(v)
+
+def barras(titulo: str, x: Sequence = (), y: Sequence = (), eixo_y: Optional[str] = None) -> dict:
+    """Figura de barras (dict aceito pelo dcc.Graph) a partir de x/y já agregados."""
+    layout = {'template': TEMPLATE, 'title': {'text': titulo}, 'xaxis': {'type': 'category'}}
+    if eixo_y:
+        layout['yaxis'] = {'title': {'text': eixo_y}}
+    return {
+        'data': [{'type': 'bar', 'x': _lista(x), 'y': _lista(y),
+                  'hovertemplate': '%{x}: %{y:,.2f}<extra></extra>'}],
+        'layout': layout,
+    }
+
+def bench(pontos: int = 36, repeticoes: int = 200) -> dict:
+    """Montagem + serialização (encoder do Dash) de px.bar e de barras() com os mesmos dados."""
+    import pandas as pd
+    from plotly.io.json import to_json_plotly
+
+    t0 = time.perf_counter()
+    import plotly.express as px
+    import_px = time.perf_counter() - t0
+
+    x = [f"{2020 + i // 12}-{i % 12 + 1:02d}" for i in range(pontos)]
+    y = np.round(np.random.default_rng(0).normal(0, 5000, pontos), 2)
+    df = pd.DataFrame({'_MES': x, 'GP': y})
+    construtores = {
+        'px.bar': lambda: px.bar(df, x='_MES', y='GP', title='G/P por Mês'),
+        'barras': lambda: barras('G/P por Mês', x, y),
+    }
+    res = {'pontos': pontos, 'import_px_s': import_px}
+    for nome, fn in construtores.items():
+        fn()
+        t0 = time.perf_counter()
+        for _ in range(repeticoes):
+            fig = fn()
+        montar = (time.perf_counter() - t0) / repeticoes
+        t0 = time.perf_counter()
+        for _ in range(repeticoes):
+            js = to_json_plotly(fig)
+        res[nome] = {'montar_ms': montar * 1000, 'json_ms': (time.perf_counter() - t0) / repeticoes * 1000,
+                     'bytes': len(js.encode('utf-8'))}
+    return res
+
+def main():
+    ap = argparse.ArgumentParser(description="Figuras enxutas dos relatórios (medição)")
+    ap.add_argument('--pontos', type=int, default=36, help="barras por figura")
+    ap.add_argument('--repeticoes', type=int, default=200)
+    args = ap.parse_args()
+    res = bench(args.pontos, args.repeticoes)
+    print(f"import plotly.express: {res['import_px_s'] * 1000:.0f}ms")
+    for nome in ('px.bar', 'barras'):
+        r = res[nome]
+        print(f"{nome:<7} montar={r['montar_ms']:.3f}ms json={r['json_ms']:.3f}ms bytes={r['bytes']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+# historico.py
+
+import re
+import sqlite3
+import logging
+import datetime as dt
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from database import (_connect, _iso_sql, _calc_signals, _particoes, init_database,
+                      listar_contas, na_conta)
+from esquema import TRANSACOES, tipar
+from dinheiro import PREMIO, fluxo, reais
+import jobs
+from metrics import medir
+
+logging.basicConfig(level=logging.INFO)
+
+# Carteira em data passada ("time travel"):
+#   posições em D = checkpoint mais recente <= D + replay de log_alteracoes em (checkpoint, D]
+# Checkpoints diários são materializados por job em background; escritas datadas
+# invalidam os checkpoints a partir da sua data (database._invalidar_checkpoints).
+
+_ATTRS = ('ticker', 'operacao', 'direcao', 'strike', 'valor_opcao', 'data_exerc',
+          'data_op', 'estrutura', 'rolagem', 'estrutura_bundle')
+_LOG_ISO = _iso_sql('data_alteracao')
+_RE_QTD = re.compile(r'\((\d+)\)')
+
+def _to_iso(data) -> str:
+    """Aceita date/datetime, 'YYYY-MM-DD' (DatePicker) ou 'DD/MM/YYYY'; retorna 'YYYY-MM-DD'."""
+    if isinstance(data, (dt.date, dt.datetime)):
+        return data.strftime('%Y-%m-%d')
+    s = str(data).strip()[:10]
+    if re.match(r'^\d{2}/\d{2}/\d{4}$', s):
+        return f"{s[6:10]}-{s[3:5]}-{s[0:2]}"
+    return dt.date.fromisoformat(s).isoformat()
+
+@contextmanager
+def _com_particoes(conn: sqlite3.Connection, desde: str):
+    """
+    Views temporárias log_todos/enc_todas usadas no replay. Replays que começam
+    antes do corte do arquivo (ver arquivo.py) também precisam das linhas
+    arquivadas: as partições com dados após 'desde' são anexadas e unidas
+    à tabela atual. Caso comum (desde >= corte): views = tabelas.
+    """
+    c = conn.cursor()
+    c.execute("SELECT MAX(corte) FROM particoes")
+    corte = c.fetchone()[0]
+    anexos = {'log_alteracoes': [], 'encerradas': []}
+    if corte and desde < corte:
+        n = 0
+        for tabela in anexos:
+            for caminho in _particoes(c, tabela, inicio=desde):
+                c.execute(f"ATTACH DATABASE ? AS arq{n}", (caminho,))
+                anexos[tabela].append(f"arq{n}")
+                n += 1
+    for view, tabela in (('log_todos', 'log_alteracoes'), ('enc_todas', 'encerradas')):
+        # lista explícita: partição sem uma coluna de main (migração posterior) entra com NULL
+        c.execute(f"PRAGMA main.table_info({tabela})")
+        colunas = [r[1] for r in c.fetchall()]
+        fontes = [f"SELECT {', '.join(colunas)} FROM main.{tabela}"]
+        for a in anexos[tabela]:
+            c.execute(f"PRAGMA {a}.table_info({tabela})")
+            tem = {r[1] for r in c.fetchall()}
+            lista = ', '.join(col if col in tem else f"NULL AS {col}" for col in colunas)
+            fontes.append(f"SELECT {lista} FROM {a}.{tabela}")
+        c.execute(f"DROP VIEW IF EXISTS temp.{view}")
+        c.execute(f"CREATE TEMP VIEW {view} AS {' UNION ALL '.join(fontes)}")
+    try:
+        yield
+    finally:
+        conn.commit()
+        for view in ('log_todos', 'enc_todas'):
+            c.execute(f"DROP VIEW IF EXISTS temp.{view}")
+        for a in anexos['log_alteracoes'] + anexos['encerradas']:
+            c.execute(f"DETACH DATABASE {a}")
+
+def _sinal(estado: dict) -> int:
+    return 1 if estado['direcao'] == 'Compra' else -1
+
+def _estado_inicial(c: sqlite3.Cursor, tid: int) -> Optional[dict]:
+    """
+    Estado da perna no momento da INSERCAO: parte do estado atual (aberta em
+    transacoes ou última parte em encerradas) e desfaz os eventos posteriores
+    do log, do mais recente ao mais antigo (idx_log_tx_data).
+    """
+    c.execute(f"SELECT {', '.join(_ATTRS)}, quantidade FROM transacoes WHERE id=?", (tid,))
+    row = c.fetchone()
+    ultima_parte = None
+    if row:
+        estado = dict(zip(_ATTRS + ('quantidade',), row))
+    else:
+        c.execute(f"SELECT {', '.join(_ATTRS)}, quantidade FROM enc_todas WHERE id_origem=? ORDER BY id DESC LIMIT 1", (tid,))
+        row = c.fetchone()
+        if not row:
+            return None
+        estado = dict(zip(_ATTRS, row[:-1]))
+        estado['quantidade'] = 0
+        ultima_parte = row[-1]
+
+    c.execute("""SELECT campo_alterado, valor_antigo, valor_novo, tipo_alteracao
+                 FROM log_todos WHERE transacao_id=? ORDER BY id DESC""", (tid,))
+    for campo, antigo, novo, tipo in c.fetchall():
+        if tipo == 'INSERCAO':
+            break
+        if tipo == 'ENCERRAMENTO':
+            m = _RE_QTD.search(novo or '')
+            # legado: 'encerrada_total' sem quantidade -> última parte em encerradas
+            q = int(m.group(1)) if m else (ultima_parte or 0)
+            estado['quantidade'] += _sinal(estado) * abs(int(q))
+        elif tipo == 'ALTERACAO':
+            if campo == 'quantidade':
+                estado['quantidade'] = int(antigo)
+            elif campo in ('estrutura', 'rolagem'):
+                estado[campo] = antigo or None
+    estado['id'] = tid
+    return estado
+
+def _aplicar(c: sqlite3.Cursor, estados: Dict[int, dict], tid: int, campo: str,
+             novo: Optional[str], tipo: str) -> None:
+    if tipo == 'INSERCAO':
+        estado = _estado_inicial(c, tid)
+        if estado and estado['quantidade']:
+            estados[tid] = estado
+        return
+    estado = estados.get(tid)
+    if estado is None:
+        return
+    if tipo == 'ENCERRAMENTO':
+        m = _RE_QTD.search(novo or '')
+        if (novo or '').startswith('encerrada_total') or not m:
+            del estados[tid]
+            return
+        restante = abs(estado['quantidade']) - int(m.group(1))
+        if restante <= 0:
+            del estados[tid]
+        else:
+            estado['quantidade'] = _sinal(estado) * restante
+    elif tipo == 'ALTERACAO':
+        if campo == 'quantidade':
+            estado['quantidade'] = int(novo)
+        elif campo in ('estrutura', 'rolagem'):
+            estado[campo] = novo or None
+
+def _carregar_checkpoint(c: sqlite3.Cursor, alvo: str) -> Tuple[Dict[int, dict], str]:
+    """Checkpoint mais recente <= alvo. Sem checkpoint: estado vazio desde o início."""
+    c.execute("SELECT data_ref FROM checkpoints WHERE data_ref <= ? ORDER BY data_ref DESC LIMIT 1", (alvo,))
+    row = c.fetchone()
+    if not row:
+        return {}, ''
+    base = row[0]
+    c.execute(f"""SELECT transacao_id, {', '.join(_ATTRS)}, quantidade
+                  FROM checkpoint_posicoes WHERE data_ref=?""", (base,))
+    estados = {}
+    for r in c.fetchall():
+        estado = dict(zip(_ATTRS + ('quantidade',), r[1:]))
+        estado['id'] = r[0]
+        estados[r[0]] = estado
+    return estados, base
+
+def _eventos(c: sqlite3.Cursor, desde: str, ate: str) -> list:
+    """Eventos com data em (desde, ate], na ordem de aplicação (idx_log_data)."""
+    c.execute(f"""SELECT {_LOG_ISO}, transacao_id, campo_alterado, valor_novo, tipo_alteracao
+                  FROM log_todos
+                  WHERE {_LOG_ISO} > ? AND {_LOG_ISO} <= ?
+                  ORDER BY {_LOG_ISO}, id""", (desde, ate))
+    return c.fetchall()
+
+def _gravar_checkpoint(c: sqlite3.Cursor, data_ref: str, estados: Dict[int, dict]) -> None:
+    c.execute("DELETE FROM checkpoint_posicoes WHERE data_ref=?", (data_ref,))
+    c.executemany(
+        f"""INSERT INTO checkpoint_posicoes (data_ref, transacao_id, {', '.join(_ATTRS)}, quantidade)
+            VALUES ({', '.join(['?'] * (len(_ATTRS) + 3))})""",
+        [(data_ref, tid) + tuple(e[a] for a in _ATTRS) + (e['quantidade'],) for tid, e in estados.items()]
+    )
+    c.execute("INSERT OR REPLACE INTO checkpoints (data_ref, n_posicoes, criado_em) VALUES (?,?,?)",
+              (data_ref, len(estados), dt.datetime.now().isoformat(timespec='seconds')))
+
+def _to_frame(estados: Dict[int, dict]) -> pd.DataFrame:
+    rows = []
+    for tid in sorted(estados):
+        e = estados[tid]
+        _, sign_cash = _calc_signals(e['direcao'])
+        rows.append({
+            'id': tid,
+            'TICKER': e['ticker'],
+            'OPERAÇÃO': e['operacao'],
+            'DIREÇÃO': e['direcao'],
+            'STRIKE': e['strike'],
+            'QUANTIDADE': e['quantidade'],
+            'VALOR OPÇÃO': e['valor_opcao'],
+            'DATA EXERC': e['data_exerc'],
+            'DATA OP': e['data_op'],
+            # mesmo fluxo em centavos de add_operation (o espelho REAL do prêmio é exato em 1e-4)
+            'VALOR OPERAÇÃO': reais(fluxo(round(float(e['valor_opcao'] or 0) * PREMIO), e['quantidade'], sign_cash)),
+            'ESTRUTURA': e['estrutura'],
+            'ROLAGEM': e['rolagem'],
+            'BUNDLE': e['estrutura_bundle'],
+        })
+    df = pd.DataFrame(rows, columns=['id', 'TICKER', 'OPERAÇÃO', 'DIREÇÃO', 'STRIKE', 'QUANTIDADE',
+                                     'VALOR OPÇÃO', 'DATA EXERC', 'DATA OP', 'VALOR OPERAÇÃO',
+                                     'ESTRUTURA', 'ROLAGEM', 'BUNDLE'])
+    return tipar(df, TRANSACOES)
+
+@medir('db')
+def posicoes_em(data) -> pd.DataFrame:
+    """
+    Posições abertas ao fim do dia 'data' (mesmas colunas de get_transactions).
+    Custo: leitura de um checkpoint + replay dos eventos desde ele.
+    """
+    alvo = _to_iso(data)
+    init_database()
+    with _connect() as conn:
+        c = conn.cursor()
+        estados, base = _carregar_checkpoint(c, alvo)
+        with _com_particoes(conn, base):
+            eventos = _eventos(c, base, alvo)
+            for _, tid, campo, novo, tipo in eventos:
+                _aplicar(c, estados, tid, campo, novo, tipo)
+    logging.info(f"[HIST] posições em {alvo}: checkpoint={base or '-'}, {len(eventos)} eventos")
+    return _to_frame(estados)
+
+@medir('db')
+def materializar_checkpoints(ate=None, progresso: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Materializa checkpoints diários até 'ate' (padrão: hoje), continuando do
+    último checkpoint válido: um por dia com eventos, mais o do próprio 'ate'.
+    progresso(feitos, total) é chamado a cada checkpoint gravado.
+    Retorna o nº de checkpoints gravados.
+    """
+    alvo = _to_iso(ate or dt.date.today())
+    init_database()
+    with _connect() as conn:
+        c = conn.cursor()
+        estados, base = _carregar_checkpoint(c, alvo)
+        if base == alvo:
+            return 0
+        with _com_particoes(conn, base):
+            eventos = _eventos(c, base, alvo)
+            total = len({e[0] for e in eventos}) + 1
+            gravados = 0
+            dia_atual = None
+            for dia, tid, campo, novo, tipo in eventos:
+                if dia_atual is not None and dia != dia_atual:
+                    _gravar_checkpoint(c, dia_atual, estados)
+                    gravados += 1
+                    if progresso:
+                        progresso(gravados, total)
+                dia_atual = dia
+                _aplicar(c, estados, tid, campo, novo, tipo)
+            _gravar_checkpoint(c, alvo, estados)
+    if progresso:
+        progresso(total, total)
+    logging.info(f"[HIST] {gravados + 1} checkpoint(s) materializados até {alvo}")
+    return gravados + 1
+
+@medir('db')
+def recalcular_checkpoints(progresso: Optional[Callable[[int, int], None]] = None) -> int:
+    """Descarta todos os checkpoints e refaz o histórico completo a partir do log."""
+    init_database()
+    with _connect() as conn:
+        conn.execute("DELETE FROM checkpoint_posicoes")
+        conn.execute("DELETE FROM checkpoints")
+        conn.commit()
+    return materializar_checkpoints(progresso=progresso)
+
+def _materializar_contas() -> None:
+    for conta in listar_contas():
+        with na_conta(conta):
+            materializar_checkpoints()
+
+def iniciar_job_checkpoints(intervalo_s: float = 3600.0) -> bool:
+    """Job de checkpoints (todas as contas): no startup e a cada intervalo_s (idempotente por processo)."""
+    return jobs.agendar('checkpoints', _materializar_contas, intervalo_s, atraso_inicial_s=5.0)
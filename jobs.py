@@ -0,0 +1,54 @@
+# jobs.py
+
+import threading
+import logging
+import os
+import time
+from typing import Callable, Dict, Tuple
+
+logging.basicConfig(level=logging.INFO)
+
+# Jobs em background por processo (cada worker do gunicorn roda os seus).
+# Desligar com MONITOR_JOBS=0 (benchmarks, testes de carga).
+JOBS_ATIVOS = os.environ.get('MONITOR_JOBS', '1') != '0'
+
+_JOBS: Dict[str, Tuple[threading.Thread, threading.Event]] = {}
+_LOCK = threading.Lock()
+
+def agendar(nome: str, fn: Callable[[], object], intervalo_s: float, atraso_inicial_s: float = 0.0) -> bool:
+    """
+    Executa fn numa thread daemon: uma vez após atraso_inicial_s (startup)
+    e depois a cada intervalo_s. Idempotente por nome.
+    Retorna False se os jobs estão desligados ou o job já existe.
+    """
+    if not JOBS_ATIVOS:
+        return False
+    with _LOCK:
+        if nome in _JOBS:
+            return False
+        parar = threading.Event()
+
+        def loop():
+            if parar.wait(atraso_inicial_s):
+                return
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    fn()
+                    logging.info(f"[JOB] {nome} ok em {time.perf_counter() - t0:.2f}s")
+                except Exception as e:
+                    logging.error(f"[JOB] {nome} erro: {e}")
+                if parar.wait(intervalo_s):
+                    return
+
+        th = threading.Thread(target=loop, name=f"job-{nome}", daemon=True)
+        _JOBS[nome] = (th, parar)
+        th.start()
+        logging.info(f"[JOB] {nome} agendado (a cada {intervalo_s:.0f}s)")
+        return True
+
+def parar_jobs() -> None:
+    with _LOCK:
+        for th, parar in _JOBS.values():
+            parar.set()
+        _JOBS.clear()
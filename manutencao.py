@@ -0,0 +1,209 @@
+# manutencao.py
+#
+# Manutenção do banco em uso contínuo (todas as contas):
+# - backup online pela API de backup do SQLite, em passos de PAGINAS páginas com
+#   pausa entre eles: leitores e escritores seguem trabalhando durante a cópia;
+#   arquivo em <dir do banco>/backup/<base>_<data-hora>.db, conferido com
+#   quick_check e mantidos os MANTER mais recentes. Um backup por conta de cada
+#   vez (flock em <base>.lock no diretório de backup): com vários workers do
+#   gunicorn, quem encontra o lock ocupado pula, e o job também pula se já há
+#   backup mais novo que meio intervalo;
+# - checkpoint do WAL: PASSIVE (não espera ninguém) e, se o -wal passar de
+#   WAL_MAX_MB, TRUNCATE para devolver o espaço;
+# - estatísticas do planejador: PRAGMA optimize (ANALYZE só onde faltar/mudou).
+# Durações vão para /metrics (tipo 'manutencao').
+# Uso:
+#   python manutencao.py [--conta principal] [--backup] [--checkpoint] [--otimizar]
+
+import os
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+import datetime as dt
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows (servidor de desenvolvimento, um processo): sem lock
+    fcntl = None
+
+from database import _connect, _db_path, listar_contas, na_conta
+import jobs
+from metrics import observar
+
+logging.basicConfig(level=logging.INFO)
+
+BACKUP_DIR = os.environ.get('MONITOR_BACKUP_DIR')  # padrão: <dir do banco>/backup
+MANTER = int(os.environ.get('MONITOR_BACKUP_MANTER', '7'))
+PAGINAS = int(os.environ.get('MONITOR_BACKUP_PAGINAS', '256'))
+PAUSA_S = float(os.environ.get('MONITOR_BACKUP_PAUSA_MS', '5')) / 1000.0
+WAL_MAX_MB = float(os.environ.get('MONITOR_WAL_MAX_MB', '64'))
+# Intervalos dos jobs (0 desliga o job)
+BACKUP_INTERVALO_H = float(os.environ.get('MONITOR_BACKUP_INTERVALO_H', '6'))
+CHECKPOINT_INTERVALO_S = float(os.environ.get('MONITOR_CHECKPOINT_INTERVALO_S', '300'))
+OTIMIZAR_INTERVALO_S = float(os.environ.get('MONITOR_OTIMIZAR_INTERVALO_S', '3600'))
+
+def _medido(nome: str, t0: float) -> float:
+    segundos = time.perf_counter() - t0
+    observar('manutencao', nome, segundos)
+    return segundos
+
+def _dir_backup() -> str:
+    return BACKUP_DIR or os.path.join(os.path.dirname(os.path.abspath(_db_path())), 'backup')
+
+def _base() -> str:
+    return os.path.splitext(os.path.basename(_db_path()))[0]
+
+def listar_backups() -> List[str]:
+    """Backups da conta ativa, do mais antigo ao mais recente."""
+    try:
+        nomes = os.listdir(_dir_backup())
+    except FileNotFoundError:
+        return []
+    prefixo = _base() + '_'
+    return [os.path.join(_dir_backup(), n) for n in sorted(nomes)
+            if n.startswith(prefixo) and n.endswith('.db') and n[len(prefixo):-3].replace('-', '').isdigit()]
+
+def backup(paginas: Optional[int] = None, pausa_s: Optional[float] = None) -> dict:
+    """
+    Cópia online da conta ativa. Cada passo copia 'paginas' páginas; se o banco
+    muda no meio, a API recomeça a cópia sozinha (escritas da mesma conexão não).
+    Pula (pulado=True) se outro processo já faz o backup desta conta.
+    Retorna {'arquivo', 'paginas', 'segundos', 'ok', 'pulado'}.
+    """
+    os.makedirs(_dir_backup(), exist_ok=True)
+    trava = open(os.path.join(_dir_backup(), f"{_base()}.lock"), 'a')
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logging.info(f"[MANUT] backup de {_base()} já em andamento em outro processo; pulando")
+                return {'arquivo': None, 'paginas': 0, 'segundos': 0.0, 'ok': False, 'pulado': True}
+        return _backup(paginas, pausa_s)
+    finally:
+        trava.close()  # libera o flock
+
+def _backup(paginas: Optional[int], pausa_s: Optional[float]) -> dict:
+    destino = os.path.join(_dir_backup(), f"{_base()}_{dt.datetime.now():%Y%m%d-%H%M%S}.db")
+    # nome temporário único: nunca o mesmo arquivo em dois processos
+    fd, tmp = tempfile.mkstemp(prefix=f"{_base()}_", suffix='.db.tmp', dir=_dir_backup())
+    os.close(fd)
+    passos = [0, 0]
+
+    def progresso(status, restantes, total):
+        passos[0] += 1
+        passos[1] = total
+
+    t0 = time.perf_counter()
+    origem = _connect()
+    copia = sqlite3.connect(tmp)
+    ok = False
+    try:
+        origem.backup(copia, pages=paginas or PAGINAS, progress=progresso,
+                      sleep=PAUSA_S if pausa_s is None else pausa_s)
+        ok = copia.execute("PRAGMA quick_check").fetchone()[0] == 'ok'
+    finally:
+        copia.close()
+        origem.close()
+        if not ok:
+            os.remove(tmp)
+    if not ok:
+        raise RuntimeError(f"backup de {_db_path()} falhou no quick_check")
+    os.replace(tmp, destino)
+    for antigo in listar_backups()[:-MANTER] if MANTER > 0 else []:
+        os.remove(antigo)
+    segundos = _medido('backup', t0)
+    logging.info(f"[MANUT] backup {os.path.basename(destino)}: {passos[1]} páginas em {passos[0]} passos, {segundos:.2f}s")
+    return {'arquivo': destino, 'paginas': passos[1], 'segundos': segundos, 'ok': ok, 'pulado': False}
+
+def _backup_agendado() -> None:
+    # Cada worker agenda o job: o primeiro a rodar faz a cópia, os demais a encontram recente
+    recentes = listar_backups()
+    if recentes and time.time() - os.path.getmtime(recentes[-1]) < BACKUP_INTERVALO_H * 3600.0 / 2:
+        return
+    backup()
+
+def checkpoint(truncar: Optional[bool] = None) -> dict:
+    """
+    Checkpoint do WAL da conta ativa. PASSIVE por padrão; TRUNCATE quando o
+    -wal passa de WAL_MAX_MB (ou truncar=True), respeitando o busy_timeout.
+    Retorna {'modo', 'ocupado', 'paginas_wal', 'copiadas', 'wal_mb', 'segundos'}.
+    """
+    wal = _db_path() + '-wal'
+    try:
+        wal_mb = os.path.getsize(wal) / 1e6
+    except OSError:
+        wal_mb = 0.0
+    modo = 'TRUNCATE' if (truncar or (truncar is None and wal_mb > WAL_MAX_MB)) else 'PASSIVE'
+    t0 = time.perf_counter()
+    conn = _connect()
+    try:
+        ocupado, paginas, copiadas = conn.execute(f"PRAGMA wal_checkpoint({modo})").fetchone()
+    finally:
+        conn.close()
+    segundos = _medido('checkpoint', t0)
+    if modo == 'TRUNCATE' or ocupado:
+        logging.info(f"[MANUT] checkpoint {modo}: wal {wal_mb:.1f}MB, {copiadas}/{paginas} páginas"
+                     + (" (ocupado)" if ocupado else "") + f", {segundos:.2f}s")
+    return {'modo': modo, 'ocupado': bool(ocupado), 'paginas_wal': paginas, 'copiadas': copiadas,
+            'wal_mb': wal_mb, 'segundos': segundos}
+
+def otimizar() -> float:
+    """PRAGMA optimize com analysis_limit: ANALYZE amostrado só das tabelas que precisam."""
+    t0 = time.perf_counter()
+    conn = _connect()
+    try:
+        conn.execute("PRAGMA analysis_limit=1000")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone() is None:
+            conn.execute("ANALYZE")  # primeira vez: optimize só analisa tabelas já com estatística
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+    finally:
+        conn.close()
+    segundos = _medido('otimizar', t0)
+    logging.info(f"[MANUT] estatísticas atualizadas em {segundos:.2f}s")
+    return segundos
+
+def _todas(fn) -> None:
+    for conta in listar_contas():
+        with na_conta(conta):
+            try:
+                fn()
+            except Exception as e:
+                logging.error(f"[MANUT] {fn.__name__} ({conta}) erro: {e}")
+
+def iniciar_jobs_manutencao() -> List[str]:
+    """Agenda backup, checkpoint e otimização (todas as contas); retorna os jobs criados."""
+    agendados = []
+    for nome, fn, intervalo, atraso in (
+        ('checkpoint', checkpoint, CHECKPOINT_INTERVALO_S, 30.0),
+        ('otimizar', otimizar, OTIMIZAR_INTERVALO_S, 120.0),
+        ('backup', _backup_agendado, BACKUP_INTERVALO_H * 3600.0, 300.0),
+    ):
+        if intervalo > 0 and jobs.agendar(nome, lambda fn=fn: _todas(fn), intervalo, atraso_inicial_s=atraso):
+            agendados.append(nome)
+    return agendados
+
+def main():
+    ap = argparse.ArgumentParser(description="Backup online, checkpoint do WAL e estatísticas do SQLite")
+    ap.add_argument('--conta', default=None, help="padrão: todas")
+    ap.add_argument('--backup', action='store_true')
+    ap.add_argument('--checkpoint', action='store_true')
+    ap.add_argument('--truncar', action='store_true', help="checkpoint TRUNCATE mesmo com o -wal pequeno")
+    ap.add_argument('--otimizar', action='store_true')
+    args = ap.parse_args()
+    tarefas = [fn for flag, fn in ((args.checkpoint, lambda: print(checkpoint(args.truncar or None))),
+                                   (args.otimizar, otimizar),
+                                   (args.backup, lambda: print(backup()))) if flag]
+    if not tarefas:
+        ap.error("escolha ao menos uma de --backup, --checkpoint, --otimizar")
+    for conta in ([args.conta] if args.conta else listar_contas()):
+        with na_conta(conta):
+            for fn in tarefas:
+                fn()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# metrics.py
+
+import os
+import time
+import logging
+import threading
+import functools
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+
+# Limite para o slow-log (ms) e destino do arquivo
+SLOW_MS = float(os.environ.get('MONITOR_SLOW_MS', '500'))
+SLOW_LOG_PATH = os.environ.get('MONITOR_SLOW_LOG', os.path.join(os.path.dirname(__file__), 'slow.log'))
+# Janela (nº de amostras) para os quantis "recentes"
+JANELA = int(os.environ.get('MONITOR_METRICS_JANELA', '1024'))
+
+_BUCKETS = {
+    'duration_seconds': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'rows': (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000),
+    'payload_bytes': (1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+}
+_HELP = {
+    'duration_seconds': 'Duração de callbacks Dash e chamadas ao banco',
+    'rows': 'Linhas retornadas (DataFrame/listas de registros)',
+    'payload_bytes': 'Tamanho da resposta JSON dos callbacks',
+}
+_QUANTIS = (0.5, 0.95, 0.99)
+
+class _Histograma:
+    __slots__ = ('limites', 'contagens', 'soma', 'n', 'recentes')
+
+    def __init__(self, limites: Tuple[float, ...]):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.n = 0
+        self.recentes = deque(maxlen=JANELA)
+
+    def observar(self, v: float) -> None:
+        self.contagens[bisect_left(self.limites, v)] += 1
+        self.soma += v
+        self.n += 1
+        self.recentes.append(v)
+
+_SERIES: Dict[Tuple[str, str, str], _Histograma] = {}
+# Contadores (tipo, nome, evento) -> n; ex.: ('cache', 'rel_sintetico', 'hit')
+_CONTADORES: Dict[Tuple[str, str, str], int] = {}
+_LOCK = threading.Lock()
+
+def _reiniciar_lock() -> None:
+    # Processos filhos (callbacks em background) podem nascer com o lock preso por outra thread
+    global _LOCK
+    _LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_reiniciar_lock)
+_slow_logger: Optional[logging.Logger] = None
+
+def _get_slow_logger() -> logging.Logger:
+    global _slow_logger
+    if _slow_logger is None:
+        lg = logging.getLogger('monitor.slow')
+        if not lg.handlers:
+            h = logging.FileHandler(SLOW_LOG_PATH, encoding='utf-8')
+            h.setFormatter(logging.Formatter('%(asctime)s %(process)d %(message)s'))
+            lg.addHandler(h)
+            lg.propagate = False
+        _slow_logger = lg
+    return _slow_logger
+
+def observar(tipo: str, nome: str, segundos: Optional[float] = None,
+             linhas: Optional[int] = None, payload: Optional[int] = None) -> None:
+    """Registra uma amostra. tipo: 'callback' | 'db' | outro subsistema."""
+    with _LOCK:
+        for metrica, v in (('duration_seconds', segundos), ('rows', linhas), ('payload_bytes', payload)):
+            if v is None:
+                continue
+            h = _SERIES.get((metrica, tipo, nome))
+            if h is None:
+                h = _SERIES[(metrica, tipo, nome)] = _Histograma(_BUCKETS[metrica])
+            h.observar(v)
+    if segundos is not None and segundos * 1000.0 >= SLOW_MS:
+        try:
+            _get_slow_logger().warning(
+                f"SLOW {tipo}={nome} {segundos * 1000.0:.1f}ms"
+                + (f" linhas={linhas}" if linhas is not None else "")
+            )
+        except Exception as e:
+            logging.warning(f"[METRICS] slow-log falhou: {e}")
+
+def contar(tipo: str, nome: str, evento: str, n: int = 1) -> None:
+    """Incrementa um contador de eventos (acertos/faltas de cache etc.)."""
+    with _LOCK:
+        _CONTADORES[(tipo, nome, evento)] = _CONTADORES.get((tipo, nome, evento), 0) + n
+
+def _contar_linhas(res) -> Optional[int]:
+    """DataFrame/lista -> len; tupla de outputs -> soma das listas de registros."""
+    if hasattr(res, 'shape') and hasattr(res, 'columns'):
+        return int(res.shape[0])
+    if isinstance(res, list):
+        return len(res)
+    if isinstance(res, tuple):
+        listas = [len(x) for x in res if isinstance(x, list)]
+        return sum(listas) if listas else None
+    return None
+
+def medir(tipo: str, nome: Optional[str] = None) -> Callable:
+    """Decorator: tempo e nº de linhas do resultado de cada chamada."""
+    def deco(fn):
+        rotulo = nome or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if tipo == 'callback':
+                _marcar_callback(rotulo)
+            t0 = time.perf_counter()
+            try:
+                res = fn(*args, **kwargs)
+            except Exception:
+                observar(tipo, rotulo, time.perf_counter() - t0)
+                raise
+            observar(tipo, rotulo, time.perf_counter() - t0, linhas=_contar_linhas(res))
+            return res
+        return wrapper
+    return deco
+
+def _marcar_callback(rotulo: str) -> None:
+    # O tamanho do payload é medido no after_request; guarda o nome do callback na request
+    try:
+        from flask import g, has_request_context
+        if has_request_context():
+            g.monitor_callback = rotulo
+    except Exception:
+        pass
+
+def _rotulos(tipo: str, nome: str, extra: str = '') -> str:
+    def esc(v: str) -> str:
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'tipo="{esc(tipo)}",nome="{esc(nome)}"' + extra
+
+def _quantil(ordenados: list, q: float) -> float:
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+def render_prometheus() -> str:
+    """Exposição em texto (Prometheus 0.0.4): histogramas acumulados + quantis da janela recente."""
+    with _LOCK:
+        snap = {k: (h.limites, list(h.contagens), h.soma, h.n, sorted(h.recentes)) for k, h in _SERIES.items()}
+        contadores = sorted(_CONTADORES.items())
+    linhas = []
+    if contadores:
+        linhas.append('# HELP monitor_eventos_total Eventos contados (ex.: hit/miss do cache de relatórios)')
+        linhas.append('# TYPE monitor_eventos_total counter')
+        for (tipo, nome, evento), n in contadores:
+            rot = _rotulos(tipo, nome, ',evento="%s"' % evento)
+            linhas.append(f'monitor_eventos_total{{{rot}}} {n}')
+    for metrica in _BUCKETS:
+        chaves = sorted(k for k in snap if k[0] == metrica)
+        if not chaves:
+            continue
+        base = f'monitor_{metrica}'
+        linhas.append(f'# HELP {base} {_HELP[metrica]}')
+        linhas.append(f'# TYPE {base} histogram')
+        for _, tipo, nome in chaves:
+            limites, contagens, soma, n, _ = snap[(metrica, tipo, nome)]
+            acum = 0
+            for le, cnt in zip(limites, contagens):
+                acum += cnt
+                rot = _rotulos(tipo, nome, ',le="%g"' % le)
+                linhas.append(f'{base}_bucket{{{rot}}} {acum}')
+            rot = _rotulos(tipo, nome, ',le="+Inf"')
+            linhas.append(f'{base}_bucket{{{rot}}} {n}')
+            linhas.append(f'{base}_sum{{{_rotulos(tipo, nome)}}} {soma:.6f}')
+            linhas.append(f'{base}_count{{{_rotulos(tipo, nome)}}} {n}')
+        rec = f'monitor_{metrica}_recent'
+        linhas.append(f'# HELP {rec} {_HELP[metrica]} (últimas {JANELA} amostras)')
+        linhas.append(f'# TYPE {rec} summary')
+        for _, tipo, nome in chaves:
+            limites, contagens, soma, n, ordenados = snap[(metrica, tipo, nome)]
+            for q in _QUANTIS:
+                rot = _rotulos(tipo, nome, ',quantile="%s"' % q)
+                linhas.append(f'{rec}{{{rot}}} {_quantil(ordenados, q):g}')
+            linhas.append(f'{rec}_sum{{{_rotulos(tipo, nome)}}} {sum(ordenados):.6f}')
+            linhas.append(f'{rec}_count{{{_rotulos(tipo, nome)}}} {len(ordenados)}')
+    return '\n'.join(linhas) + '\n'
+
+def resumo() -> dict:
+    """Quantis recentes por série (uso em scripts/benchmarks)."""
+    with _LOCK:
+        return {
+            **{
+                f'{m}:{t}:{n}': {
+                    'n': h.n,
+                    **{f'p{int(q * 100)}': _quantil(sorted(h.recentes), q) for q in _QUANTIS},
+                }
+                for (m, t, n), h in _SERIES.items()
+            },
+            **{f'eventos:{t}:{n}:{e}': c for (t, n, e), c in _CONTADORES.items()},
+        }
+
+def instrumentar_app(app) -> None:
+    """
+    - envolve todo callback registrado depois desta chamada (app.callback) com medir('callback');
+    - mede o payload das respostas de /_dash-update-component;
+    - expõe GET /metrics no Flask server.
+    """
+    from flask import Response, g, request
+
+    orig_callback = app.callback
+
+    def callback(*args, **kwargs):
+        registrar = orig_callback(*args, **kwargs)
+
+        def deco(fn):
+            return registrar(medir('callback', fn.__name__)(fn))
+        return deco
+
+    app.callback = callback
+    server = app.server
+
+    @server.after_request
+    def _medir_payload(resp):
+        rotulo = getattr(g, 'monitor_callback', None)
+        if rotulo and request.path.endswith('_dash-update-component'):
+            try:
+                observar('callback', rotulo, payload=resp.calculate_content_length() or len(resp.get_data()))
+            except Exception:
+                pass
+        return resp
+
+    server.add_url_rule(
+        '/metrics', 'metrics',
+        lambda: Response(render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+    )
+    logging.info("[METRICS] Instrumentação ativa (/metrics, slow-log >= %.0fms)", SLOW_MS)
@@ -0,0 +1,380 @@
+# planos.py
+#
+# Auditoria dos planos de consulta: roda os cenários do benchmark (e leituras
+# que ele não cobre) com o rastreio de SQL ligado (database.rastrear_sql), faz
+# EXPLAIN QUERY PLAN de cada comando distinto e aponta:
+# - SCAN de tabela inteira, SCAN por índice (varredura completa do índice),
+#   índice automático (o SQLite cria um índice temporário a cada execução) e
+#   USE TEMP B-TREE (ordenação/agrupamento sem índice);
+# - índices sugeridos para as combinações de filtro reais: colunas de igualdade,
+#   depois a primeira de intervalo (ou as do ORDER BY/GROUP BY); cobrindo quando
+#   faltam poucas colunas; parcial quando o filtro tem 'col IS NOT NULL';
+# - índices existentes que nenhum plano usou nos cenários.
+# Com --medir, aplica as sugestões numa cópia do banco e compara tempos e planos
+# (sugestão que o planejador não usa é descartada).
+# Uso:
+#   python planos.py [--escala 1k] [--dados bench_data] [--medir] [--repeticoes 5]
+#                    [--saida planos_report.json]
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import logging
+import argparse
+import tempfile
+import statistics
+import datetime as dt
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault('MONITOR_JOBS', '0')
+
+import benchmark
+
+# Comandos auditados (o resto: PRAGMA, BEGIN, CREATE, SAVEPOINT...)
+_AUDITADOS = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+# Preparo da conexão que os comandos pressupõem (views temporárias e partições do historico)
+_PREPARO = ('ATTACH', 'CREATE TEMP VIEW')
+_PALAVRAS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ON', 'GROUP', 'ORDER', 'LIMIT',
+             'UNION', 'USING', 'SET', 'AS', 'NATURAL', 'WINDOW', 'VALUES'}
+_OPERADOR = r'(=|==|\bIN\b|\bIS NOT NULL\b|\bIS\b|<=|>=|<|>|\bBETWEEN\b|\bLIKE\b|\bGLOB\b)'
+
+def normalizar(sql: str) -> str:
+    """Forma canônica do comando: literais viram '?' e espaços colapsam."""
+    s = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    s = re.sub(r'\b\d+(?:\.\d+)?\b', '?', s)
+    return re.sub(r'\s+', ' ', s).strip()
+
+def capturar(cenarios: Dict[str, Callable]) -> Dict[str, dict]:
+    """
+    Roda os cenários com o rastreio ligado.
+    Retorna {sql normalizado: {'sql': exemplo concreto, 'n': execuções, 'cenarios': [...]}};
+    o preparo (ATTACH/CREATE TEMP VIEW, na ordem) fica na chave ''.
+    """
+    import database
+    comandos: Dict[str, dict] = {'': {'sql': [], 'n': 0, 'cenarios': []}}
+    atual = ['']
+
+    def registrar(sql: str) -> None:
+        inicio = sql.lstrip().upper()
+        if inicio.startswith(_PREPARO):
+            if sql not in comandos['']['sql']:
+                comandos['']['sql'].append(sql)
+            return
+        if not inicio.startswith(_AUDITADOS):
+            return
+        chave = normalizar(sql)
+        item = comandos.setdefault(chave, {'sql': sql, 'n': 0, 'cenarios': []})
+        item['n'] += 1
+        if atual[0] not in item['cenarios']:
+            item['cenarios'].append(atual[0])
+
+    database.rastrear_sql(registrar)
+    try:
+        for nome, fn in cenarios.items():
+            atual[0] = nome
+            try:
+                fn()
+            except Exception as e:
+                logging.warning(f"[PLANO] cenário {nome} falhou: {e}")
+    finally:
+        database.rastrear_sql(None)
+    return comandos
+
+def cenarios_extras() -> Dict[str, Callable]:
+    """Leituras fora do benchmark: histórico, estruturas, rolagens, vencimentos, dropdowns."""
+    import database
+    import historico
+    import vencimentos
+    fim90 = benchmark.PERIODO_90D[1]
+
+    def vencidas():
+        with database._connect() as conn:
+            return vencimentos._vencidas(conn.cursor(), dt.date.today().isoformat())
+
+    def pernas():
+        estruturas = database.get_lookup_values()['estrutura']
+        return database.get_pernas(estrutura=estruturas[0] if estruturas else '')
+
+    return {
+        'get_lookup_values': database.get_lookup_values,
+        'get_transactions_busca': lambda: database.get_transactions('PETR'),
+        'get_encerradas_90d': lambda: database.get_encerradas(None, *benchmark.PERIODO_90D),
+        'posicoes_em': lambda: historico.posicoes_em(fim90),
+        'get_pernas': pernas,
+        'get_cadeias': database.get_cadeias,
+        'get_cadeia': lambda: database.get_cadeia(1),
+        'vencidas': vencidas,
+    }
+
+def _tabelas(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    nomes = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+    return {t: [r[1] for r in conn.execute(f"PRAGMA table_info({t})")] for t in nomes}
+
+def _chaves(conn: sqlite3.Connection, tabelas: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    return {t: [r[1] for r in conn.execute(f"PRAGMA table_info({t})") if r[5]] for t in tabelas}
+
+def _preparar(conn: sqlite3.Connection, preparo: List[str]) -> Dict[str, str]:
+    """Refaz o preparo capturado; retorna view temporária -> tabela de origem."""
+    vistas = {}
+    for sql in preparo:
+        m = re.match(r'\s*CREATE TEMP VIEW (\w+) AS SELECT \* FROM main\.(\w+)', sql, re.I)
+        try:
+            if m:
+                conn.execute(f"DROP VIEW IF EXISTS temp.{m.group(1)}")
+                vistas[m.group(1)] = m.group(2)
+            conn.execute(sql)
+        except sqlite3.Error as e:
+            logging.warning(f"[PLANO] preparo falhou ({e}): {sql[:80]}")
+    return vistas
+
+def _indices(conn: sqlite3.Connection) -> Dict[str, str]:
+    return {nome: tabela for nome, tabela in conn.execute(
+        "SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")}
+
+def _apelidos(sql: str, tabelas: Dict[str, List[str]], vistas: Dict[str, str]) -> Dict[str, str]:
+    """Apelido (ou o próprio nome) -> tabela, para as tabelas/views após FROM/JOIN/UPDATE/INTO."""
+    mapa = {}
+    for m in re.finditer(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:main\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        tabela, apelido = vistas.get(m.group(1), m.group(1)), m.group(2)
+        if tabela not in tabelas:
+            continue
+        mapa[m.group(1)] = mapa[tabela] = tabela
+        if apelido and apelido.upper() not in _PALAVRAS:
+            mapa[apelido] = tabela
+    return mapa
+
+def explicar(conn: sqlite3.Connection, sql: str) -> List[str]:
+    return [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+
+def alertas(plano: List[str], apelidos: Dict[str, str]) -> List[dict]:
+    """Linhas do plano que merecem atenção, com a tabela real quando houver."""
+    achados = []
+    for linha in plano:
+        m = re.match(r'(SCAN|SEARCH) (\w+)(.*)', linha)
+        if m and m.group(2) in apelidos:
+            tabela, resto = apelidos[m.group(2)], m.group(3)
+            if 'AUTOMATIC' in resto:
+                achados.append({'tipo': 'indice_automatico', 'tabela': tabela, 'detalhe': linha})
+            elif m.group(1) == 'SCAN' and 'INDEX' in resto:
+                achados.append({'tipo': 'scan_indice', 'tabela': tabela, 'detalhe': linha})
+            elif m.group(1) == 'SCAN':
+                achados.append({'tipo': 'scan', 'tabela': tabela, 'detalhe': linha})
+        elif linha.startswith('USE TEMP B-TREE'):
+            achados.append({'tipo': 'temp_btree', 'tabela': None, 'detalhe': linha})
+    return achados
+
+def _predicados(sql: str, tabela: str, colunas: List[str], apelidos: Dict[str, str]) -> dict:
+    """Colunas da tabela por papel no comando: igualdade, intervalo, IS NOT NULL, ordenação."""
+    donos = {a for a, t in apelidos.items() if t == tabela}
+    unica = len(set(apelidos.values())) == 1
+    eq, faixa, nao_nulo = [], [], []
+    for m in re.finditer(r'(?:\b(\w+)\.)?\b(\w+)\s*' + _OPERADOR, sql, re.I):
+        qual, col, op = m.group(1), m.group(2), m.group(3).upper()
+        if col not in colunas or (qual and qual not in donos) or (not qual and not unica and col not in _so_desta(tabela, col, apelidos)):
+            continue
+        destino = nao_nulo if op == 'IS NOT NULL' else eq if op in ('=', '==', 'IN', 'IS') else faixa
+        if col not in destino:
+            destino.append(col)
+    ordem = []
+    for m in re.finditer(r'\b(?:ORDER|GROUP) BY\s+(.+?)(?=\bLIMIT\b|\)|$)', sql, re.I | re.S):
+        for termo in m.group(1).split(','):
+            ref = re.match(r'\s*(?:(\w+)\.)?(\w+)', termo)
+            if ref and ref.group(2) in colunas and (not ref.group(1) or ref.group(1) in donos) \
+                    and ref.group(2) not in ordem:
+                ordem.append(ref.group(2))
+    usadas = [c for c in colunas if re.search(r'\b' + c + r'\b', sql)]
+    return {'eq': eq, 'faixa': faixa, 'nao_nulo': nao_nulo, 'ordem': ordem, 'usadas': usadas}
+
+_COLUNAS: Dict[str, List[str]] = {}
+
+def _so_desta(tabela: str, col: str, apelidos: Dict[str, str]) -> List[str]:
+    # coluna sem qualificador: atribuída à tabela só se nenhuma outra do comando a tem
+    outras = {t for t in apelidos.values() if t != tabela}
+    return [] if any(col in _COLUNAS.get(t, []) for t in outras) else [col]
+
+def sugerir(sql: str, tabela: str, colunas: List[str], apelidos: Dict[str, str],
+            pk: List[str]) -> Optional[dict]:
+    """Índice composto (cobrindo/parcial quando couber) para o filtro do comando; None se não há filtro."""
+    p = _predicados(sql, tabela, colunas, apelidos)
+    chave = p['eq'] + (p['faixa'][:1] if p['faixa'] else [c for c in p['ordem'] if c not in p['eq']])
+    chave = [c for c in dict.fromkeys(chave) if c not in pk]
+    if not chave:
+        return None
+    extras = [c for c in p['usadas'] if c not in chave and c not in pk]
+    if 0 < len(extras) <= 3:
+        chave = chave + extras  # cobrindo: a consulta não volta à tabela
+    parcial = [c for c in p['nao_nulo'] if c not in chave[:1]]
+    nome = ('idx_sug_' + tabela + '_' + '_'.join(chave))[:60]
+    ddl = f"CREATE INDEX IF NOT EXISTS {nome} ON {tabela} ({', '.join(chave)})"
+    if parcial:
+        ddl += ' WHERE ' + ' AND '.join(f'{c} IS NOT NULL' for c in parcial)
+    return {'nome': nome, 'tabela': tabela, 'ddl': ddl, 'cobrindo': 0 < len(extras) <= 3,
+            'parcial': bool(parcial)}
+
+def auditar(comandos: Dict[str, dict], caminho: str) -> dict:
+    """Planos, alertas e sugestões de cada comando capturado, no banco 'caminho'."""
+    conn = sqlite3.connect(caminho)
+    try:
+        tabelas = _tabelas(conn)
+        pks = _chaves(conn, tabelas)
+        _COLUNAS.clear()
+        _COLUNAS.update(tabelas)
+        indices = _indices(conn)
+        vistas = _preparar(conn, comandos['']['sql'])
+        usados = set()
+        itens, sugestoes = [], {}
+        for chave, item in comandos.items():
+            if not chave:
+                continue
+            sql = item['sql']
+            apelidos = _apelidos(sql, tabelas, vistas)
+            try:
+                plano = explicar(conn, sql)
+            except sqlite3.Error as e:
+                # ex.: partições anexadas (arq.*) fora da conexão original
+                itens.append({'sql': chave, 'n': item['n'], 'cenarios': item['cenarios'], 'erro': str(e)})
+                continue
+            usados.update(i for i in indices if any(re.search(r'\b' + i + r'\b', l) for l in plano))
+            achados = alertas(plano, apelidos)
+            propostas = []
+            for tabela in dict.fromkeys(a['tabela'] or _dona_da_ordem(sql, apelidos, tabelas) for a in achados):
+                if tabela is None:
+                    continue
+                s = sugerir(sql, tabela, tabelas[tabela], apelidos, pks[tabela])
+                if s and s['nome'] not in indices:
+                    sugestoes.setdefault(s['nome'], dict(s, comandos=[]))['comandos'].append(chave)
+                    propostas.append(s['nome'])
+            itens.append({'sql': chave, 'n': item['n'], 'cenarios': item['cenarios'], 'plano': plano,
+                          'alertas': achados, 'sugestoes': propostas})
+        sem_uso = sorted(i for i in indices if i not in usados and not i.startswith('idx_sug_'))
+    finally:
+        conn.close()
+    return {'comandos': itens, 'sugestoes': list(sugestoes.values()), 'indices_sem_uso': sem_uso}
+
+def _dona_da_ordem(sql: str, apelidos: Dict[str, str], tabelas: Dict[str, List[str]]) -> Optional[str]:
+    # TEMP B-TREE não diz a tabela: a do primeiro termo do ORDER BY/GROUP BY
+    m = re.search(r'\b(?:ORDER|GROUP) BY\s+(?:(\w+)\.)?(\w+)', sql, re.I)
+    if not m:
+        return None
+    if m.group(1):
+        return apelidos.get(m.group(1))
+    return next((t for t in dict.fromkeys(apelidos.values()) if m.group(2) in tabelas[t]), None)
+
+def _tempo(conn: sqlite3.Connection, sql: str, repeticoes: int) -> float:
+    conn.execute(sql).fetchall()  # aquecimento (cache de páginas e de plano)
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        conn.execute(sql).fetchall()
+        tempos.append(time.perf_counter() - t0)
+    return statistics.median(tempos)
+
+def medir(comandos: Dict[str, dict], auditoria: dict, caminho: str, repeticoes: int) -> dict:
+    """
+    Numa cópia do banco: mediana de cada SELECT sem e com as sugestões (após
+    ANALYZE nos dois casos). Sugestão que não aparece em nenhum plano é descartada.
+    """
+    tmp = tempfile.mkdtemp(prefix='planos_')
+    copia = os.path.join(tmp, 'copia.db')
+    try:
+        with sqlite3.connect(caminho) as origem, sqlite3.connect(copia) as destino:
+            origem.backup(destino)
+        conn = sqlite3.connect(copia)
+        _preparar(conn, comandos['']['sql'])
+        leituras = {k: v['sql'] for k, v in comandos.items()
+                    if k and normalizar(v['sql']).upper().startswith(('SELECT', 'WITH'))}
+        conn.execute('ANALYZE')
+        antes = {}
+        for chave, sql in leituras.items():
+            try:
+                antes[chave] = _tempo(conn, sql, repeticoes)
+            except sqlite3.Error:
+                pass
+        paginas_antes = conn.execute('PRAGMA page_count').fetchone()[0]
+        for s in auditoria['sugestoes']:
+            conn.execute(s['ddl'])
+        conn.execute('ANALYZE')
+        paginas_depois = conn.execute('PRAGMA page_count').fetchone()[0]
+        usadas = set()
+        depois = {}
+        for chave in antes:
+            plano = explicar(conn, leituras[chave])
+            usadas.update(s['nome'] for s in auditoria['sugestoes']
+                          if any(re.search(r'\b' + s['nome'] + r'\b', l) for l in plano))
+            depois[chave] = _tempo(conn, leituras[chave], repeticoes)
+        conn.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    for s in auditoria['sugestoes']:
+        s['usada_pelo_planejador'] = s['nome'] in usadas
+    return {
+        'paginas_extra': paginas_depois - paginas_antes,
+        'total_antes_s': sum(antes.values()),
+        'total_depois_s': sum(depois.values()),
+        'comandos': {k: {'antes_s': antes[k], 'depois_s': depois[k]} for k in antes},
+    }
+
+def rodar(escala: str, dados: str, medir_efeito: bool, repeticoes: int) -> dict:
+    import database
+    logging.getLogger().setLevel(logging.WARNING)
+    caminho = os.path.join(dados, f'{escala}.db')
+    if not os.path.exists(caminho):
+        import gerar_dados
+        n = gerar_dados.ESCALAS.get(escala.lower()) or int(escala)
+        print(f"[PLANO] gerando {caminho} ({n} operações)...", file=sys.stderr)
+        gerar_dados.gerar(caminho, n)
+    os.environ.setdefault('MONITOR_DB_PATH', caminho)
+    database.DB_PATH = caminho
+    import app_layout
+    database.init_database()
+    cen = dict(benchmark.cenarios(app_layout.app), **cenarios_extras())
+    comandos = capturar(cen)
+    rel = auditar(comandos, caminho)
+    rel['meta'] = {'data': dt.datetime.now().isoformat(timespec='seconds'), 'commit': benchmark._git_commit(),
+                   'escala': escala, 'sqlite': sqlite3.sqlite_version, 'cenarios': list(cen)}
+    if medir_efeito:
+        rel['efeito'] = medir(comandos, rel, caminho, repeticoes)
+    return rel
+
+def imprimir(rel: dict) -> None:
+    for item in rel['comandos']:
+        if not item.get('alertas') and not item.get('erro'):
+            continue
+        print(f"[PLANO] {item['sql'][:140]}", file=sys.stderr)
+        print(f"        x{item['n']} em {', '.join(item['cenarios'])}", file=sys.stderr)
+        if item.get('erro'):
+            print(f"        erro: {item['erro']}", file=sys.stderr)
+        for a in item.get('alertas', []):
+            print(f"        {a['tipo']:<18} {a['detalhe']}", file=sys.stderr)
+    for s in rel['sugestoes']:
+        uso = s.get('usada_pelo_planejador')
+        marca = '' if uso is None else (' (usada)' if uso else ' (ignorada pelo planejador)')
+        print(f"[PLANO] sugestão{marca}: {s['ddl']}", file=sys.stderr)
+    if rel['indices_sem_uso']:
+        print(f"[PLANO] índices sem uso nos cenários: {', '.join(rel['indices_sem_uso'])}", file=sys.stderr)
+    ef = rel.get('efeito')
+    if ef:
+        print(f"[PLANO] efeito: {ef['total_antes_s'] * 1000:.1f}ms -> {ef['total_depois_s'] * 1000:.1f}ms "
+              f"(soma das medianas), +{ef['paginas_extra']} páginas", file=sys.stderr)
+
+def main():
+    ap = argparse.ArgumentParser(description="Auditoria de planos de consulta e sugestão de índices")
+    ap.add_argument('--escala', default='1k')
+    ap.add_argument('--dados', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data'))
+    ap.add_argument('--medir', action='store_true', help="aplica as sugestões numa cópia e compara tempos")
+    ap.add_argument('--repeticoes', type=int, default=5)
+    ap.add_argument('--saida', default='planos_report.json')
+    args = ap.parse_args()
+    rel = rodar(args.escala, args.dados, args.medir, args.repeticoes)
+    imprimir(rel)
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(rel, f, indent=2, ensure_ascii=False)
+    print(f"[PLANO] relatório: {args.saida}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+# series.py
+#
+# Cadastro de séries de opção (ticker -> ativo, strike, vencimento, tipo,
+# estilo), para o modal Nova preencher STRIKE, OPERAÇÃO e DATA EXERC ao
+# digitar o ticker (a regra da 3ª sexta em clientside.js fica de reserva para
+# séries fora do cadastro):
+# - tabela 'series' (PK ticker) carregada de um arquivo de referência local:
+#   cadastro de instrumentos da B3 (CSV com TckrSymb, ExrcPric, XprtnDt,
+#   OptnTp, OptnStyl...), CSV próprio (ticker;ativo;strike;vencimento;tipo;estilo)
+#   ou um COTAHIST (última cotação de cada série; sem estilo);
+# - em memória, por conta: tickers ordenados (S12) com colunas paralelas
+#   NumPy; busca exata ou por prefixo com np.searchsorted. Revalida quando
+#   data_version() muda, e só relê a tabela se o carimbo dela mudou;
+# - GET /series?ticker=PETRJ400 (JSON) e o callback do modal usam buscar().
+# Uso:
+#   python series.py InstrumentsConsolidated.csv|COTAHIST_A2024.TXT [--conta principal]
+
+import sqlite3
+import logging
+import argparse
+import datetime as dt
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from database import (_connect, _db_path, _sql_inserir, _bump_data_version, data_version,
+                      init_database, listar_contas, na_conta)
+from historico import _to_iso
+from metrics import medir
+
+logging.basicConfig(level=logging.INFO)
+
+_COLUNAS = ('ticker', 'ativo', 'strike', 'vencimento', 'tipo', 'estilo', 'atualizado_em')
+# Nomes aceitos no CSV para cada coluna (cadastro da B3 primeiro)
+_ALIASES = {
+    'ticker': ('TckrSymb', 'ticker'),
+    'ativo': ('UndrlygTckrSymb1', 'Asst', 'ativo'),
+    'strike': ('ExrcPric', 'strike'),
+    'vencimento': ('XprtnDt', 'vencimento'),
+    'tipo': ('OptnTp', 'tipo'),
+    'estilo': ('OptnStyl', 'estilo'),
+}
+_TIPOS = ('Call', 'Put')
+
+_CACHE: Dict[str, dict] = {}
+
+# -------------------------------
+# Carga do arquivo de referência
+# -------------------------------
+def _iso_ou_none(data: str) -> Optional[str]:
+    try:
+        return _to_iso(data) if data else None
+    except ValueError:
+        return None
+
+def _ler_csv(caminho: str) -> pd.DataFrame:
+    try:
+        df = pd.read_csv(caminho, sep=None, engine='python', dtype=str, encoding='utf-8-sig')
+    except UnicodeDecodeError:
+        df = pd.read_csv(caminho, sep=None, engine='python', dtype=str, encoding='latin-1')
+    cols = {}
+    for destino, nomes in _ALIASES.items():
+        achada = next((n for n in nomes if n in df.columns), None)
+        cols[destino] = df[achada].fillna('').str.strip() if achada else pd.Series('', index=df.index)
+    out = pd.DataFrame(cols)
+    out['ticker'] = out['ticker'].str.upper()
+    out['tipo'] = out['tipo'].str.capitalize()
+    out = out[(out['ticker'] != '') & out['tipo'].isin(_TIPOS)]
+    # '1.234,56' (pt-BR) ou '1234.56'
+    strike = out['strike'].where(~out['strike'].str.contains(','),
+                                 out['strike'].str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    out['strike'] = pd.to_numeric(strike, errors='coerce')
+    out['vencimento'] = [_iso_ou_none(v) for v in out['vencimento']]
+    out['estilo'] = out['estilo'].str.upper().str[:1].where(out['estilo'].str.upper().str[:1].isin(['A', 'E']))
+    out['ativo'] = out['ativo'].where(out['ativo'] != '', out['ticker'].str[:4])
+    return out
+
+def _de_cotahist(caminho: str) -> pd.DataFrame:
+    from cotahist import ler, opcoes, _texto, _iso, _int, TPMERC_OPCAO
+    sel = opcoes(ler(caminho))[::-1]  # arquivo em ordem de pregão: a primeira após inverter é a última
+    _, primeira = np.unique(sel['codneg'], return_index=True)
+    sel = sel[primeira]
+    tickers = _texto(sel['codneg'])
+    return pd.DataFrame({
+        'ticker': tickers,
+        'ativo': [t[:4] for t in tickers],
+        'strike': (_int(sel['preexe']) / 100.0).tolist(),
+        'vencimento': _iso(sel['datven']),
+        'tipo': [TPMERC_OPCAO[t] for t in sel['tpmerc'].tolist()],
+        'estilo': None,
+    })
+
+def _eh_cotahist(caminho: str) -> bool:
+    import zipfile
+    if zipfile.is_zipfile(caminho):
+        return True
+    with open(caminho, 'rb') as f:
+        return f.read(10) == b'00COTAHIST'
+
+@medir('db')
+def carregar(caminho: str) -> int:
+    """Grava (substitui por ticker) as séries do arquivo na conta ativa; retorna o nº de séries."""
+    df = _de_cotahist(caminho) if _eh_cotahist(caminho) else _ler_csv(caminho)
+    df['atualizado_em'] = dt.datetime.now().isoformat(timespec='seconds')
+    df = df.drop_duplicates('ticker', keep='last')
+    linhas = list(df[list(_COLUNAS)].astype(object).where(df[list(_COLUNAS)].notna(), None)
+                  .itertuples(index=False, name=None))
+    init_database()
+    with _connect() as conn:
+        conn.executemany(_sql_inserir('series', _COLUNAS, 'REPLACE'), linhas)
+    _bump_data_version()
+    logging.info(f"[SERIES] {len(linhas)} séries carregadas de {caminho}")
+    return len(linhas)
+
+# -------------------------------
+# Índice em memória
+# -------------------------------
+def _indice() -> dict:
+    caminho = _db_path()
+    versao = data_version()
+    cache = _CACHE.get(caminho)
+    if cache is not None and cache['versao'] == versao:
+        return cache
+    try:
+        with _connect() as conn:
+            marca = conn.execute("SELECT COUNT(*), MAX(atualizado_em) FROM series").fetchone()
+            if cache is not None and cache['marca'] == marca:
+                cache['versao'] = versao
+                return cache
+            # ORDER BY (BINARY) = ordem de bytes = ordem do np.searchsorted sobre S12
+            linhas = conn.execute("""SELECT ticker, ativo, strike, vencimento, tipo, estilo
+                                     FROM series ORDER BY ticker""").fetchall()
+    except sqlite3.OperationalError:  # banco sem a tabela (init_database ainda não rodou)
+        marca, linhas = None, []
+    ticker, ativo, strike, venc, tipo, estilo = zip(*linhas) if linhas else ((),) * 6
+    ativos, ativo_idx = np.unique(np.array(ativo, dtype='U12'), return_inverse=True)
+    cache = {
+        'versao': versao,
+        'marca': marca,
+        'ticker': np.array(ticker, dtype='S12'),
+        'ativos': ativos.tolist(),
+        'ativo': ativo_idx.astype(np.int32),
+        'strike': np.array([np.nan if s is None else s for s in strike], dtype=np.float64),
+        'vencimento': np.array([v or '' for v in venc], dtype='S10'),
+        'put': np.array([t == 'Put' for t in tipo], dtype=bool),
+        'estilo': np.array([e or '' for e in estilo], dtype='S1'),
+    }
+    _CACHE[caminho] = cache
+    return cache
+
+def _serie(idx: dict, i: int) -> dict:
+    venc = idx['vencimento'][i].decode()
+    strike = float(idx['strike'][i])
+    return {
+        'ticker': idx['ticker'][i].decode(),
+        'ativo': idx['ativos'][idx['ativo'][i]],
+        'strike': None if np.isnan(strike) else strike,
+        'vencimento': f"{venc[8:10]}/{venc[5:7]}/{venc[0:4]}" if venc else None,  # formato do formulário
+        'operacao': 'Put' if idx['put'][i] else 'Call',
+        'estilo': idx['estilo'][i].decode() or None,
+    }
+
+def buscar(ticker: Optional[str]) -> Optional[dict]:
+    """Série do ticker (exato) na conta ativa ou None."""
+    chave = str(ticker or '').strip().upper().encode('ascii', 'ignore')
+    if not chave or len(chave) > 12:
+        return None
+    idx = _indice()
+    i = int(np.searchsorted(idx['ticker'], chave))
+    if i < len(idx['ticker']) and idx['ticker'][i] == chave:
+        return _serie(idx, i)
+    return None
+
+def sugerir(prefixo: Optional[str], limite: int = 10) -> List[str]:
+    """Tickers do cadastro que começam com 'prefixo' (até 'limite')."""
+    chave = str(prefixo or '').strip().upper().encode('ascii', 'ignore')
+    if not chave:
+        return []
+    idx = _indice()
+    i = int(np.searchsorted(idx['ticker'], chave))
+    j = int(np.searchsorted(idx['ticker'], chave + b'\xff'))
+    return [t.decode() for t in idx['ticker'][i:min(j, i + limite)]]
+
+def registrar_rota(server) -> None:
+    """GET /series?ticker=... -> {'serie': {...} | null, 'sugestoes': [...]}."""
+    from flask import jsonify, request
+
+    def _rota():
+        t = request.args.get('ticker', '')
+        return jsonify({'serie': buscar(t), 'sugestoes': sugerir(t)})
+    server.add_url_rule('/series', 'series', _rota)
+
+def main():
+    ap = argparse.ArgumentParser(description="Carrega o cadastro de séries de opção")
+    ap.add_argument('arquivo', help="CSV de instrumentos da B3, CSV próprio ou COTAHIST (.TXT/.ZIP)")
+    ap.add_argument('--conta', default=None, help="padrão: todas")
+    args = ap.parse_args()
+    for conta in ([args.conta] if args.conta else listar_contas()):
+        with na_conta(conta):
+            print(conta, carregar(args.arquivo))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+# snapshot.py
+#
+# Snapshot colunar de encerradas (Arrow IPC) para os relatórios, com os tipos
+# de esquema.ENCERRADAS (datas como timestamp, texto repetitivo como dicionário).
+# Arquivos em <dir do banco>/snapshot/<base>_enc_g<geração>_<n>.arrow + manifesto
+# <base>_enc.json. Encerradas só recebe INSERTs: cada atualização grava apenas as
+# linhas com id > max_id do manifesto (um arquivo delta); com muitos deltas, ou se
+# a contagem não bate (restauração, exclusão manual), o snapshot é regravado.
+# Leitura via memory map: os workers do gunicorn compartilham as páginas do arquivo.
+# Sem pyarrow, ou com MONITOR_SNAPSHOT=0, os relatórios leem direto do SQLite.
+
+import os
+import json
+import logging
+import threading
+import datetime as dt
+from typing import List, Optional
+
+import pandas as pd
+
+import database
+from database import _connect, _db_path, _ENC_COLS, _ler_particionado, data_version, init_database
+from esquema import ENCERRADAS, CATEGORIA, DATA, tipar
+from metrics import medir
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+
+SNAPSHOT_ATIVO = os.environ.get('MONITOR_SNAPSHOT', '1') != '0'
+# Acima deste número de arquivos delta o snapshot é compactado num só
+MAX_PARTES = int(os.environ.get('MONITOR_SNAPSHOT_MAX_PARTES', '8'))
+
+# Formato dos arquivos; manifesto de outra versão força a recriação
+# (3: valores REAL reescritos pela migração para ponto fixo, ver dinheiro.py)
+_VERSAO = 3
+
+_LOCK = threading.Lock()
+# Por arquivo de banco: {'versao', 'partes', 'tabelas' (arquivo -> pa.Table), 'tabela'}
+_CACHE = {}
+
+def _reiniciar_lock() -> None:
+    # Callbacks em background (processo filho) leem o snapshot: o lock pode nascer preso
+    global _LOCK
+    _LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_reiniciar_lock)
+
+def disponivel() -> bool:
+    return SNAPSHOT_ATIVO and pa is not None
+
+def _tipo_arrow(tipo: str) -> 'pa.DataType':
+    if tipo == CATEGORIA:
+        return pa.dictionary(pa.int32(), pa.string())
+    if tipo == DATA:
+        return pa.timestamp('ns')
+    return {'int64': pa.int64(), 'Int64': pa.int64(), 'Int32': pa.int32(),
+            'float64': pa.float64(), 'string': pa.string()}[tipo]
+
+def _schema() -> 'pa.Schema':
+    return pa.schema([pa.field(nome, _tipo_arrow(ENCERRADAS[nome]))
+                      for nome in [c.strip() for c in _ENC_COLS.split(',')]])
+
+def _tipos_pandas() -> dict:
+    # direto para os tipos anuláveis do esquema, sem passar por object/float64
+    return {pa.int32(): pd.Int32Dtype(), pa.string(): pd.StringDtype()} if pa is not None else {}
+
+_TIPOS_PANDAS = _tipos_pandas()
+
+def _dir() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(_db_path())), 'snapshot')
+
+def _base() -> str:
+    return os.path.join(_dir(), os.path.splitext(os.path.basename(_db_path()))[0] + '_enc')
+
+def _ler_manifesto() -> Optional[dict]:
+    try:
+        with open(_base() + '.json', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _gravar_atomico(caminho: str, escrever) -> None:
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    escrever(tmp)
+    os.replace(tmp, caminho)
+
+def _gravar_manifesto(man: dict) -> None:
+    man['atualizado_em'] = dt.datetime.now().isoformat(timespec='seconds')
+
+    def escrever(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(man, f)
+    _gravar_atomico(_base() + '.json', escrever)
+
+def _para_arrow(df: pd.DataFrame) -> 'pa.Table':
+    """Linhas de get_encerradas (já tipadas) -> tabela Arrow."""
+    # sem metadados do pandas: os tipos da leitura vêm de esquema.tipar
+    return pa.Table.from_pandas(df, schema=_schema(), preserve_index=False).replace_schema_metadata(None)
+
+def _gravar_parte(tabela: 'pa.Table', nome: str) -> None:
+    # IPC sem compressão: o memory map lê os buffers direto do arquivo
+    def escrever(tmp):
+        with pa.OSFile(tmp, 'wb') as sink:
+            with pa.ipc.new_file(sink, tabela.schema) as w:
+                w.write_table(tabela)
+    _gravar_atomico(os.path.join(_dir(), nome), escrever)
+
+def _remover(nomes: List[str]) -> None:
+    # Leitores com o arquivo mapeado continuam válidos após o unlink (POSIX)
+    for nome in nomes:
+        try:
+            os.remove(os.path.join(_dir(), nome))
+        except OSError:
+            pass
+
+class _Trava:
+    """Lock entre processos (flock) para a escrita do snapshot de um banco."""
+
+    def __enter__(self):
+        os.makedirs(_dir(), exist_ok=True)
+        self._f = open(_base() + '.lock', 'a')
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+def _contagem() -> tuple:
+    """(MAX(id), total de linhas) de encerradas, incluindo as partições arquivadas."""
+    with _connect() as conn:
+        max_id, n = conn.execute("SELECT MAX(id), COUNT(*) FROM encerradas").fetchone()
+        arq_n, = conn.execute("SELECT SUM(n_linhas) FROM particoes WHERE tabela='encerradas'").fetchone()
+    return int(max_id or 0), int(n or 0) + int(arq_n or 0)
+
+def _recriar(man: Optional[dict]) -> dict:
+    geracao = int((man or {}).get('geracao', 0)) + 1
+    df = database.get_encerradas()
+    nome = f"{os.path.basename(_base())}_g{geracao}_0.arrow"
+    _gravar_parte(_para_arrow(df), nome)
+    novo = {'versao': _VERSAO, 'geracao': geracao, 'partes': [nome],
+            'max_id': int(df['id'].max()) if not df.empty else 0, 'linhas': int(df.shape[0])}
+    _gravar_manifesto(novo)
+    if man:
+        _remover(man.get('partes', []))
+    logging.info(f"[SNAP] snapshot recriado: {novo['linhas']} linhas ({nome})")
+    return novo
+
+def _compactar(man: dict) -> dict:
+    tabelas = [_abrir(nome) for nome in man['partes']]
+    geracao = int(man['geracao']) + 1
+    nome = f"{os.path.basename(_base())}_g{geracao}_0.arrow"
+    _gravar_parte(pa.concat_tables(tabelas).combine_chunks().unify_dictionaries(), nome)
+    antigas = man['partes']
+    man = dict(man, geracao=geracao, partes=[nome])
+    _gravar_manifesto(man)
+    _remover(antigas)
+    logging.info(f"[SNAP] {len(antigas)} arquivos compactados em {nome}")
+    return man
+
+@medir('db')
+def atualizar() -> int:
+    """
+    Leva o snapshot da conta ativa até o estado atual de encerradas.
+    Retorna o número de linhas acrescentadas (-1 se o snapshot foi recriado).
+    """
+    if not disponivel():
+        return 0
+    try:
+        return _atualizar()
+    except Exception as e:
+        logging.warning(f"[SNAP] atualizar erro: {e}")
+        return 0
+
+def _atualizar() -> int:
+    init_database()
+    with _Trava():
+        man = _ler_manifesto()
+        max_id, total = _contagem()
+        if not man or man.get('versao') != _VERSAO:
+            _recriar(man)
+            return -1
+        # max_id do banco quente pode ficar abaixo do snapshot se as últimas linhas forem arquivadas
+        if max_id <= man['max_id'] and total == man['linhas']:
+            return 0
+        if total <= man['linhas']:
+            _recriar(man)
+            return -1
+        with _connect() as conn:
+            delta = tipar(_ler_particionado(conn, 'encerradas', _ENC_COLS, 'id > ?', [man['max_id']], None, None),
+                          ENCERRADAS)
+        if man['linhas'] + delta.shape[0] != total:
+            _recriar(man)  # linhas antigas removidas/reinseridas: delta não basta
+            return -1
+        nome = f"{os.path.basename(_base())}_g{man['geracao']}_{len(man['partes'])}.arrow"
+        _gravar_parte(_para_arrow(delta), nome)
+        man = dict(man, partes=man['partes'] + [nome], max_id=max(max_id, man['max_id']), linhas=total)
+        _gravar_manifesto(man)
+        if len(man['partes']) > MAX_PARTES:
+            _compactar(man)
+    logging.info(f"[SNAP] +{delta.shape[0]} encerradas no snapshot")
+    return int(delta.shape[0])
+
+def _abrir(nome: str) -> 'pa.Table':
+    with pa.memory_map(os.path.join(_dir(), nome), 'r') as mm:
+        return pa.ipc.open_file(mm).read_all()
+
+def _tabela() -> 'pa.Table':
+    """Tabela Arrow (mapeada) da conta ativa; revalida só quando data_version() muda."""
+    caminho = _db_path()
+    versao = data_version()
+    with _LOCK:
+        cache = _CACHE.get(caminho)
+        if cache and cache['versao'] == versao:
+            return cache['tabela']
+        atualizar()
+        man = _ler_manifesto()
+        if man is None:
+            raise RuntimeError('manifesto ausente')
+        if cache and cache['partes'] == man['partes']:
+            cache['versao'] = versao
+            return cache['tabela']
+        anteriores = cache['tabelas'] if cache else {}
+        tabelas = {nome: anteriores.get(nome) or _abrir(nome) for nome in man['partes']}
+        tabela = pa.concat_tables(list(tabelas.values())) if tabelas else _schema().empty_table()
+        _CACHE[caminho] = {'versao': versao, 'partes': man['partes'], 'tabelas': tabelas, 'tabela': tabela}
+        return tabela
+
+def _filtrar(tabela: 'pa.Table', busca: Optional[str], inicio: Optional[str],
+             fim: Optional[str]) -> 'pa.Table':
+    """Mesmos filtros de database.get_encerradas (ticker e período de data_encerr)."""
+    mascara = None
+
+    def e(m):
+        return m if mascara is None else pc.and_(mascara, m)
+    termo = ''.join(ch for ch in str(busca or '').upper() if ch.isascii() and ch.isalnum())
+    if termo:
+        if len(termo) < 3:
+            mascara = e(pc.starts_with(tabela['ticker'], termo))
+        else:
+            mascara = e(pc.match_substring(tabela['ticker'], termo))
+    tipo = pa.timestamp('ns')
+    if inicio:
+        limite = pa.scalar(dt.datetime.fromisoformat(str(inicio)[:10]), tipo)
+        mascara = e(pc.greater_equal(tabela['data_encerr'], limite))
+    if fim:
+        limite = pa.scalar(dt.datetime.fromisoformat(str(fim)[:10]), tipo)
+        mascara = e(pc.less_equal(tabela['data_encerr'], limite))
+    if mascara is None:
+        return tabela
+    return tabela.filter(pc.fill_null(mascara, False))
+
+@medir('db')
+def ler_encerradas(busca: Optional[str] = None, inicio: Optional[str] = None,
+                   fim: Optional[str] = None) -> pd.DataFrame:
+    """
+    Encerradas para os relatórios: mesmas colunas e tipos de
+    database.get_encerradas. Sem snapshot disponível, lê do SQLite.
+    """
+    if disponivel():
+        try:
+            tabela = _filtrar(_tabela(), busca, inicio, fim)
+            df = tabela.to_pandas(split_blocks=True, types_mapper=_TIPOS_PANDAS.get)
+            return tipar(df, ENCERRADAS)
+        except Exception as e:
+            logging.warning(f"[SNAP] snapshot indisponível ({e}); lendo do SQLite")
+    return database.get_encerradas(busca=busca, inicio=inicio, fim=fim)
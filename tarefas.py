@@ -0,0 +1,118 @@
+# tarefas.py
+
+import os
+import logging
+from typing import Optional
+
+logging.basicConfig(level=logging.INFO)
+
+# Callbacks longos (relatórios, exportações, recálculo) rodam fora da thread do
+# gunicorn: processo filho + resultado em disco (diskcache), compartilhado entre
+# workers. Sem diskcache/multiprocess/psutil, ou com MONITOR_BACKGROUND=0,
+# os mesmos callbacks rodam de forma síncrona.
+BACKGROUND_ATIVO = os.environ.get('MONITOR_BACKGROUND', '1') != '0'
+TAREFAS_DIR = os.environ.get('MONITOR_TAREFAS_DIR', os.path.join(os.path.dirname(__file__), '.tarefas'))
+# Resultados lidos ficam disponíveis por este tempo (outras abas/mesmos filtros)
+EXPIRA_S = float(os.environ.get('MONITOR_TAREFAS_EXPIRA_S', '600'))
+
+try:
+    import diskcache
+    from dash import DiskcacheManager
+except ImportError:
+    diskcache = None
+    DiskcacheManager = object
+
+def _versao_dados() -> tuple:
+    """
+    Versão do banco igual em todos os workers: toda escrita relevante gera
+    registro em log_alteracoes. (data_version() inclui o contador local e o
+    stat do -wal, que muda quando o último leitor fecha a conexão.)
+    """
+    import database
+    with database._connect() as conn:
+        log_id, = conn.execute("SELECT MAX(id) FROM log_alteracoes").fetchone()
+    return database._db_path(), log_id
+
+class GerenciadorTarefas(DiskcacheManager):
+    """
+    DiskcacheManager com deduplicação: pedidos com a mesma chave (callback +
+    argumentos + versão do banco) enquanto o job roda se inscrevem no mesmo
+    processo em vez de disparar outro. O cancelamento só encerra o processo
+    quando o último inscrito desiste.
+    """
+
+    def call_job_fn(self, key, job_fn, args, context):
+        if self.result_ready(key):
+            return None  # mesmo pedido já calculado nesta versão do banco: sem processo novo
+        with self.handle.transact():
+            pid = self.handle.get(f'{key}-job')
+            if pid and self.job_running(pid):
+                self.handle.incr(f'job-{pid}-inscritos', default=1)
+                logging.info(f"[TAREFA] reaproveitando job {pid}")
+                return pid
+            pid = super().call_job_fn(key, job_fn, args, context)
+            self.handle.set(f'{key}-job', pid, expire=EXPIRA_S)
+            self.handle.set(f'job-{pid}-inscritos', 1, expire=EXPIRA_S)
+        return pid
+
+    def job_running(self, job):
+        return bool(job) and super().job_running(job)
+
+    def terminate_job(self, job):
+        if not job:
+            return
+        with self.handle.transact():
+            restantes = self.handle.decr(f'job-{int(job)}-inscritos', default=1)
+            if restantes > 0:
+                return
+            self.handle.delete(f'job-{int(job)}-inscritos')
+        super().terminate_job(job)
+
+    def get_progress(self, key):
+        # Não consome o progresso: todas as abas inscritas veem o último valor
+        return self.handle.get(self._make_progress_key(key))
+
+_GERENCIADOR: Optional[GerenciadorTarefas] = None
+
+def gerenciador() -> Optional[GerenciadorTarefas]:
+    """Gerenciador único do processo; None quando o modo background não está disponível."""
+    global _GERENCIADOR
+    if not BACKGROUND_ATIVO or diskcache is None:
+        return None
+    if _GERENCIADOR is None:
+        try:
+            _GERENCIADOR = GerenciadorTarefas(diskcache.Cache(TAREFAS_DIR),
+                                              cache_by=[_versao_dados], expire=EXPIRA_S)
+        except ImportError as e:
+            logging.warning(f"[TAREFA] background indisponível ({e}); callbacks síncronos")
+            return None
+        logging.info(f"[TAREFA] callbacks em background ({TAREFAS_DIR})")
+    return _GERENCIADOR
+
+def callback_longo(app, *deps, progress=None, progress_default=None, running=None, cancel=None, **kwargs):
+    """
+    app.callback em modo background quando disponível. No modo síncrono,
+    'cancel' é ignorado e, se houver 'progress', a função recebe um
+    set_progress sem efeito como primeiro argumento (mesma assinatura).
+    """
+    mgr = gerenciador()
+
+    def deco(fn):
+        if mgr is not None:
+            opts = dict(background=True, manager=mgr)
+            if progress is not None:
+                opts.update(progress=progress, progress_default=progress_default)
+            if cancel is not None:
+                opts['cancel'] = cancel
+            if running is not None:
+                opts['running'] = running
+            return app.callback(*deps, **opts, **kwargs)(fn)
+
+        alvo = fn
+        if progress is not None:
+            def alvo(*args):
+                return fn(lambda _valor: None, *args)
+            alvo.__name__ = fn.__name__
+        opts = {'running': running} if running is not None else {}
+        return app.callback(*deps, **opts, **kwargs)(alvo)
+    return deco
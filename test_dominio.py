@@ -0,0 +1,44 @@
+# test_dominio.py
+#
+# Caminho de importação em lote: PernaAberta -> array estruturado (para_numpy)
+# -> registros (de_numpy) -> database.importar_pernas.
+# Uso:
+#   python -m pytest -q test_dominio.py
+
+import os
+
+import pytest
+
+os.environ.setdefault('MONITOR_JOBS', '0')
+os.environ.setdefault('MONITOR_SNAPSHOT', '0')
+
+import database
+from dominio import PernaAberta, de_numpy, para_numpy
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'teste.db'))
+    database.init_database()
+
+def test_importar_pernas_pelo_array_estruturado(banco):
+    pernas = [
+        PernaAberta.nova('PETRA400', 'Call', 'Compra', 40.0, 300, 0.285, '16/01/2026', '02/01/2026'),
+        PernaAberta.nova('PETRA420', 'Call', 'Venda', 42.0, 300, 0.1, '16/01/2026', '02/01/2026', 'trava'),
+        PernaAberta.nova('VALEM600', 'Put', 'Venda', None, 100, 1.2345, '20/02/2026', '05/01/2026'),
+    ]
+    arr = para_numpy(pernas, PernaAberta)
+    assert arr['valor_opcao_e4'].tolist() == [2850, 1000, 12345]
+    assert de_numpy(arr, PernaAberta) == pernas
+
+    ids = database.importar_pernas(arr)
+    assert len(ids) == 3 and ids == sorted(ids)
+    with database._connect() as conn:
+        linhas = conn.execute(
+            """SELECT id, ticker, quantidade, strike, valor_opcao_e4, valor_operacao_cent,
+                      valor_opcao, valor_operacao
+               FROM transacoes ORDER BY id""").fetchall()
+    assert linhas == [
+        (ids[0], 'PETRA400', 300, 40.0, 2850, -8550, 0.285, -85.5),
+        (ids[1], 'PETRA420', -300, 42.0, 1000, 3000, 0.1, 30.0),
+        (ids[2], 'VALEM600', -100, None, 12345, 12345, 1.2345, 123.45),
+    ]
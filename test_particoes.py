@@ -0,0 +1,68 @@
+# test_particoes.py
+#
+# Partições arquivadas antes de uma migração de main (ex.: colunas de ponto
+# fixo de dinheiro.py): o replay que lê enc_todas/log_todos e a migração do
+# init_database precisam aceitá-las.
+# Uso:
+#   python -m pytest -q test_particoes.py
+
+import os
+import sqlite3
+
+import pytest
+
+os.environ.setdefault('MONITOR_JOBS', '0')
+os.environ.setdefault('MONITOR_SNAPSHOT', '0')
+
+import arquivo
+import database
+import gerar_dados
+import historico
+
+_CORTE = '2024-01-01'
+_DATA = '2023-06-30'
+_SEM_PONTO_FIXO = ('valor_opcao_e4', 'valor_operacao_cent', 'valor_encerr_e4',
+                   'valor_oper_encerr_cent', 'g_p_cent')
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Banco sintético com as encerradas de antes de _CORTE numa partição sem as colunas inteiras."""
+    caminho = str(tmp_path / 'teste.db')
+    monkeypatch.setattr(database, 'DB_PATH', caminho)
+    monkeypatch.setattr(database, '_PARTICOES_MIGRADAS', set())
+    gerar_dados.gerar(caminho, 300)
+    esperado = historico.posicoes_em(_DATA)
+    arquivo.arquivar(_CORTE)
+    particoes = sorted(os.listdir(tmp_path / 'arquivo'))
+    assert particoes
+    for nome in particoes:
+        with sqlite3.connect(tmp_path / 'arquivo' / nome) as conn:
+            for col in _SEM_PONTO_FIXO:  # como gravada antes da migração
+                conn.execute(f"ALTER TABLE encerradas DROP COLUMN {col}")
+    with database._connect() as conn:
+        conn.execute("DELETE FROM checkpoint_posicoes")
+        conn.execute("DELETE FROM checkpoints")
+    database._PARTICOES_MIGRADAS.clear()
+    return tmp_path, esperado
+
+def _comparar(atual, esperado):
+    cols = ['id', 'TICKER', 'QUANTIDADE', 'DATA OP']
+    assert atual[cols].sort_values('id').reset_index(drop=True).equals(
+        esperado[cols].sort_values('id').reset_index(drop=True))
+
+def test_replay_com_particao_sem_colunas_novas(banco, monkeypatch):
+    _, esperado = banco
+    monkeypatch.setattr(database, '_migrar_particoes', lambda conn: None)
+    _comparar(historico.posicoes_em(_DATA), esperado)
+
+def test_init_database_migra_particoes_antigas(banco):
+    tmp_path, esperado = banco
+    database.init_database()
+    for nome in os.listdir(tmp_path / 'arquivo'):
+        with sqlite3.connect(tmp_path / 'arquivo' / nome) as conn:
+            cols = [r[1] for r in conn.execute("PRAGMA table_info(encerradas)")]
+            assert set(_SEM_PONTO_FIXO) <= set(cols)
+            sem_valor = conn.execute("SELECT COUNT(*) FROM encerradas WHERE g_p IS NOT NULL AND "
+                                     "g_p_cent IS NOT CAST(ROUND(g_p * 100) AS INTEGER)").fetchone()[0]
+            assert sem_valor == 0
+    _comparar(historico.posicoes_em(_DATA), esperado)
@@ -252,3 +252,27 @@ def validate_all_fields(ticker, direcao, qtd, valor, data_op, data_exerc, estrut
         get_validation_tick(validate_date(data_exerc)),
         get_validation_tick(bool(estrutura))
     ]
+
+_MESES_SERIE = {s: i % 12 + 1 for i, s in enumerate('ABCDEFGHIJKLMNOPQRSTUVWX')}
+
+def _sexta(ano, mes, semana):
+    d = dt.date(ano, mes, 1)
+    while d.weekday() != 4:
+        d += dt.timedelta(days=1)
+    return d + dt.timedelta(days=(int(semana) - 1) * 7)
+
+def extrair_info_ticker(ticker, hoje=None):
+    """Regra do extractInfo (clientside.js) no servidor: retorna (operacao, data_exerc 'DD/MM/YYYY') ou False."""
+    valido = validate_ticker(ticker)
+    if not valido:
+        return False
+    base, semana = valido
+    serie = base[4]
+    mes = _MESES_SERIE[serie]
+    operacao = 'Put' if serie in 'MNOPQRSTUVWX' else 'Call'
+    hoje = hoje or dt.date.today()
+    ano = hoje.year + 1 if mes < hoje.month else hoje.year
+    data = _sexta(ano, mes, semana)
+    if data < hoje and mes == hoje.month:
+        data = _sexta(ano + 1, mes, semana)
+    return operacao, data.strftime('%d/%m/%Y')
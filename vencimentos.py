@@ -0,0 +1,178 @@
+# vencimentos.py
+#
+# Liquidação automática de pernas vencidas: pernas com data_exerc anterior a
+# hoje saem de transacoes como encerradas pelo valor intrínseco, calculado com
+# o fechamento do ativo-objeto (tabela fechamentos) no dia do vencimento.
+# Intrínseco > 0 -> motivo 'exercicio'; senão 'vencimento' (virou pó).
+# Pernas sem strike ou sem fechamento próximo do vencimento ficam abertas
+# (aparecem no log) até o fechamento ser registrado.
+# Uso:
+#   python vencimentos.py [--conta principal] [--ate 2025-06-30]
+#   python vencimentos.py --fechamento PETR 2025-06-20 31.45 [--ativo PETR4]
+
+import os
+import logging
+import argparse
+import datetime as dt
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from database import (_connect, _iso_sql, _bump_data_version, _somar_cadeias, init_database,
+                      listar_contas, na_conta)
+from dinheiro import CENTAVOS, PREMIO
+from historico import _to_iso
+from snapshot import atualizar as atualizar_snapshot
+import jobs
+from metrics import medir
+
+logging.basicConfig(level=logging.INFO)
+
+# Fechamento aceito para liquidar: até N dias antes do vencimento (feriados, falta de pregão)
+TOLERANCIA_DIAS = int(os.environ.get('MONITOR_VENCIMENTO_TOLERANCIA_DIAS', '5'))
+INTERVALO_S = float(os.environ.get('MONITOR_VENCIMENTO_INTERVALO_S', '3600'))
+
+_EXERC = _iso_sql('t.data_exerc')
+
+@medir('db')
+def registrar_fechamentos(precos: Iterable[Tuple[str, str, float]], ativo: Optional[str] = None) -> int:
+    """Grava (raiz, data, preço) na conta ativa; data em 'YYYY-MM-DD' ou 'DD/MM/YYYY'."""
+    linhas = [(str(raiz).upper()[:4], _to_iso(data), float(preco), ativo) for raiz, data, preco in precos]
+    init_database()
+    with _connect() as conn:
+        conn.executemany("INSERT OR REPLACE INTO fechamentos (raiz, data, preco, ativo) VALUES (?,?,?,?)", linhas)
+    _bump_data_version()
+    return len(linhas)
+
+def _vencidas(c, ate: str) -> pd.DataFrame:
+    """Pernas com vencimento < ate (idx_tx_exerc_iso) e o fechamento do ativo no vencimento (PK de fechamentos)."""
+    c.execute(f"""SELECT t.id, t.ticker, t.operacao, t.direcao, t.strike, t.quantidade, t.valor_opcao,
+                         COALESCE(t.valor_opcao_e4, CAST(ROUND(t.valor_opcao * {PREMIO}) AS INTEGER)) AS premio_e4,
+                         t.data_op, t.data_exerc, t.estrutura, t.rolagem, t.estrutura_bundle,
+                         (SELECT f.preco FROM fechamentos f
+                          WHERE f.raiz = substr(t.ticker, 1, 4)
+                            AND f.data <= {_EXERC} AND f.data >= date({_EXERC}, ?)
+                          ORDER BY f.data DESC LIMIT 1) AS spot
+                  FROM transacoes t
+                  WHERE {_EXERC} < ?""", (f'-{TOLERANCIA_DIAS} days', ate))
+    colunas = [d[0] for d in c.description]
+    return pd.DataFrame(c.fetchall(), columns=colunas)
+
+def _fluxo(premio_e4: np.ndarray, qtd: np.ndarray, sinal: np.ndarray) -> np.ndarray:
+    # dinheiro.fluxo vetorizado (int64): centavos, meio centavo para longe do zero
+    return sinal * ((np.abs(premio_e4) * qtd + CENTAVOS // 2) // CENTAVOS)
+
+def _encerradas(df: pd.DataFrame) -> pd.DataFrame:
+    """Mesmas contas de close_operation (encerramento total), vetorizadas em int64."""
+    spot = df['spot'].astype(float).to_numpy()
+    strike = df['strike'].astype(float).to_numpy()
+    call = (df['operacao'] == 'Call').to_numpy()
+    intrinseco = np.where(call, np.maximum(spot - strike, 0.0), np.maximum(strike - spot, 0.0))
+    premio_encerr = np.rint(intrinseco * PREMIO).astype(np.int64)
+    premio_abert = df['premio_e4'].astype(np.int64).abs().to_numpy()
+    qtd = df['quantidade'].astype(np.int64).abs().to_numpy()
+    compra = (df['direcao'] == 'Compra').to_numpy()
+    sinal_abertura = np.where(compra, -1, 1).astype(np.int64)
+    out = df.assign(
+        qtd=qtd,
+        premio_abert=premio_abert,
+        premio_encerr=premio_encerr,
+        cash_abert=_fluxo(premio_abert, qtd, sinal_abertura),
+        cash_encerr=_fluxo(premio_encerr, qtd, -sinal_abertura),
+        motivo=np.where(premio_encerr > 0, 'exercicio', 'vencimento'),
+    )
+    out['g_p_cent'] = out['cash_abert'] + out['cash_encerr']
+    return out
+
+@medir('db')
+def liquidar_vencidas(ate=None) -> dict:
+    """
+    Encerra numa única transação (BEGIN IMMEDIATE: workers concorrentes não
+    liquidam a mesma perna duas vezes) as pernas da conta ativa com vencimento
+    anterior a 'ate' (padrão: hoje), na data do vencimento.
+    Retorna {'liquidadas': n, 'exercidas': n, 'pendentes': n, 'g_p': total}.
+    """
+    alvo = _to_iso(ate or dt.date.today())
+    init_database()
+    conn = _connect()
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            df = _vencidas(c, alvo)
+            ok = df['spot'].notna() & df['strike'].notna() & df['premio_e4'].notna()
+            enc = _encerradas(df[ok])
+            if not enc.empty:
+                c.executemany(
+                    """INSERT INTO encerradas
+                       (id_origem, ticker, operacao, direcao, strike, quantidade,
+                        valor_opcao, valor_operacao, data_op, data_exerc, estrutura, rolagem,
+                        data_encerr, valor_encerr, valor_oper_encerr, g_p, perdas_invest, motivo,
+                        estrutura_bundle, valor_opcao_e4, valor_operacao_cent, valor_encerr_e4,
+                        valor_oper_encerr_cent, g_p_cent)
+                       VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+                    zip(enc['id'].tolist(), enc['ticker'], enc['operacao'], enc['direcao'],
+                        enc['strike'].tolist(), enc['qtd'].tolist(), (enc['premio_abert'] / PREMIO).tolist(),
+                        (enc['cash_abert'] / CENTAVOS).tolist(), enc['data_op'], enc['data_exerc'],
+                        enc['estrutura'], enc['rolagem'], enc['data_exerc'], (enc['premio_encerr'] / PREMIO).tolist(),
+                        (enc['cash_encerr'] / CENTAVOS).tolist(), (enc['g_p_cent'] / CENTAVOS).tolist(),
+                        [None] * len(enc), enc['motivo'], enc['estrutura_bundle'],
+                        enc['premio_abert'].tolist(), enc['cash_abert'].tolist(), enc['premio_encerr'].tolist(),
+                        enc['cash_encerr'].tolist(), enc['g_p_cent'].tolist())
+                )
+                c.executemany(
+                    """INSERT INTO log_alteracoes
+                       (transacao_id, campo_alterado, valor_antigo, valor_novo, tipo_alteracao, data_alteracao)
+                       VALUES (?,?,?,?,?,?)""",
+                    [(tid, 'status', 'aberta', f'encerrada_total({q})', 'ENCERRAMENTO', d)
+                     for tid, q, d in zip(enc['id'].tolist(), enc['qtd'].tolist(), enc['data_exerc'])]
+                )
+                c.executemany("DELETE FROM transacoes WHERE id=?", [(tid,) for tid in enc['id'].tolist()])
+                _somar_cadeias(c, list(zip(enc['id'].tolist(), enc['g_p_cent'].tolist())))
+                # checkpoints a partir do vencimento mais antigo ficam obsoletos
+                primeiro = min(_to_iso(d) for d in enc['data_exerc'])
+                c.execute("DELETE FROM checkpoints WHERE data_ref >= ?", (primeiro,))
+                c.execute("DELETE FROM checkpoint_posicoes WHERE data_ref >= ?", (primeiro,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+
+    res = {'liquidadas': int(enc.shape[0]), 'exercidas': int((enc['motivo'] == 'exercicio').sum()),
+           'pendentes': int((~ok).sum()), 'g_p': int(enc['g_p_cent'].sum()) / CENTAVOS}
+    if res['liquidadas']:
+        _bump_data_version()
+        atualizar_snapshot()  # delta no snapshot dos relatórios
+    if res['liquidadas'] or res['pendentes']:
+        logging.info(f"[VENC] até {alvo}: {res['liquidadas']} liquidadas ({res['exercidas']} exercidas), "
+                     f"{res['pendentes']} sem fechamento/strike, g_p={res['g_p']:.2f}")
+    return res
+
+def liquidar_contas() -> None:
+    for conta in listar_contas():
+        with na_conta(conta):
+            liquidar_vencidas()
+
+def iniciar_job_vencimentos(intervalo_s: Optional[float] = None) -> bool:
+    """Liquidação no startup e a cada intervalo_s (todas as contas)."""
+    return jobs.agendar('vencimentos', liquidar_contas, intervalo_s or INTERVALO_S, atraso_inicial_s=10.0)
+
+def main():
+    ap = argparse.ArgumentParser(description="Liquida pernas vencidas pelo valor intrínseco")
+    ap.add_argument('--conta', default=None)
+    ap.add_argument('--ate', default=None, help="liquida vencimentos anteriores a esta data (padrão: hoje)")
+    ap.add_argument('--fechamento', nargs=3, metavar=('RAIZ', 'DATA', 'PRECO'),
+                    help="registra um fechamento do ativo-objeto antes de liquidar")
+    ap.add_argument('--ativo', default=None, help="código do ativo do fechamento (ex.: PETR4)")
+    args = ap.parse_args()
+    with na_conta(args.conta or listar_contas()[0]):
+        if args.fechamento:
+            raiz, data, preco = args.fechamento
+            registrar_fechamentos([(raiz, data, float(preco))], ativo=args.ativo)
+        print(liquidar_vencidas(args.ate))
+
+if __name__ == '__main__':
+    main()